@@ -3,5 +3,13 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ad_printing.settings')
 
-application = get_asgi_application()
+django_asgi_app = get_asgi_application()
 
+from channels.routing import ProtocolTypeRouter, URLRouter
+from apps.production.routing import websocket_urlpatterns
+from apps.production.ws_auth import TokenAuthMiddlewareStack
+
+application = ProtocolTypeRouter({
+    'http': django_asgi_app,
+    'websocket': TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns)),
+})
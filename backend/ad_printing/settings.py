@@ -157,6 +157,24 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
 }
 
+# Cache
+# nesting：排版结果缓存。LocMemCache 读取时会把条目移到队尾，CULL_FREQUENCY 等于 MAX_ENTRIES 时每次只淘汰最久未用的一条，即有界 LRU
+NESTING_CACHE_MAX_ENTRIES = config('NESTING_CACHE_MAX_ENTRIES', default=256, cast=int)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'nesting': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'nesting',
+        'TIMEOUT': config('NESTING_CACHE_TIMEOUT', default=3600, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': NESTING_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': NESTING_CACHE_MAX_ENTRIES,
+        },
+    },
+}
+
 # Channels
 CHANNEL_LAYERS = {
     'default': {
@@ -173,3 +191,23 @@ CELERY_RESULT_BACKEND = f"redis://{config('REDIS_HOST', default='localhost')}:{c
 
 # Custom User Model
 AUTH_USER_MODEL = 'users.User'
+
+# Nesting
+# 排版优化使用的进程池大小；0 表示不启用进程池，在请求进程内串行计算
+NESTING_POOL_WORKERS = config('NESTING_POOL_WORKERS', default=os.cpu_count() or 1, cast=int)
+# byCategory 单次请求最多同时计算的类目数
+NESTING_MAX_PARALLELISM = config('NESTING_MAX_PARALLELISM', default=4, cast=int)
+# 优化模式单次请求允许的最长时间预算（毫秒）
+NESTING_MAX_TIME_BUDGET_MS = config('NESTING_MAX_TIME_BUDGET_MS', default=30000, cast=int)
+# 异步排版任务执行方式：celery 投递到 worker；inline 在当前进程内同步执行（测试 / 无 Redis 的开发环境）
+NESTING_JOB_EXECUTOR = config('NESTING_JOB_EXECUTOR', default='celery')
+# 订单合版：按产品分类选用的整板尺寸（mm），未列出的分类用 default
+NESTING_GANG_SHEETS = {
+    'default': {'width': 1600, 'height': 3000},
+    'kt_board': {'width': 1220, 'height': 2440},
+    'pvc_board': {'width': 1220, 'height': 2440},
+}
+NESTING_GANG_GAP = config('NESTING_GANG_GAP', default=5.0, cast=float)
+NESTING_GANG_MARGIN = config('NESTING_GANG_MARGIN', default=10.0, cast=float)
+# 切割机刀头空走速度（mm/s），用于估算切割顺序优化节省的时间
+NESTING_CUT_TRAVEL_SPEED = config('NESTING_CUT_TRAVEL_SPEED', default=400.0, cast=float)
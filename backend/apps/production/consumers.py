@@ -0,0 +1,28 @@
+from channels.generic.websocket import JsonWebsocketConsumer
+from asgiref.sync import async_to_sync
+
+from .models import NestingJob
+from .tasks import job_group
+
+
+class NestingJobConsumer(JsonWebsocketConsumer):
+    """订阅单个排版任务的进度推送：ws/nesting/jobs/<id>/"""
+
+    def connect(self):
+        user = self.scope.get('user')
+        job_id = self.scope['url_route']['kwargs']['job_id']
+        if not user or not user.is_authenticated or not NestingJob.objects.filter(pk=job_id, user=user).exists():
+            self.close()
+            return
+        self.group = job_group(job_id)
+        async_to_sync(self.channel_layer.group_add)(self.group, self.channel_name)
+        self.accept()
+        job = NestingJob.objects.get(pk=job_id)
+        self.send_json({'status': job.status, 'progress': job.progress})
+
+    def disconnect(self, code):
+        if getattr(self, 'group', None):
+            async_to_sync(self.channel_layer.group_discard)(self.group, self.channel_name)
+
+    def nesting_progress(self, event):
+        self.send_json({k: v for k, v in event.items() if k != 'type'})
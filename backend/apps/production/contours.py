@@ -0,0 +1,195 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# 前景掩码的轮廓提取：在掩码上做 marching squares 得到闭合折线（外轮廓与孔洞），
+# 再按 Douglas–Peucker 以给定容差简化。坐标以掩码格点为单位，像素中心为整数坐标，y 向下。
+# 全部折线拼在一个数组里按批处理，耗时与折线条数基本无关（噪点多的图也不会退化成逐条循环）。
+
+# 格子四角按顺时针编号 左上(8) 右上(4) 右下(2) 左下(1)；边 k 连接角 k 与角 k+1：0 上、1 右、2 下、3 左。
+# 沿顺时针方向从前景离开的边为出边、进入前景的边为入边，每条出边连到逆时针方向上一条入边，
+# 于是前景始终在行进方向右侧（外轮廓顺时针、孔洞逆时针），且每条交叉边恰好是相邻两个格子中
+# 一个的起点、另一个的终点。鞍点（对角两个前景角）按断开处理，即前景按 4 连通。
+def _segment_table() -> np.ndarray:
+    table = np.full((16, 2, 2), -1, dtype=np.int8)
+    for case in range(16):
+        fg = [bool(case & 8), bool(case & 4), bool(case & 2), bool(case & 1)]
+        entries = [k for k in range(4) if not fg[k] and fg[(k + 1) % 4]]
+        for slot, k in enumerate(entries):
+            exit_ = next(e for e in range(k + 1, k + 5) if fg[e % 4] and not fg[(e + 1) % 4]) % 4
+            table[case, slot] = (exit_, k)
+    return table
+
+
+_SEGMENTS = _segment_table()
+
+
+def _doubling_rounds(n: int) -> int:
+    return max(1, int(n).bit_length())
+
+
+def trace(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """marching squares：返回 (pts, starts)。pts 为全部闭合折线首尾相接的 (n, 2) 顶点（x, y），
+    第 k 条折线为 pts[starts[k]:starts[k + 1]]（首尾不重复）。
+
+    顶点取在前景与背景像素中心连线的中点；外轮廓面积为正（y 向下时的顺时针），孔洞为负。
+    """
+    p = np.pad(mask.astype(np.uint8), 1)
+    hp, wp = p.shape
+    case = 8 * p[:-1, :-1] + 4 * p[:-1, 1:] + 2 * p[1:, 1:] + p[1:, :-1]
+    cells = np.flatnonzero((case != 0) & (case != 15))
+    if not len(cells):
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64)
+    ci, cj = np.divmod(cells, wp - 1)
+    kind = case.ravel()[cells]
+    # 交叉边的全局编号：水平边 (i, j)-(i, j+1) 在前，竖直边 (i, j)-(i+1, j) 在后
+    nh = hp * (wp - 1)
+    edge = np.stack([ci * (wp - 1) + cj, nh + ci * wp + cj + 1, (ci + 1) * (wp - 1) + cj, nh + ci * wp + cj])
+    src, dst = [], []
+    for slot in range(2):
+        seg = _SEGMENTS[kind, slot]
+        has = seg[:, 0] >= 0
+        cols = np.flatnonzero(has)
+        src.append(edge[seg[has, 0], cols])
+        dst.append(edge[seg[has, 1], cols])
+    src = np.concatenate(src)
+    dst = np.concatenate(dst)
+    order = np.argsort(src)
+    src = src[order]
+    nxt = np.searchsorted(src, dst[order])
+    m = len(src)
+
+    # 指针倍增：每个环以最小顶点号为标号与起点；在起点前断开后求各点到链尾的步数，得到环内顺序
+    rounds = _doubling_rounds(m)
+    label = np.arange(m)
+    jump = nxt.copy()
+    for _ in range(rounds):
+        label = np.minimum(label, label[jump])
+        jump = jump[jump]
+    succ = np.append(nxt, m)  # m 为链尾哨兵
+    roots = np.flatnonzero(label == np.arange(m))
+    prev = np.empty(m, dtype=np.int64)
+    prev[nxt] = np.arange(m)
+    succ[prev[roots]] = m
+    rest = np.append(np.ones(m, dtype=np.int64), 0)
+    rest[prev[roots]] = 0
+    for _ in range(rounds):
+        rest = rest + rest[succ]
+        succ = succ[succ]
+    order = np.lexsort((-rest[:m], label))
+    starts = np.append(np.searchsorted(label[order], roots), m)
+
+    v = src[order]
+    horizontal = v < nh
+    i = np.where(horizontal, v // (wp - 1), (v - nh) // wp)
+    j = np.where(horizontal, v % (wp - 1), (v - nh) % wp)
+    pts = np.empty((m, 2))
+    # 去掉一圈填充后的格点坐标
+    pts[:, 0] = j - 1 + np.where(horizontal, 0.5, 0.0)
+    pts[:, 1] = i - 1 + np.where(horizontal, 0.0, 0.5)
+    return pts, starts
+
+
+def loop_areas(pts: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """各折线的有向面积（鞋带公式）。"""
+    if len(pts) == 0:
+        return np.zeros(0)
+    idx = np.arange(len(pts))
+    nxt = idx + 1
+    ends = starts[1:] - 1
+    nxt[ends] = starts[:-1]
+    cross = pts[:, 0] * pts[nxt, 1] - pts[nxt, 0] * pts[:, 1]
+    return 0.5 * np.add.reduceat(cross, starts[:-1])
+
+
+def _ranges(a: np.ndarray, b: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # 各段 (a, b) 开区间内的下标拼成一个数组，并给出所属段号
+    lens = b - a - 1
+    seg = np.repeat(np.arange(len(a)), lens)
+    base = np.repeat(a + 1 - (np.cumsum(lens) - lens), lens)
+    return seg, base + np.arange(len(seg))
+
+
+def simplify(pts: np.ndarray, starts: np.ndarray, tol: float) -> np.ndarray:
+    """一批闭合折线同时做 Douglas–Peucker，返回保留顶点的布尔掩码。
+
+    每条折线在起点与离起点最远的点处断开成两段，之后逐层对所有待拆分的段一起找离弦最远的点。
+    """
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    first = starts[:-1]
+    last = starts[1:]  # 不含；闭合段的终点用下一条折线的起点位置代表本折线起点
+    # 末尾补上每条折线的起点作为闭合点，下标映射：闭合点放在 n + 折线序号
+    closing = pts[first]
+    ext = np.vstack([pts, closing])
+    seg_no = np.repeat(np.arange(len(first)), last - first)
+    far = ((pts - pts[first][seg_no]) ** 2).sum(axis=1)
+    peak = np.maximum.reduceat(far, first)
+    hit = np.flatnonzero(far == peak[seg_no])
+    k = hit[np.unique(seg_no[hit], return_index=True)[1]]
+    keep[first] = True
+    keep[k] = True
+    # 以扩展下标表示段端点：闭合点 n + 折线序号；区间内部点仍是连续的原下标
+    a = np.concatenate([first, k])
+    b = np.concatenate([k, last])
+    close_end = np.concatenate([np.full(len(first), -1), np.arange(len(first))])
+    while len(a):
+        live = b - a >= 2
+        a, b, close_end = a[live], b[live], close_end[live]
+        if not len(a):
+            break
+        seg, inner = _ranges(a, b)
+        end = np.where(close_end >= 0, n + close_end, b)
+        p0 = ext[a]
+        d = ext[end] - p0
+        norm = np.hypot(d[:, 0], d[:, 1])
+        rel = pts[inner] - p0[seg]
+        dist = np.abs(rel[:, 0] * d[seg, 1] - rel[:, 1] * d[seg, 0])
+        flat = norm[seg] > 0
+        dist[flat] /= norm[seg][flat]
+        dist[~flat] = np.hypot(rel[~flat, 0], rel[~flat, 1])
+        offsets = np.cumsum(b - a - 1) - (b - a - 1)
+        peak = np.maximum.reduceat(dist, offsets)
+        hit = np.flatnonzero(dist == peak[seg])
+        pick = hit[np.unique(seg[hit], return_index=True)[1]]
+        split = peak > tol
+        mid = inner[pick][split]
+        keep[mid] = True
+        a = np.concatenate([a[split], mid])
+        b = np.concatenate([mid, b[split]])
+        close_end = np.concatenate([np.full(len(mid), -1), close_end[split]])
+    return keep
+
+
+def mask_contours(mask: np.ndarray, tol: float, min_area: float = 1.0) -> List[Dict]:
+    """掩码的外轮廓与孔洞，按 tol（格点单位）简化。
+
+    面积小于 min_area 与简化后不足 3 个顶点的折线（孤立噪点）丢弃。
+    返回 [{'hole': bool, 'points': (n, 2) 数组, 'area': 面积绝对值}]，按面积从大到小。
+    """
+    pts, starts = trace(mask)
+    area = loop_areas(pts, starts)
+    big = np.flatnonzero(np.abs(area) >= min_area)
+    if not len(big):
+        return []
+    # 只保留够大的折线再简化
+    lens = starts[1:][big] - starts[:-1][big]
+    idx = np.repeat(starts[:-1][big] - (np.cumsum(lens) - lens), lens) + np.arange(lens.sum())
+    pts = pts[idx]
+    starts = np.append(np.cumsum(lens) - lens, lens.sum())
+    keep = simplify(pts, starts, tol)
+    counts = np.add.reduceat(keep.astype(np.int64), starts[:-1])
+    out = []
+    for n, s, e, a in zip(counts.tolist(), starts[:-1].tolist(), starts[1:].tolist(), area[big].tolist()):
+        if n < 3:
+            continue
+        out.append({'hole': a < 0, 'points': pts[s:e][keep[s:e]], 'area': abs(a)})
+    out.sort(key=lambda c: -c['area'])
+    return out
+
+
+def svg_path(loops: List[List]) -> str:
+    # 所有折线合成一个 path，配合 fill-rule="evenodd" 时孔洞自然挖空
+    return ' '.join('M' + ' L'.join(f'{x},{y}' for x, y in pts) + ' Z' for pts in loops)
@@ -0,0 +1,191 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 每张板的切割顺序：件的外形是闭合轮廓，刀头从入刀点切一圈回到入刀点，
+# 空走距离只取决于件的先后顺序与每件的入刀点；切割方向不影响空走，按调用方要求统一输出。
+DIRECTIONS = ('cw', 'ccw')
+
+
+def _outline(p: Dict) -> np.ndarray:
+    # 有外形多边形（polygon 排版）用多边形顶点，否则用矩形四角；从左上角起顺时针（板坐标 y 向下）
+    poly = p.get('polygon')
+    if poly and len(poly) >= 3:
+        return np.asarray(poly, dtype=np.float64).reshape(-1, 2)
+    x, y, w, h = float(p['x']), float(p['y']), float(p['w']), float(p['h'])
+    return np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype=np.float64)
+
+
+def _clockwise(pts: np.ndarray) -> bool:
+    # y 向下的坐标系中，鞋带公式面积为正即顺时针
+    x, y = pts[:, 0], pts[:, 1]
+    return float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]) + x[-1] * y[0] - x[0] * y[-1]) > 0
+
+
+def _travel(points: np.ndarray, home: np.ndarray, return_home: bool) -> float:
+    path = np.vstack([home, points, home] if return_home else [home, points])
+    return float(np.hypot(*np.diff(path, axis=0).T).sum())
+
+
+def _nearest_neighbour(verts: np.ndarray, owner: np.ndarray, offsets: np.ndarray, home: np.ndarray,
+                       deadline: float) -> Tuple[List[int], List[int], bool]:
+    # 每步从当前位置取最近的未切件顶点；返回件顺序、各件入刀顶点（verts 中的行号）与是否排完。
+    # 到截止时间仍未排到的件按原顺序接在后面、从第一个顶点入刀
+    n = len(offsets)
+    d_all = np.empty(len(verts))
+    open_v = np.ones(len(verts), dtype=bool)
+    done = np.zeros(n, dtype=bool)
+    cur = home
+    order, starts = [], []
+    for _ in range(n):
+        if time.perf_counter() >= deadline:
+            rest = np.flatnonzero(~done)
+            return order + rest.tolist(), starts + offsets[rest].tolist(), False
+        np.hypot(verts[:, 0] - cur[0], verts[:, 1] - cur[1], out=d_all)
+        d_all[~open_v] = np.inf
+        k = int(np.argmin(d_all))
+        part = int(owner[k])
+        order.append(part)
+        starts.append(k)
+        done[part] = True
+        open_v[owner == part] = False
+        cur = verts[k]
+    return order, starts, True
+
+
+def _two_opt(pts: np.ndarray, order: List[int], starts: List[int], deadline: float, return_home: bool) -> bool:
+    """对入刀点序列做 2-opt（pts[0] 为原点，固定不动）。原地修改 order / starts，返回是否有改进。"""
+    n = len(pts) - 1
+    changed = False
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n):
+            # 反转 pts[i..j]：边 (i-1, i)、(j, j+1) 换成 (i-1, j)、(i, j+1)
+            a, b = pts[i - 1], pts[i]
+            c = pts[i:]
+            nxt = pts[i + 1:]
+            if return_home:
+                nxt = np.vstack([nxt, pts[:1]])
+            old = np.hypot(*(c[:len(nxt)] - nxt).T)
+            new = np.hypot(*(c[:len(nxt)] - a).T) + np.hypot(*(nxt - b).T)
+            delta = new - old - math.hypot(*(a - b))
+            if not return_home:
+                # 末件之后没有空走，反转到末尾只换一条边
+                delta = np.append(delta, math.hypot(*(c[-1] - a)) - math.hypot(*(a - b)))
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9 and j > 0:
+                j += i
+                pts[i:j + 1] = pts[i:j + 1][::-1].copy()
+                order[i - 1:j] = order[i - 1:j][::-1]
+                starts[i - 1:j] = starts[i - 1:j][::-1]
+                improved = changed = True
+            if time.perf_counter() >= deadline:
+                break
+    return changed
+
+
+def _refine_starts(verts: np.ndarray, owner_rows: List[np.ndarray], pts: np.ndarray, order: List[int], starts: List[int],
+                   deadline: float, return_home: bool) -> bool:
+    # 顺序不变，逐件改选入刀点使前后两段空走之和最小
+    n = len(order)
+    changed = False
+    for k in range(n):
+        if k % 256 == 0 and time.perf_counter() >= deadline:
+            break
+        rows = owner_rows[order[k]]
+        if len(rows) < 2:
+            continue
+        prev = pts[k]
+        nxt = pts[k + 2] if k + 1 < n else (pts[0] if return_home else None)
+        cand = verts[rows]
+        cost = np.hypot(*(cand - prev).T)
+        if nxt is not None:
+            cost += np.hypot(*(cand - nxt).T)
+        best = int(rows[int(np.argmin(cost))])
+        cur = np.flatnonzero(rows == starts[k])
+        if best != starts[k] and cost[int(np.argmin(cost))] < cost[int(cur[0])] - 1e-9:
+            starts[k] = best
+            pts[k + 1] = verts[best]
+            changed = True
+    return changed
+
+
+def order_sheet(placements: List[Dict], home=(0.0, 0.0), direction: str = 'cw', time_limit_ms: float = 200,
+                return_home: bool = False, deadline: Optional[float] = None) -> Dict:
+    """一张板的切割顺序：最近邻得到初始路线，再在时间上限内交替做 2-opt 与入刀点调整。
+
+    返回按切割先后排列的 path（件 id、入刀点、入刀顶点序号、方向）以及优化前后的空走距离（mm）。
+    优化前按 placements 原顺序、每件从第一个顶点入刀计算。
+    deadline（time.perf_counter() 时刻）给出时取代 time_limit_ms，供整个请求共用一个截止时间；
+    最近邻在截止时间前没排完时，其余件按原顺序排在后面，complete 为 False。
+    """
+    if deadline is None:
+        deadline = time.perf_counter() + time_limit_ms / 1000.0
+    home = np.asarray(home, dtype=np.float64)
+    outlines = [_outline(p) for p in placements]
+    n = len(outlines)
+    if n == 0:
+        return {'path': [], 'travel': 0.0, 'baselineTravel': 0.0, 'saved': 0.0, 'complete': True}
+    sizes = np.array([len(o) for o in outlines])
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    verts = np.vstack(outlines)
+    owner = np.repeat(np.arange(n), sizes)
+    owner_rows = [np.arange(o, o + s) for o, s in zip(offsets.tolist(), sizes.tolist())]
+    baseline = _travel(verts[offsets], home, return_home)
+
+    order, starts, complete = _nearest_neighbour(verts, owner, offsets, home, deadline)
+    pts = np.vstack([home, verts[starts]])
+    while time.perf_counter() < deadline:
+        moved = _two_opt(pts, order, starts, deadline, return_home)
+        if not _refine_starts(verts, owner_rows, pts, order, starts, deadline, return_home) and not moved:
+            break
+    travel = _travel(pts[1:], home, return_home)
+
+    path = []
+    for part, k in zip(order, starts):
+        outline = outlines[part]
+        path.append({
+            'id': placements[part].get('id'),
+            'start': [round(float(verts[k, 0]), 3), round(float(verts[k, 1]), 3)],
+            'startVertex': int(k - offsets[part]),
+            'direction': direction,
+            # 顶点顺序与所需方向相反时，切割时需倒序遍历顶点
+            'reverse': _clockwise(outline) != (direction == 'cw'),
+        })
+    return {'path': path, 'travel': round(travel, 1), 'baselineTravel': round(baseline, 1), 'saved': round(baseline - travel, 1),
+            'complete': complete}
+
+
+def order_cut_paths(out: Dict, home=(0.0, 0.0), direction: str = 'cw', time_limit_ms: float = 200,
+                    return_home: bool = False, travel_speed: Optional[float] = None, deadline: Optional[float] = None) -> Dict:
+    """整份排版逐板计算切割顺序；travel_speed（mm/s）给出时附带节省的空走时间估算（秒）。
+
+    time_limit_ms 是所有板合计的上限（deadline 给出时以它为准）：前面的板用完时间后，
+    后面的板只做到时为止的部分，最近邻都来不及时按原顺序输出。
+    """
+    started = time.perf_counter()
+    if deadline is None:
+        deadline = started + time_limit_ms / 1000.0
+    by_sheet: Dict[int, List[Dict]] = {}
+    for p in out.get('placements') or []:
+        if p.get('placed', True) and p.get('sheet'):
+            by_sheet.setdefault(int(p['sheet']), []).append(p)
+    sheets = []
+    for sheet_no in sorted(by_sheet):
+        res = order_sheet(by_sheet[sheet_no], home, direction, return_home=return_home, deadline=deadline)
+        res['sheet'] = sheet_no
+        if travel_speed:
+            res['savedSeconds'] = round(res['saved'] / travel_speed, 1)
+        sheets.append(res)
+    travel = sum(s['travel'] for s in sheets)
+    baseline = sum(s['baselineTravel'] for s in sheets)
+    summary = {
+        'sheets': sheets, 'travel': round(travel, 1), 'baselineTravel': round(baseline, 1), 'saved': round(baseline - travel, 1),
+        'complete': all(s['complete'] for s in sheets), 'elapsedMs': round((time.perf_counter() - started) * 1000, 1),
+    }
+    if travel_speed:
+        summary['savedSeconds'] = round((baseline - travel) / travel_speed, 1)
+    return summary
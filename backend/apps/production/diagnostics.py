@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# 当前请求的诊断记录；未开启时 phase / count 只是空操作
+_current: ContextVar[Optional['Diagnostics']] = ContextVar('nesting_diagnostics', default=None)
+
+
+class Diagnostics:
+    """一次请求的分阶段耗时（毫秒）与计数。阶段可以嵌套，嵌套阶段名为 "外层.内层"。"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.counters: Dict[str, float] = {}
+        self._stack = []
+
+    def add(self, name: str, ms: float):
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    def count(self, name: str, n: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def as_dict(self) -> Dict:
+        return {
+            'totalMs': round((time.perf_counter() - self.started) * 1000, 3),
+            'phases': {k: round(v, 3) for k, v in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+
+@contextmanager
+def collect():
+    """开启本上下文内的诊断收集，产出 Diagnostics。"""
+    diag = Diagnostics()
+    token = _current.set(diag)
+    try:
+        yield diag
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def phase(name: str):
+    diag = _current.get()
+    if diag is None:
+        yield
+        return
+    full = '.'.join(diag._stack + [name])
+    diag._stack.append(name)
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        diag._stack.pop()
+        diag.add(full, (time.perf_counter() - t0) * 1000)
+
+
+def count(name: str, n: float = 1):
+    diag = _current.get()
+    if diag is not None:
+        diag.count(name, n)
+
+
+class MetricsRegistry:
+    """进程内汇总：按接口累计调用次数、各阶段耗时（总和 / 最大）与计数总和。线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict] = {}
+
+    def record(self, endpoint: str, diag: Diagnostics):
+        snap = diag.as_dict()
+        with self._lock:
+            entry = self._data.setdefault(endpoint, {'calls': 0, 'totalMs': {'sum': 0.0, 'max': 0.0}, 'phases': {}, 'counters': {}})
+            entry['calls'] += 1
+            entry['totalMs']['sum'] += snap['totalMs']
+            entry['totalMs']['max'] = max(entry['totalMs']['max'], snap['totalMs'])
+            for name, ms in snap['phases'].items():
+                agg = entry['phases'].setdefault(name, {'sum': 0.0, 'max': 0.0, 'calls': 0})
+                agg['sum'] += ms
+                agg['max'] = max(agg['max'], ms)
+                agg['calls'] += 1
+            for name, n in snap['counters'].items():
+                entry['counters'][name] = entry['counters'].get(name, 0) + n
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            out = {}
+            for endpoint, entry in self._data.items():
+                calls = entry['calls']
+                out[endpoint] = {
+                    'calls': calls,
+                    'totalMs': {'sum': round(entry['totalMs']['sum'], 3), 'max': round(entry['totalMs']['max'], 3),
+                                'avg': round(entry['totalMs']['sum'] / calls, 3)},
+                    'phases': {name: {'sum': round(a['sum'], 3), 'max': round(a['max'], 3), 'avg': round(a['sum'] / a['calls'], 3)}
+                               for name, a in entry['phases'].items()},
+                    'counters': dict(entry['counters']),
+                }
+            return out
+
+    def reset(self):
+        with self._lock:
+            self._data.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,163 @@
+import logging
+import uuid
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from apps.orders.models import OrderItem
+from apps.products.models import ConfigOption, Product
+from apps.users.models import Merchant
+from .layouts import bulk_save_rows, layout_rows
+from .models import NestingJob, NestingPlacement, NestingSheet, ProductionPlan
+from .views_nesting import RIGID_BOARD_CATEGORIES, pack_one, parse_pack_options
+
+logger = logging.getLogger(__name__)
+
+# 订单配置中的尺寸单位换算到 mm；与下单计价一致，缺省按 cm
+UNIT_TO_MM = {'mm': 1, 'cm': 10, 'm': 1000}
+
+
+def _item_size_mm(cfg) -> Optional[tuple]:
+    try:
+        scale = UNIT_TO_MM.get(str(cfg.get('unit') or 'cm'), 1000)
+        w = float(Decimal(str(cfg.get('width') or 0)) * scale)
+        h = float(Decimal(str(cfg.get('height') or 0)) * scale)
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if w <= 0 or h <= 0:
+        return None
+    return w, h
+
+
+def pending_order_items(merchant):
+    """商户已确认订单中尚未排入生产计划的订单项（一次查询，只取合版需要的列）。"""
+    return (OrderItem.objects
+            .filter(order__merchant=merchant, order__status='confirmed', production_plans__isnull=True)
+            .values_list('id', 'product__category', 'quantity', 'config_data')
+            .order_by('product__category', 'created_at'))
+
+
+def _option_ids(cfg) -> List[int]:
+    # 下单配置 options 形如 {配置 id: 选项 id}
+    opts = cfg.get('options')
+    ids = []
+    for v in (opts.values() if isinstance(opts, dict) else ()):
+        try:
+            ids.append(int(v))
+        except (TypeError, ValueError):
+            continue
+    return ids
+
+
+def material_names(option_ids) -> Dict[int, str]:
+    """下单选项 id -> 材料名（只取配置类型为材料的选项，一次查询）。"""
+    return dict(ConfigOption.objects.filter(pk__in=set(option_ids), config__config_type='material')
+                .values_list('pk', 'name'))
+
+
+def build_gang_plans(merchant, user, algorithm: str = 'maxrects', sheet_sizes: Dict = None,
+                     gap: float = None, margin: float = None, dry_run: bool = False) -> Dict:
+    """把商户待生产的订单项按产品类目与材料合版，每组一个排版任务，每张板一条生产计划（关联板上的订单项）。
+
+    同类目同材料的不同产品排在同一批板上；材料取订单配置中所选的材料选项，未选材料的单独成组。
+    订单项 id 作为排版件 id，件数取订单数量；尺寸缺失或无效的订单项跳过并在 skipped 中列出。
+    排版结果逐板 / 逐件保存（NestingSheet / NestingPlacement，件关联订单项），任务本身不再存整体 result。
+    写库时整个过程在一个事务内进行并锁住商户行，同一商户的并发合版依次执行，
+    后到的一次只会看到尚未排产的订单项，不会重复认领。
+    """
+    if dry_run:
+        return _build_gang_plans(merchant, user, algorithm, sheet_sizes, gap, margin, dry_run)
+    with transaction.atomic():
+        Merchant.objects.select_for_update().filter(pk=merchant.pk).first()
+        return _build_gang_plans(merchant, user, algorithm, sheet_sizes, gap, margin, dry_run)
+
+
+def _build_gang_plans(merchant, user, algorithm, sheet_sizes, gap, margin, dry_run) -> Dict:
+    sheet_sizes = sheet_sizes or settings.NESTING_GANG_SHEETS
+    gap = settings.NESTING_GANG_GAP if gap is None else gap
+    margin = settings.NESTING_GANG_MARGIN if margin is None else margin
+
+    rows = []
+    skipped: List[str] = []
+    for item_id, category, quantity, cfg in pending_order_items(merchant).iterator(chunk_size=2000):
+        cfg = cfg if isinstance(cfg, dict) else {}
+        size = _item_size_mm(cfg)
+        qty = int(quantity or 0)
+        if size is None or qty <= 0:
+            skipped.append(str(item_id))
+            continue
+        rows.append((item_id, category, _option_ids(cfg), size, qty))
+    materials = material_names(i for row in rows for i in row[2])
+    category_names = dict(Product.CATEGORY_CHOICES)
+
+    groups: Dict = defaultdict(list)
+    for item_id, category, option_ids, size, qty in rows:
+        material = next((materials[i] for i in option_ids if i in materials), '')
+        groups[(category, material)].append({'id': str(item_id), 'w': size[0], 'h': size[1], 'qty': qty, 'rotate': True})
+
+    now = timezone.now()
+    stamp = now.strftime('%Y%m%d')
+    jobs: List[NestingJob] = []
+    plans: List[ProductionPlan] = []
+    links: List[tuple] = []
+    sheet_rows: List[NestingSheet] = []
+    placement_rows: List[NestingPlacement] = []
+    summary = []
+    for (category, material), items in groups.items():
+        group_name = ' '.join(n for n in (category_names.get(category, category), material) if n)
+        sheet = sheet_sizes.get(category) or sheet_sizes['default']
+        params = {
+            'sheet': sheet, 'gap': gap, 'margin': margin, 'items': items,
+            'algorithm': 'guillotine' if category in RIGID_BOARD_CATEGORIES else algorithm,
+        }
+        result = pack_one(parse_pack_options(params), sheet, items)
+        job = NestingJob(user=user, status='succeeded', progress=1.0, params=params,
+                         started_at=now, finished_at=timezone.now())
+        jobs.append(job)
+        rows = layout_rows(job, result, {it['id']: it['id'] for it in items})
+        sheet_rows += rows[0]
+        placement_rows += rows[1]
+        # 件 id 为 "{订单项 id}-{序号}"，按板汇总件数与订单项
+        per_sheet: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        used: Dict[int, float] = defaultdict(float)
+        unplaced = 0
+        for p in result['placements']:
+            if not p['placed']:
+                unplaced += 1
+                continue
+            per_sheet[p['sheet']][p['id'].rsplit('-', 1)[0]] += 1
+            used[p['sheet']] += p['w'] * p['h']
+        for s in result['sheets']:
+            counts = per_sheet.get(s['index'])
+            if not counts:
+                continue
+            plan = ProductionPlan(
+                code=f'GS{stamp}-{uuid.uuid4().hex[:10].upper()}',
+                name=f"{group_name} 合版 第{s['index']}/{len(result['sheets'])}张",
+                status='draft', quantity=Decimal(sum(counts.values())), merchant=merchant,
+                nesting_job=job, sheet_index=s['index'],
+                utilization=round(used[s['index']] / (float(s['w']) * float(s['h'])), 4),
+                planned_start=now.date(),
+            )
+            plans.append(plan)
+            links.extend((plan, item_id) for item_id in counts)
+        summary.append({
+            'category': category, 'material': material, 'name': group_name,
+            'items': len(items), 'parts': sum(it['qty'] for it in items), 'sheets': len(result['sheets']),
+            'utilization': result['utilization'], 'unplaced': unplaced,
+        })
+
+    if not dry_run and jobs:
+        Through = ProductionPlan.order_items.through
+        NestingJob.objects.bulk_create(jobs, batch_size=500)
+        bulk_save_rows(sheet_rows, placement_rows)
+        ProductionPlan.objects.bulk_create(plans, batch_size=500)
+        Through.objects.bulk_create(
+            [Through(productionplan_id=plan.pk, orderitem_id=item_id) for plan, item_id in links],
+            batch_size=2000, ignore_conflicts=True)
+        logger.info('gang sheets for merchant %s: %d groups, %d plans', merchant.pk, len(jobs), len(plans))
+    return {'groups': summary, 'plans': len(plans), 'jobs': [str(j.pk) for j in jobs], 'skipped': skipped, 'dryRun': dry_run}
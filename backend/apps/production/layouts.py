@@ -0,0 +1,116 @@
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from apps.orders.models import OrderItem
+from .models import NestingJob, NestingPlacement, NestingSheet
+
+
+def _order_item_map(items) -> Dict[str, str]:
+    """件 id 前缀（请求中的 item id）到订单项 id；只保留库中存在的订单项（一次查询）。"""
+    wanted: Dict[str, str] = {}
+    for it in items or []:
+        ref = it.get('orderItem')
+        if not ref:
+            continue
+        try:
+            wanted[str(it.get('id') or 'item')] = str(uuid.UUID(str(ref)))
+        except ValueError:
+            continue
+    if not wanted:
+        return {}
+    found = {str(pk) for pk in OrderItem.objects.filter(pk__in=set(wanted.values())).values_list('pk', flat=True)}
+    return {item: ref for item, ref in wanted.items() if ref in found}
+
+
+def layout_rows(job: NestingJob, result: Dict, order_items: Dict[str, str] = None,
+                category: str = '') -> Tuple[List[NestingSheet], List[NestingPlacement]]:
+    """把一份排版结果（sheets + placements）转为未保存的板 / 件记录；未放置的件不保存。"""
+    order_items = order_items or {}
+    sheets: Dict[int, NestingSheet] = {}
+    for s in result['sheets']:
+        sheets[int(s['index'])] = NestingSheet(job=job, category=category, index=int(s['index']), width=float(s['w']),
+                                               height=float(s['h']) if s.get('h') is not None else None)
+    used: Dict[int, float] = defaultdict(float)
+    placements = []
+    for p in result['placements']:
+        if not p['placed']:
+            continue
+        sheet = sheets[int(p['sheet'])]
+        used[sheet.index] += p['w'] * p['h']
+        placements.append(NestingPlacement(
+            sheet=sheet, part_id=str(p['id']), order_item_id=order_items.get(str(p['id']).rpartition('-')[0]),
+            x=p['x'], y=p['y'], w=p['w'], h=p['h'], rotated=bool(p['rotated']),
+            rotation=p.get('rotation'), polygon=p.get('polygon'),
+        ))
+    for sheet in sheets.values():
+        area = sheet.width * sheet.height if sheet.height else 0.0
+        sheet.utilization = round(used[sheet.index] / area, 4) if area else 0.0
+    return list(sheets.values()), placements
+
+
+def bulk_save_rows(sheets: List[NestingSheet], placements: List[NestingPlacement]):
+    NestingSheet.objects.bulk_create(sheets, batch_size=500)
+    NestingPlacement.objects.bulk_create(placements, batch_size=2000)
+
+
+def save_layout(job: NestingJob, result: Dict, items=None, by_category: bool = False) -> NestingJob:
+    """在一个事务内保存任务及其全部板与件（bulk_create）。items 中带 orderItem 的件关联到对应订单项。"""
+    order_items = _order_item_map(items)
+    sheets: List[NestingSheet] = []
+    placements: List[NestingPlacement] = []
+    for category, layout in (result.items() if by_category else [('', result)]):
+        s, p = layout_rows(job, layout, order_items, category)
+        sheets += s
+        placements += p
+    job.finished_at = job.finished_at or timezone.now()
+    with transaction.atomic():
+        job.save()
+        bulk_save_rows(sheets, placements)
+    return job
+
+
+def load_layout(job: NestingJob) -> Dict:
+    """读取保存的排版，结构同 /nesting/pack 的返回（byCategory 时按类目分组）。
+
+    板与件各一次查询，与件数无关。
+    """
+    sheets = list(NestingSheet.objects.filter(job=job).order_by('category', 'index')
+                  .values_list('id', 'category', 'index', 'width', 'height', 'utilization'))
+    rows = (NestingPlacement.objects.filter(sheet__job=job).order_by('id')
+            .values_list('sheet_id', 'part_id', 'order_item_id', 'x', 'y', 'w', 'h', 'rotated', 'rotation', 'polygon'))
+    layouts: Dict[str, Dict] = {}
+    sheet_of = {}
+    for pk, category, index, width, height, util in sheets:
+        layout = layouts.setdefault(category, {'sheets': [], 'placements': [], 'orderItems': set()})
+        layout['sheets'].append({'index': index, 'w': width, 'h': height, 'utilization': util})
+        sheet_of[pk] = (layout, index)
+    for sheet_id, part_id, order_item, x, y, w, h, rotated, rotation, polygon in rows.iterator(chunk_size=5000):
+        layout, index = sheet_of[sheet_id]
+        p = {'id': part_id, 'sheet': index, 'x': x, 'y': y, 'w': w, 'h': h, 'rotated': rotated, 'placed': True}
+        if rotation is not None:
+            p['rotation'] = rotation
+        if polygon is not None:
+            p['polygon'] = polygon
+        if order_item is not None:
+            p['orderItem'] = str(order_item)
+            layout['orderItems'].add(str(order_item))
+        layout['placements'].append(p)
+    for layout in layouts.values():
+        area = sum(s['w'] * s['h'] for s in layout['sheets'] if s['h'])
+        used = sum(s['utilization'] * s['w'] * s['h'] for s in layout['sheets'] if s['h'])
+        layout['utilization'] = round(used / area, 4) if area else 0.0
+        layout['orderItems'] = sorted(layout['orderItems'])
+        layout['layoutId'] = str(job.pk)
+    if (job.params or {}).get('byCategory'):
+        return layouts
+    return layouts.get('', {'sheets': [], 'placements': [], 'utilization': 0.0, 'orderItems': [], 'layoutId': str(job.pk)})
+
+
+def layout_job(user, params: Dict) -> NestingJob:
+    # 同步排版保存时使用的任务记录（直接为已完成状态）
+    now = timezone.now()
+    return NestingJob(user=user, status='succeeded', progress=1.0, params=params, started_at=now)
@@ -0,0 +1,55 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.users.models import Merchant, MerchantMembership
+from apps.production.gang_sheets import build_gang_plans
+from apps.production.views_nesting import PACKERS
+
+
+class Command(BaseCommand):
+    help = '订单合版：把商户已确认、未排产的订单项按类目与材料合版，生成排版任务与每张板的生产计划'
+
+    def add_arguments(self, parser):
+        parser.add_argument('merchant', nargs='*', help='商户 slug；与 --all 二选一')
+        parser.add_argument('--all', action='store_true', help='处理全部启用的商户')
+        parser.add_argument('--user', help='排版任务归属的用户名，缺省取商户第一个管理员')
+        parser.add_argument('--algorithm', default='maxrects', choices=[a for a in PACKERS if a != 'polygon'])
+        parser.add_argument('--gap', type=float, help='件间距（mm），缺省 NESTING_GANG_GAP')
+        parser.add_argument('--margin', type=float, help='板边距（mm），缺省 NESTING_GANG_MARGIN')
+        parser.add_argument('--dry-run', action='store_true', help='只计算并输出汇总，不写库')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            merchants = list(Merchant.objects.filter(is_active=True))
+        elif options['merchant']:
+            merchants = list(Merchant.objects.filter(slug__in=options['merchant']))
+            missing = set(options['merchant']) - {m.slug for m in merchants}
+            if missing:
+                raise CommandError(f'商户不存在: {", ".join(sorted(missing))}')
+        else:
+            raise CommandError('需要商户 slug 或 --all')
+
+        fixed_user = None
+        if options['user']:
+            try:
+                fixed_user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f'用户不存在: {options["user"]}')
+
+        report = {}
+        for merchant in merchants:
+            user = fixed_user
+            if user is None:
+                ms = (MerchantMembership.objects.filter(merchant=merchant, role='admin')
+                      .select_related('user').order_by('created_at').first())
+                if ms is None:
+                    self.stderr.write(f'{merchant.slug}: 没有管理员，跳过（可用 --user 指定）')
+                    continue
+                user = ms.user
+            out = build_gang_plans(merchant, user, algorithm=options['algorithm'], gap=options['gap'],
+                                   margin=options['margin'], dry_run=options['dry_run'])
+            report[merchant.slug] = out
+            self.stderr.write(f"{merchant.slug}: {len(out['groups'])} 组, {out['plans']} 个计划, 跳过 {len(out['skipped'])} 项")
+        self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
@@ -0,0 +1,178 @@
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.production.views_nesting import _build_rects, _make_packer
+
+# 数据集：模拟实际订单的三类件，按固定种子生成，同参数每次完全相同
+DATASETS = {
+    # 喷绘横幅：大件、少量重复，1.6m 幅面
+    'banners': {'sheet': (1600.0, 3200.0), 'gap': 10.0, 'margin': 20.0},
+    # 贴纸：小件、整批重复（一款几十到几百张）
+    'stickers': {'sheet': (1270.0, 2000.0), 'gap': 3.0, 'margin': 10.0},
+    # 板材：KT/PVC 常用规格，整板 1220×2440
+    'boards': {'sheet': (1220.0, 2440.0), 'gap': 4.0, 'margin': 5.0},
+}
+BOARD_SIZES = [(600, 900), (400, 600), (300, 450), (900, 1200), (500, 700), (210, 297), (297, 420), (600, 1800)]
+ALGORITHMS = ('shelf', 'maxrects', 'skyline', 'guillotine')
+SIZES = (100, 1000, 10000, 100000)
+
+
+def make_dataset(kind: str, parts: int, seed: int):
+    """生成 kind 类数据集，数量展开后恰好 parts 件。"""
+    rnd = random.Random(f'{kind}:{parts}:{seed}')
+    items = []
+    remaining = parts
+    while remaining > 0:
+        if kind == 'banners':
+            w, h, qty = rnd.randrange(600, 1510, 10), rnd.randrange(400, 3010, 10), rnd.randint(1, 3)
+        elif kind == 'stickers':
+            w, h, qty = rnd.randrange(30, 305, 5), rnd.randrange(30, 305, 5), rnd.randint(20, 200)
+        else:
+            w, h = rnd.choice(BOARD_SIZES)
+            qty = rnd.randint(1, 10)
+        qty = min(qty, remaining)
+        items.append({'id': f'{kind[0]}{len(items)}', 'w': w, 'h': h, 'qty': qty, 'rotate': True})
+        remaining -= qty
+    return items
+
+
+def run_case(dataset: str, parts: int, algorithm: str, seed: int, memory: bool):
+    spec = DATASETS[dataset]
+    sheet_w, sheet_h = spec['sheet']
+    rects = _build_rects(make_dataset(dataset, parts, seed))
+    packer = _make_packer(algorithm, sheet_w, sheet_h)
+    t0 = time.perf_counter()
+    out = packer.pack(rects, gap=spec['gap'], margin=spec['margin'])
+    wall_ms = (time.perf_counter() - t0) * 1000
+    row = {
+        'dataset': dataset, 'parts': parts, 'algorithm': algorithm,
+        'utilization': out['utilization'], 'sheets': len(out['sheets']),
+        'unplaced': sum(1 for p in out['placements'] if not p['placed']),
+        'wallMs': round(wall_ms, 1), 'peakKb': None,
+    }
+    if memory:
+        # tracemalloc 会明显拖慢运行，单独再跑一遍只取内存峰值
+        rects = _build_rects(make_dataset(dataset, parts, seed))
+        packer = _make_packer(algorithm, sheet_w, sheet_h)
+        tracemalloc.start()
+        try:
+            packer.pack(rects, gap=spec['gap'], margin=spec['margin'])
+            row['peakKb'] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        finally:
+            tracemalloc.stop()
+    return row
+
+
+def compare(report, baseline, util_tol: float, time_tol: float, mem_tol: float, min_ms: float):
+    """与基线逐项比较，返回回退说明列表。
+
+    基线中跑过的组合如果这次被跳过（超时外推）或在本次选定范围内缺失，同样算回退；
+    基线中没有的组合以及本次未选定的数据集、算法、件数不比较。
+    """
+    rows = {(r['dataset'], r['parts'], r['algorithm']): r for r in report['results']}
+    meta = report.get('meta', {})
+    scope = [set(meta[k]) if k in meta else None for k in ('datasets', 'sizes', 'algorithms')]
+    failures = []
+    for ref in baseline['results']:
+        key = (ref['dataset'], ref['parts'], ref['algorithm'])
+        if ref.get('skipped') or key in rows or any(s is not None and v not in s for s, v in zip(scope, key)):
+            continue
+        failures.append(f"{'/'.join(map(str, key))}: missing, ran in baseline")
+    base = {(r['dataset'], r['parts'], r['algorithm']): r for r in baseline['results'] if not r.get('skipped')}
+    for row in report['results']:
+        ref = base.get((row['dataset'], row['parts'], row['algorithm']))
+        if ref is None:
+            continue
+        name = f"{row['dataset']}/{row['parts']}/{row['algorithm']}"
+        if row.get('skipped'):
+            failures.append(f"{name}: skipped ({row['skipped']}), ran in baseline")
+            continue
+        if row['utilization'] < ref['utilization'] - util_tol:
+            failures.append(f"{name}: utilization {ref['utilization']} -> {row['utilization']}")
+        if row['sheets'] > ref['sheets'] or row['unplaced'] > ref['unplaced']:
+            failures.append(f"{name}: sheets {ref['sheets']} -> {row['sheets']}, unplaced {ref['unplaced']} -> {row['unplaced']}")
+        # 很短的用例噪声大，低于 min_ms 不判速度
+        if max(row['wallMs'], ref['wallMs']) >= min_ms and row['wallMs'] > ref['wallMs'] * (1 + time_tol):
+            failures.append(f"{name}: wallMs {ref['wallMs']} -> {row['wallMs']}")
+        if row['peakKb'] and ref.get('peakKb') and row['peakKb'] > ref['peakKb'] * (1 + mem_tol):
+            failures.append(f"{name}: peakKb {ref['peakKb']} -> {row['peakKb']}")
+    return failures
+
+
+class Command(BaseCommand):
+    help = '排版算法基准测试：固定种子数据集上记录利用率、张数、耗时与内存峰值，可与基线比较'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', default=','.join(DATASETS), help='逗号分隔：' + ','.join(DATASETS))
+        parser.add_argument('--algorithms', default=','.join(ALGORITHMS), help='逗号分隔：' + ','.join(ALGORITHMS))
+        parser.add_argument('--sizes', default=','.join(str(n) for n in SIZES), help='件数，逗号分隔')
+        parser.add_argument('--seed', type=int, default=20240601)
+        parser.add_argument('--time-limit', type=float, default=120.0,
+                            help='单个用例预计耗时（秒）超过此值时跳过，按上一档件数平方外推')
+        parser.add_argument('--no-memory', action='store_true', help='不测内存峰值（省去一遍 tracemalloc 运行）')
+        parser.add_argument('--output', help='报告写入的 JSON 文件，缺省输出到标准输出')
+        parser.add_argument('--baseline', help='基线报告 JSON；有回退时以非零状态退出')
+        parser.add_argument('--util-tolerance', type=float, default=0.005, help='利用率允许下降的绝对值')
+        parser.add_argument('--time-tolerance', type=float, default=0.5, help='耗时允许增加的比例')
+        parser.add_argument('--memory-tolerance', type=float, default=0.5, help='内存峰值允许增加的比例')
+        parser.add_argument('--min-ms', type=float, default=50.0, help='低于此耗时的用例不做速度比较')
+
+    def handle(self, *args, **options):
+        datasets = [d for d in options['datasets'].split(',') if d]
+        algorithms = [a for a in options['algorithms'].split(',') if a]
+        try:
+            sizes = sorted(int(n) for n in options['sizes'].split(',') if n)
+        except ValueError:
+            raise CommandError('--sizes 需要逗号分隔的整数')
+        unknown = [d for d in datasets if d not in DATASETS] + [a for a in algorithms if a not in ALGORITHMS]
+        if unknown:
+            raise CommandError(f'未知的数据集或算法: {", ".join(unknown)}')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        results = []
+        for dataset in datasets:
+            for algorithm in algorithms:
+                prev = None
+                for parts in sizes:
+                    if prev is not None and prev[1] / 1000 * (parts / prev[0]) ** 2 > options['time_limit']:
+                        results.append({'dataset': dataset, 'parts': parts, 'algorithm': algorithm, 'skipped': 'time-limit'})
+                        self.stderr.write(f'{dataset:<9} {algorithm:<10} {parts:>7}  skipped')
+                        continue
+                    row = run_case(dataset, parts, algorithm, options['seed'], not options['no_memory'])
+                    prev = (parts, row['wallMs'])
+                    results.append(row)
+                    self.stderr.write(f"{dataset:<9} {algorithm:<10} {parts:>7}  util={row['utilization']:.4f} "
+                                      f"sheets={row['sheets']} {row['wallMs']:.0f}ms peak={row['peakKb'] or '-'}KB")
+
+        report = {
+            'meta': {
+                'seed': options['seed'], 'datasets': datasets, 'algorithms': algorithms, 'sizes': sizes,
+                'python': platform.python_version(), 'numpy': np.__version__,
+                'platform': platform.platform(), 'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            },
+            'results': results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(text)
+        else:
+            self.stdout.write(text)
+
+        if baseline is not None:
+            failures = compare(report, baseline, options['util_tolerance'], options['time_tolerance'],
+                               options['memory_tolerance'], options['min_ms'])
+            if failures:
+                for line in failures:
+                    self.stderr.write(line)
+                raise CommandError(f'{len(failures)} 项相对基线回退')
+            self.stderr.write('与基线相比无回退')
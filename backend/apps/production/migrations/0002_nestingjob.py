@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:57
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('production', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NestingJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '计算中'), ('succeeded', '已完成'), ('failed', '失败')], default='pending', max_length=20, verbose_name='状态')),
+                ('progress', models.FloatField(default=0, verbose_name='进度')),
+                ('params', models.JSONField(default=dict, verbose_name='排版参数')),
+                ('result', models.JSONField(blank=True, null=True, verbose_name='排版结果')),
+                ('error', models.TextField(blank=True, verbose_name='错误信息')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='结束时间')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nesting_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': '排版任务',
+                'verbose_name_plural': '排版任务',
+                'db_table': 'nesting_jobs',
+                'indexes': [models.Index(fields=['user'], name='nesting_job_user_id_041051_idx'), models.Index(fields=['status'], name='nesting_job_status_ec8fa9_idx')],
+            },
+        ),
+    ]
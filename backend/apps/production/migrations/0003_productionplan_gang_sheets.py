@@ -0,0 +1,41 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_worktask_worklog'),
+        ('orders', '0004_alter_cartitem_unique_together_cart_merchant'),
+        ('production', '0002_nestingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productionplan',
+            name='merchant',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='production_plans', to='users.merchant'),
+        ),
+        migrations.AddField(
+            model_name='productionplan',
+            name='nesting_job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='plans', to='production.nestingjob'),
+        ),
+        migrations.AddField(
+            model_name='productionplan',
+            name='order_items',
+            field=models.ManyToManyField(blank=True, related_name='production_plans', to='orders.orderitem'),
+        ),
+        migrations.AddField(
+            model_name='productionplan',
+            name='sheet_index',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='板序号'),
+        ),
+        migrations.AddField(
+            model_name='productionplan',
+            name='utilization',
+            field=models.FloatField(blank=True, null=True, verbose_name='利用率'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_alter_cartitem_unique_together_cart_merchant'),
+        ('production', '0003_productionplan_gang_sheets'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NestingSheet',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('category', models.CharField(blank=True, max_length=50, verbose_name='类目')),
+                ('index', models.PositiveIntegerField(verbose_name='板序号')),
+                ('width', models.FloatField(verbose_name='板宽')),
+                ('height', models.FloatField(blank=True, null=True, verbose_name='板高')),
+                ('utilization', models.FloatField(default=0, verbose_name='利用率')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sheets', to='production.nestingjob')),
+            ],
+            options={
+                'verbose_name': '排版板',
+                'verbose_name_plural': '排版板',
+                'db_table': 'nesting_sheets',
+                'unique_together': {('job', 'category', 'index')},
+            },
+        ),
+        migrations.CreateModel(
+            name='NestingPlacement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('part_id', models.CharField(max_length=100, verbose_name='件编号')),
+                ('x', models.FloatField()),
+                ('y', models.FloatField()),
+                ('w', models.FloatField()),
+                ('h', models.FloatField()),
+                ('rotated', models.BooleanField(default=False)),
+                ('rotation', models.FloatField(blank=True, null=True, verbose_name='旋转角度')),
+                ('polygon', models.JSONField(blank=True, null=True, verbose_name='外形')),
+                ('order_item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='nesting_placements', to='orders.orderitem')),
+                ('sheet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='placements', to='production.nestingsheet')),
+            ],
+            options={
+                'verbose_name': '排版件',
+                'verbose_name_plural': '排版件',
+                'db_table': 'nesting_placements',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('production', '0004_nesting_layouts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nestingjob',
+            name='status',
+            field=models.CharField(choices=[('pending', '排队中'), ('running', '计算中'), ('succeeded', '已完成'), ('failed', '失败'), ('cancelled', '已撤销')], default='pending', max_length=20, verbose_name='状态'),
+        ),
+    ]
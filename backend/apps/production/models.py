@@ -1,4 +1,5 @@
 from django.db import models
+from django.conf import settings
 import uuid
 
 
@@ -18,6 +19,12 @@ class ProductionPlan(models.Model):
     planned_start = models.DateField('计划开始', null=True, blank=True)
     planned_end = models.DateField('计划结束', null=True, blank=True)
     quantity = models.DecimalField('计划数量', max_digits=10, decimal_places=2, default=0)
+    # 合版生成的计划：一张板一条计划，关联排版任务、板序号与板上的订单项
+    merchant = models.ForeignKey('users.Merchant', on_delete=models.CASCADE, related_name='production_plans', null=True, blank=True)
+    nesting_job = models.ForeignKey('NestingJob', on_delete=models.SET_NULL, related_name='plans', null=True, blank=True)
+    sheet_index = models.PositiveIntegerField('板序号', null=True, blank=True)
+    utilization = models.FloatField('利用率', null=True, blank=True)
+    order_items = models.ManyToManyField('orders.OrderItem', related_name='production_plans', blank=True)
     created_at = models.DateTimeField('创建时间', auto_now_add=True)
     updated_at = models.DateTimeField('更新时间', auto_now=True)
 
@@ -29,3 +36,79 @@ class ProductionPlan(models.Model):
     def __str__(self):
         return self.code
 
+
+class NestingJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', '排队中'),
+        ('running', '计算中'),
+        ('succeeded', '已完成'),
+        ('failed', '失败'),
+        ('cancelled', '已撤销'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='nesting_jobs')
+    status = models.CharField('状态', max_length=20, choices=STATUS_CHOICES, default='pending')
+    progress = models.FloatField('进度', default=0)
+    params = models.JSONField('排版参数', default=dict)
+    result = models.JSONField('排版结果', null=True, blank=True)
+    error = models.TextField('错误信息', blank=True)
+    started_at = models.DateTimeField('开始时间', null=True, blank=True)
+    finished_at = models.DateTimeField('结束时间', null=True, blank=True)
+    created_at = models.DateTimeField('创建时间', auto_now_add=True)
+    updated_at = models.DateTimeField('更新时间', auto_now=True)
+
+    class Meta:
+        db_table = 'nesting_jobs'
+        verbose_name = '排版任务'
+        verbose_name_plural = '排版任务'
+        indexes = [
+            models.Index(fields=['user']),
+            models.Index(fields=['status']),
+        ]
+
+    def __str__(self):
+        return f"{self.id} ({self.get_status_display()})"
+
+
+class NestingSheet(models.Model):
+    """保存的排版中的一张板；byCategory 排版按类目区分，板序号在同一类目内从 1 开始。"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job = models.ForeignKey(NestingJob, on_delete=models.CASCADE, related_name='sheets')
+    category = models.CharField('类目', max_length=50, blank=True)
+    index = models.PositiveIntegerField('板序号')
+    width = models.FloatField('板宽')
+    # 卷材排版为实际用料长度
+    height = models.FloatField('板高', null=True, blank=True)
+    utilization = models.FloatField('利用率', default=0)
+
+    class Meta:
+        db_table = 'nesting_sheets'
+        verbose_name = '排版板'
+        verbose_name_plural = '排版板'
+        unique_together = ('job', 'category', 'index')
+
+    def __str__(self):
+        return f"{self.job_id} #{self.index}"
+
+
+class NestingPlacement(models.Model):
+    sheet = models.ForeignKey(NestingSheet, on_delete=models.CASCADE, related_name='placements')
+    part_id = models.CharField('件编号', max_length=100)
+    order_item = models.ForeignKey('orders.OrderItem', on_delete=models.SET_NULL, related_name='nesting_placements', null=True, blank=True)
+    x = models.FloatField()
+    y = models.FloatField()
+    w = models.FloatField()
+    h = models.FloatField()
+    rotated = models.BooleanField(default=False)
+    rotation = models.FloatField('旋转角度', null=True, blank=True)
+    polygon = models.JSONField('外形', null=True, blank=True)
+
+    class Meta:
+        db_table = 'nesting_placements'
+        verbose_name = '排版件'
+        verbose_name_plural = '排版件'
+
+    def __str__(self):
+        return self.part_id
@@ -0,0 +1,60 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+
+from django.conf import settings
+
+_pool = None
+_manager = None
+_pool_lock = threading.Lock()
+_in_worker = False
+
+
+def _init_worker():
+    global _in_worker, _pool
+    # 池内子进程不再创建自己的进程池（fork 时继承的引用也要丢掉）
+    _in_worker = True
+    _pool = None
+    # spawn / forkserver 启动的子进程需要先初始化 Django，才能导入 views_nesting 中的排版函数
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ad_printing.settings')
+    import django
+    django.setup()
+
+
+def pool_size() -> int:
+    return int(getattr(settings, 'NESTING_POOL_WORKERS', 0) or 0)
+
+
+def get_pool():
+    """进程级共享的排版进程池；NESTING_POOL_WORKERS 为 0 时返回 None，调用方在本进程内串行执行。"""
+    global _pool
+    size = pool_size()
+    if size <= 0 or _in_worker:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=size, initializer=_init_worker)
+            # fork 方式下首次提交任务时才一次性分叉全部子进程；先提交一个空任务，让子进程在没有任何调用方状态
+            # （如算法竞赛的 Manager 代理，分叉后会被子进程的副本一直引用）时分叉出来
+            _pool.submit(os.getpid)
+        return _pool
+
+
+def reset_pool():
+    # 子进程异常退出后进程池不可再用，丢弃后下次重新创建
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+
+def get_manager():
+    """进程级共享的 multiprocessing.Manager，用于向池内任务传递可跨进程读取的停止标记等共享状态。"""
+    global _manager
+    with _pool_lock:
+        if _manager is None:
+            _manager = Manager()
+        return _manager
@@ -0,0 +1,25 @@
+from rest_framework.renderers import BaseRenderer
+from rest_framework.settings import api_settings
+
+try:
+    import msgpack
+except ImportError:  # msgpack 为可选依赖（channels-redis 已带入）
+    msgpack = None
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Accept: application/msgpack（或 ?format=msgpack）时以 MessagePack 返回，大排版结果比 JSON 小且编码快。"""
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True)
+
+
+# 排版接口的渲染器：默认仍为 JSON，装了 msgpack 时额外支持 MessagePack
+NESTING_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + ([MessagePackRenderer] if msgpack is not None else [])
@@ -0,0 +1,7 @@
+from django.urls import re_path
+
+from .consumers import NestingJobConsumer
+
+websocket_urlpatterns = [
+    re_path(r'^ws/nesting/jobs/(?P<job_id>[0-9a-f-]+)/$', NestingJobConsumer.as_asgi()),
+]
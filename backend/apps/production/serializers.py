@@ -1,9 +1,16 @@
 from rest_framework import serializers
-from .models import ProductionPlan
+from .models import ProductionPlan, NestingJob
 
 
 class ProductionPlanSerializer(serializers.ModelSerializer):
     class Meta:
         model = ProductionPlan
-        fields = ['id', 'code', 'name', 'status', 'planned_start', 'planned_end', 'quantity', 'created_at', 'updated_at']
+        fields = ['id', 'code', 'name', 'status', 'planned_start', 'planned_end', 'quantity',
+                  'merchant', 'nesting_job', 'sheet_index', 'utilization', 'created_at', 'updated_at']
+        read_only_fields = ['nesting_job', 'sheet_index', 'utilization']
 
+
+class NestingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NestingJob
+        fields = ['id', 'status', 'progress', 'error', 'started_at', 'finished_at', 'created_at', 'updated_at']
@@ -0,0 +1,123 @@
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from celery import shared_task
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NestingJob
+
+logger = logging.getLogger(__name__)
+
+
+def job_group(job_id) -> str:
+    return f'nesting-job-{job_id}'
+
+
+def _push(job_id, payload):
+    # 进度推送失败（如 Redis 不可用）不影响任务本身，客户端仍可轮询
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(job_group(job_id), {'type': 'nesting.progress', **payload})
+    except Exception:
+        logger.warning('nesting job %s progress push failed', job_id, exc_info=True)
+
+
+class _ProgressReporter:
+    """把排版进度写回任务记录并推送到 channels；写库按时间/步长节流。"""
+
+    def __init__(self, job_id, min_interval: float = 0.5, min_step: float = 0.05):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.min_step = min_step
+        self.last_time = 0.0
+        self.last_value = 0.0
+
+    def __call__(self, fraction: float):
+        fraction = round(min(max(fraction, 0.0), 1.0), 4)
+        now = time.monotonic()
+        if fraction - self.last_value < self.min_step and now - self.last_time < self.min_interval:
+            return
+        self.last_time, self.last_value = now, fraction
+        NestingJob.objects.filter(pk=self.job_id).update(progress=fraction, updated_at=timezone.now())
+        _push(self.job_id, {'status': 'running', 'progress': fraction})
+
+
+class JobCancelFlag:
+    """任务撤销标志：is_set() 查询任务是否已被置为 cancelled（按时间节流），供排版在批次之间检查。"""
+
+    def __init__(self, job_id, min_interval: float = 0.5):
+        self.job_id = job_id
+        self.min_interval = min_interval
+        self.last_time = None
+        self.cancelled = False
+
+    def is_set(self) -> bool:
+        now = time.monotonic()
+        if not self.cancelled and (self.last_time is None or now - self.last_time >= self.min_interval):
+            self.last_time = now
+            self.cancelled = NestingJob.objects.filter(pk=self.job_id, status='cancelled').exists()
+        return self.cancelled
+
+
+def cancel_nesting_job(job: NestingJob) -> bool:
+    """撤销排队中或计算中的任务；任务已结束返回 False。计算中的任务在下一次检查撤销标志时停止，结果丢弃。"""
+    now = timezone.now()
+    updated = NestingJob.objects.filter(pk=job.pk, status__in=('pending', 'running')).update(
+        status='cancelled', finished_at=now, updated_at=now)
+    if updated:
+        _push(job.pk, {'status': 'cancelled', 'progress': job.progress})
+    return bool(updated)
+
+
+def execute_nesting_job(job_id):
+    from .views_nesting import parse_pack_options, run_pack
+
+    updated = NestingJob.objects.filter(pk=job_id, status='pending').update(status='running', started_at=timezone.now(), progress=0, updated_at=timezone.now())
+    if not updated:
+        return
+    _push(job_id, {'status': 'running', 'progress': 0.0})
+    job = NestingJob.objects.get(pk=job_id)
+    cancel = JobCancelFlag(job_id)
+    try:
+        opts = parse_pack_options(job.params)
+        result = run_pack(job.params, opts, progress=_ProgressReporter(job_id), job=job if opts['save'] else None, cancel=cancel)
+    except Exception as exc:
+        logger.exception('nesting job %s failed', job_id)
+        if NestingJob.objects.filter(pk=job_id, status='running').update(status='failed', error=str(exc), finished_at=timezone.now(), updated_at=timezone.now()):
+            _push(job_id, {'status': 'failed', 'progress': job.progress, 'error': str(exc)})
+        return
+    # 计算期间被撤销的任务保持 cancelled，结果丢弃
+    if NestingJob.objects.filter(pk=job_id, status='running').update(status='succeeded', progress=1.0, result=result, finished_at=timezone.now(), updated_at=timezone.now()):
+        _push(job_id, {'status': 'succeeded', 'progress': 1.0})
+
+
+@shared_task
+def run_nesting_job(job_id):
+    execute_nesting_job(job_id)
+
+
+def submit_nesting_job(job: NestingJob):
+    """按 NESTING_JOB_EXECUTOR 派发任务：celery 在事务提交后投递，inline 直接在当前进程执行。"""
+    if settings.NESTING_JOB_EXECUTOR == 'inline':
+        execute_nesting_job(job.pk)
+        return
+    transaction.on_commit(lambda: run_nesting_job.delay(str(job.pk)))
+
+
+@shared_task
+def run_gang_sheets(merchant_id, user_id, algorithm='maxrects'):
+    """定时或手动触发的订单合版（参数同 manage.py gang_sheets）。"""
+    from django.contrib.auth import get_user_model
+    from apps.users.models import Merchant
+    from .gang_sheets import build_gang_plans
+
+    merchant = Merchant.objects.get(pk=merchant_id)
+    user = get_user_model().objects.get(pk=user_id)
+    out = build_gang_plans(merchant, user, algorithm=algorithm)
+    return {'plans': out['plans'], 'jobs': out['jobs'], 'skipped': len(out['skipped'])}
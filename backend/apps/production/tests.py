@@ -0,0 +1,1014 @@
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import Image, ImageDraw
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from apps.orders.models import Order, OrderItem
+from apps.products.models import ConfigOption, Product, ProductConfig
+from apps.users.models import Merchant
+
+from . import views_nesting
+from .cut_path import order_cut_paths, order_sheet
+from .diagnostics import metrics
+from .gang_sheets import build_gang_plans
+from .layouts import layout_job, load_layout, save_layout
+from .management.commands.nesting_bench import compare, make_dataset
+from .models import NestingJob, ProductionPlan
+from .nesting_pool import get_manager, get_pool
+from .routing import websocket_urlpatterns
+from .tasks import cancel_nesting_job, execute_nesting_job
+from .views_nesting import (ArrayMaxRectsBins, MaxRectsPacker, MultiStartOptimizer, Rect, _Best, _foreground_mask,
+                            _race_contender, from_columnar, pack_cache_key, pack_one, parse_pack_options, run_pack,
+                            to_columnar)
+from .views_nesting_render import TiffWriter
+from .ws_auth import TokenAuthMiddlewareStack
+
+
+IN_MEMORY_CHANNELS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def random_rects(n: int, seed: int = 1, rotate_ratio: float = 1.0):
+    rnd = random.Random(seed)
+    return [Rect(w=rnd.randint(20, 900), h=rnd.randint(20, 1200), id=f'r{i}', rotate=rnd.random() < rotate_ratio)
+            for i in range(n)]
+
+
+def layout_faults(out, sheet_w, sheet_h, gap=0.0, margin=0.0, eps=1e-6):
+    """排版结果中越界与相互重叠（含间距）的件数；None 高度表示卷材。"""
+    faults = 0
+    by_sheet = {}
+    for p in out['placements']:
+        if p['placed']:
+            by_sheet.setdefault(p['sheet'], []).append(p)
+    for parts in by_sheet.values():
+        for i, a in enumerate(parts):
+            if (a['x'] < margin - eps or a['y'] < margin - eps or a['x'] + a['w'] > sheet_w - margin + eps
+                    or (sheet_h is not None and a['y'] + a['h'] > sheet_h - margin + eps)):
+                faults += 1
+            for b in parts[i + 1:]:
+                if (a['x'] < b['x'] + b['w'] + gap - eps and b['x'] < a['x'] + a['w'] + gap - eps
+                        and a['y'] < b['y'] + b['h'] + gap - eps and b['y'] < a['y'] + a['h'] + gap - eps):
+                    faults += 1
+    return faults
+
+
+def sample_items(n: int = 12, seed: int = 1):
+    rnd = random.Random(seed)
+    return [{'id': f'i{k}', 'w': rnd.randint(50, 400), 'h': rnd.randint(50, 600), 'qty': rnd.randint(1, 4)} for k in range(n)]
+
+
+# 排版算法：各算法的几何不变量、MaxRects 数组镜像、列式输出
+
+def stamp_placements(out):
+    """把阵列模式的重复描述展开为逐件 placements，便于复用 layout_faults。"""
+    rows = []
+    for r in out['repeats']:
+        (ox, oy), (px, py), (cols, rows_) = r['origin'], r['pitch'], r['count']
+        for sheet in range(r['sheet'], r['sheet'] + r['sheetCount']):
+            for j in range(rows_):
+                for i in range(cols):
+                    rows.append({'id': r['id'], 'sheet': sheet, 'x': ox + i * px, 'y': oy + j * py,
+                                 'w': r['w'], 'h': r['h'], 'placed': True})
+    return {'placements': rows}
+
+
+def convex_overlap(a, b, eps=1e-6):
+    # 分离轴定理：凸多边形 a、b 的内部是否相交（贴边不算）
+    for poly in (a, b):
+        for (x1, y1), (x2, y2) in zip(poly, poly[1:] + poly[:1]):
+            nx, ny = y2 - y1, x1 - x2
+            norm = (nx * nx + ny * ny) ** 0.5
+            if norm == 0:
+                continue
+            pa = [nx * x + ny * y for x, y in a]
+            pb = [nx * x + ny * y for x, y in b]
+            if max(pa) <= min(pb) + eps * norm or max(pb) <= min(pa) + eps * norm:
+                return False
+    return True
+
+
+class PackerInvariantTests(SimpleTestCase):
+    """各排版器的基本不变量：件不越界、互不重叠（含间距），件数守恒。"""
+
+    SHEET = {'width': 1220, 'height': 2440}
+    GAP, MARGIN = 4.0, 5.0
+
+    def _pack(self, **params):
+        items = params.pop('items', None) or sample_items(20, seed=5)
+        opts = parse_pack_options({'gap': self.GAP, 'margin': self.MARGIN, **params})
+        return items, pack_one(opts, params.get('sheet', self.SHEET), items)
+
+    def _assert_sound(self, items, out, sheet_h=2440):
+        self.assertEqual(len(out['placements']), sum(it['qty'] for it in items))
+        self.assertTrue(all(p['placed'] for p in out['placements']))
+        self.assertEqual(layout_faults(out, 1220, sheet_h, gap=self.GAP, margin=self.MARGIN), 0)
+
+    def test_rectangle_packers(self):
+        for algorithm, extra in [('shelf', {}), ('maxrects', {'heuristic': 'bssf'}), ('maxrects', {'heuristic': 'bl'}),
+                                 ('skyline', {}), ('guillotine', {}), ('guillotine', {'split': 'llas'})]:
+            with self.subTest(algorithm=algorithm, **extra):
+                items, out = self._pack(algorithm=algorithm, **extra)
+                self._assert_sound(items, out)
+
+    def test_roll_mode(self):
+        items, out = self._pack(mode='roll', sheet={'width': 1220})
+        self._assert_sound(items, out, sheet_h=None)
+        bottom = max(p['y'] + p['h'] for p in out['placements'])
+        self.assertGreaterEqual(out['length'], bottom)
+
+    def test_guillotine_cuts_never_cross_parts(self):
+        items, out = self._pack(algorithm='guillotine')
+        self.assertTrue(out['cuts'])
+        eps = 1e-6
+        for cut in out['cuts']:
+            self.assertTrue(cut['parent'] is None or cut['parent'] < cut['id'])
+            lo, hi, pos = cut['from'], cut['to'], cut['pos']
+            for p in out['placements']:
+                if p['sheet'] != cut['sheet']:
+                    continue
+                a, b, c, d = (p['y'], p['h'], p['x'], p['w']) if cut['axis'] == 'y' else (p['x'], p['w'], p['y'], p['h'])
+                self.assertFalse(a + eps < pos < a + b - eps and c < hi - eps and c + d > lo + eps, (cut, p))
+
+    def test_polygon_outlines_inside_and_disjoint(self):
+        rnd = random.Random(1)
+        items = []
+        for k in range(12):
+            w, h = rnd.randint(80, 400), rnd.randint(80, 400)
+            hull = [[0, h], [w / 2, 0], [w, h]] if k % 2 else [[0, 0], [w, 0], [w, h], [0, h * 0.6]]
+            items.append({'id': f't{k}', 'w': w, 'h': h, 'qty': rnd.randint(1, 4), 'hull': hull})
+        _, out = self._pack(algorithm='polygon', items=items)
+        placed = [p for p in out['placements'] if p['placed']]
+        self.assertEqual(len(placed), sum(it['qty'] for it in items))
+        lo, hi_x, hi_y = self.MARGIN - 1e-6, 1220 - self.MARGIN + 1e-6, 2440 - self.MARGIN + 1e-6
+        for i, a in enumerate(placed):
+            self.assertTrue(all(lo <= x <= hi_x and lo <= y <= hi_y for x, y in a['polygon']), a['id'])
+            for b in placed[i + 1:]:
+                if a['sheet'] == b['sheet']:
+                    self.assertFalse(convex_overlap(a['polygon'], b['polygon']), (a['id'], b['id']))
+
+    def test_stamp_grids_inside_and_disjoint(self):
+        items = sample_items(8, seed=2) + [{'id': 'bulk', 'w': 90, 'h': 55, 'qty': 1500}]
+        _, out = self._pack(stamp=True, items=items)
+        self.assertEqual(out['mode'], 'stamp')
+        self.assertEqual(out['unplaced'], [])
+        expanded = stamp_placements(out)
+        self.assertEqual(len(expanded['placements']), sum(it['qty'] for it in items))
+        self.assertEqual(out['placedCount'], len(expanded['placements']))
+        self.assertEqual(layout_faults(expanded, 1220, 2440, gap=self.GAP, margin=self.MARGIN), 0)
+
+    def test_stamp_skips_zero_sized_items(self):
+        items = [{'id': 'flat', 'w': 0, 'h': 50, 'qty': 3}, {'id': 'thin', 'w': 40, 'h': 0, 'qty': 2},
+                 {'id': 'ok', 'w': 40, 'h': 50, 'qty': 2}]
+        out = pack_one(parse_pack_options({'stamp': True}), self.SHEET, items)
+        self.assertEqual(sorted((u['id'], u['qty']) for u in out['unplaced']), [('flat', 3), ('thin', 2)])
+        self.assertEqual(out['placedCount'], 2)
+
+
+class MaxRectsArrayTests(SimpleTestCase):
+    def test_array_path_matches_list_path(self):
+        # 大件数走数组实现，结果必须与逐个对象的实现逐位一致
+        for seed, (sw, sh), heuristic in [(1, (1220, 2440), 'bssf'), (2, (3200, 50000), 'baf'), (3, (1600, 3000), 'bl')]:
+            rects = random_rects(900, seed, rotate_ratio=0.7)
+            packer = MaxRectsPacker(sw, sh, heuristic)
+            arrays = packer.pack(rects, gap=5, margin=10)
+            reference = packer._pack_into([], 0.0, rects, 5, 10, False)
+            self.assertEqual(arrays, reference)
+            self.assertEqual(layout_faults(arrays, sw, sh, gap=5, margin=10), 0)
+
+    def test_mirror_tracks_free_rects(self):
+        # 放件后增量更新的镜像必须与各板的空闲矩形一一对应
+        bins = ArrayMaxRectsBins(1600, 3000)
+        rnd = random.Random(5)
+        for k in range(1500):
+            w, h = rnd.randint(20, 300), rnd.randint(20, 400)
+            if k % 300 == 299:
+                bins.set_floor(400.0, 20.0, 20.0)
+            idx = bins.first_fit(w, h, True)
+            if idx is None:
+                idx = bins.open()
+            self.assertIsNotNone(bins.place(idx, w, h, True, 'bssf'))
+        for idx, b in enumerate(bins.bins):
+            slots = bins.slots[idx]
+            self.assertEqual(len(slots), len(b.free))
+            self.assertTrue((bins.owner[slots] == idx).all())
+            np.testing.assert_array_equal(bins.lo[slots], np.minimum(b.free[:, 2], b.free[:, 3]))
+            np.testing.assert_array_equal(bins.hi[slots], np.maximum(b.free[:, 2], b.free[:, 3]))
+        live = sum(len(s) for s in bins.slots)
+        self.assertEqual(int((bins.owner[:bins.top] >= 0).sum()), live)
+
+
+class ColumnarFormatTests(SimpleTestCase):
+    def _roundtrip(self, out):
+        columnar = to_columnar(out)
+        self.assertEqual(columnar['count'], len(out['placements']))
+        self.assertEqual(from_columnar(json.loads(json.dumps(columnar))), out)
+        return columnar
+
+    def test_roundtrip_with_unplaced_and_fractional_coordinates(self):
+        items = sample_items(20) + [{'id': 'huge', 'w': 5000, 'h': 5000, 'qty': 1}]
+        out = pack_one(parse_pack_options({'gap': 2.5}), {'width': 1220, 'height': 2440}, items)
+        self.assertFalse(all(p['placed'] for p in out['placements']))
+        columnar = self._roundtrip(out)
+        # 含 null 的列不做整数编码
+        self.assertNotIn('sheet', columnar['encoding'])
+
+    def test_roundtrip_plain_ids(self):
+        out = MaxRectsPacker(1220, 2440).pack(random_rects(50), gap=4, margin=5)
+        self.assertIn('id', self._roundtrip(out)['columns'])
+
+    def test_integer_columns_compressed(self):
+        items = make_dataset('stickers', 5000, 1)
+        out = pack_one(parse_pack_options({'gap': 3, 'margin': 10}), {'width': 1270, 'height': 2000}, items)
+        columnar = self._roundtrip(out)
+        self.assertEqual(columnar['encoding']['item'], 'rle')
+        rows_size = len(json.dumps(out, separators=(',', ':')))
+        self.assertLess(len(json.dumps(columnar, separators=(',', ':'))) * 6, rows_size)
+
+
+# 多起点优化、算法竞赛与类目并行
+
+class MultiStartOptimizerTests(SimpleTestCase):
+    SHEET = {'width': 1220, 'height': 2440}
+
+    def test_seeded_run_is_reproducible_without_iterations(self):
+        # 给定 seed 时按固定候选数评估，与时间预算无关
+        items = sample_items()
+        outs = []
+        for budget in (1, 5000):
+            opts = parse_pack_options({'optimize': True, 'seed': 7, 'algorithm': 'maxrects', 'timeBudgetMs': budget})
+            self.assertEqual(opts['iterations'], MultiStartOptimizer.SEEDED_ITERATIONS)
+            outs.append(pack_one(opts, self.SHEET, items))
+        for out in outs:
+            self.assertTrue(out['optimizer']['complete'])
+            self.assertEqual(out['optimizer']['evaluated'], MultiStartOptimizer.SEEDED_ITERATIONS)
+        self.assertEqual(outs[0]['placements'], outs[1]['placements'])
+        self.assertEqual(outs[0]['optimizer']['best'], outs[1]['optimizer']['best'])
+
+    def test_cancel_stops_optimizer(self):
+        cancel = threading.Event()
+        cancel.set()
+        opts = parse_pack_options({'optimize': True, 'seed': 7, 'algorithm': 'maxrects'})
+        out = pack_one(opts, self.SHEET, sample_items(), cancel=cancel)
+        self.assertTrue(out['optimizer']['cancelled'])
+        self.assertFalse(out['optimizer']['complete'])
+        self.assertLess(out['optimizer']['evaluated'], MultiStartOptimizer.SEEDED_ITERATIONS)
+        self.assertTrue(all(p['placed'] for p in out['placements']))
+
+    def test_optimize_honours_requested_algorithm(self):
+        # 优化只在所请求的算法内搜索件序与启发式，默认的 shelf 不会被换成 maxrects / skyline
+        for alg in ('shelf', 'skyline', 'maxrects', 'guillotine'):
+            with self.subTest(algorithm=alg):
+                opts = parse_pack_options({'optimize': True, 'seed': 3, 'iterations': 12, 'algorithm': alg})
+                out = pack_one(opts, self.SHEET, sample_items())
+                self.assertEqual(out['algorithm'], alg)
+                self.assertEqual(out['optimizer']['best']['algorithm'], alg)
+                self.assertEqual(layout_faults(out, 1220, 2440), 0)
+        baseline = pack_one(parse_pack_options({'algorithm': 'shelf'}), self.SHEET, sample_items())
+        opts = parse_pack_options({'optimize': True, 'seed': 3, 'algorithm': 'shelf'})
+        self.assertLessEqual(len(pack_one(opts, self.SHEET, sample_items())['sheets']), len(baseline['sheets']))
+
+
+class PortfolioRaceTests(SimpleTestCase):
+    SPEC = (1000.0, 1000.0, 0.0, 0.0)
+
+    def test_contender_stops_when_it_cannot_win(self):
+        rows = [(250.0, 250.0, f't{k}', True) for k in range(2000)]
+        args = (self.SPEC, rows, 'maxrects', 'bssf', 'slas')
+        # 已有全部放下的 1 板成绩：第一次检查时已用 1 板，不可能更少，停止
+        out, _, status = _race_contender(*args, float('inf'), threading.Event(), _Best(1.0))
+        self.assertEqual((out, status), (None, 'cancelled'))
+        out, _, status = _race_contender(*args, 0.0, threading.Event(), _Best(float('inf')))
+        self.assertEqual((out, status), (None, 'timeout'))
+        out, _, status = _race_contender(*args, float('inf'), threading.Event(), _Best(200.0))
+        self.assertIsNone(status)
+        self.assertEqual(len(out['sheets']), 125)
+
+    def test_auto_picks_winner_and_releases_contenders(self):
+        # 250×250 正好铺满 1000×1000：shelf 最先达到面积下界，其余算法全部叫停
+        pool = get_pool()
+        manager = get_manager() if pool is not None else None
+        objects = manager._number_of_objects() if manager else 0
+        out = run_pack({'items': [{'id': 't', 'w': 250, 'h': 250, 'qty': 16000}], 'sheet': {'width': 1000, 'height': 1000},
+                        'algorithm': 'auto', 'timeBudgetMs': 60000})
+        board = {row['algorithm']: row for row in out['portfolio']['contenders']}
+        self.assertEqual(out['portfolio']['winner'], 'shelf')
+        self.assertEqual(out['algorithm'], 'shelf')
+        self.assertEqual((len(out['sheets']), out['portfolio']['lowerBound']), (1000, 1000))
+        self.assertEqual(board['shelf']['status'], 'won')
+        self.assertEqual({board[a]['status'] for a in ('maxrects', 'skyline', 'guillotine')}, {'cancelled'})
+        if pool is not None:
+            # 返回时没有参赛任务仍在进程池里，共享的停止标记与成绩也已释放
+            self.assertEqual(pool._pending_work_items, {})
+            self.assertEqual(manager._number_of_objects(), objects)
+
+
+class CategoryParallelTests(SimpleTestCase):
+    def _data(self):
+        items = []
+        for k, cat in enumerate(('vinyl', 'kt_board', 'banner')):
+            items += [dict(it, id=f'{cat}-{it["id"]}', category=cat) for it in sample_items(30, seed=k + 1)]
+        return {'items': items, 'byCategory': True, 'algorithm': 'maxrects', 'gap': 3, 'margin': 5,
+                'sheet': {'width': 1220, 'height': 2440}, 'sheetByCategory': {'banner': {'width': 900, 'height': 1800}}}
+
+    def _run(self, parallelism):
+        caches['nesting'].clear()
+        out = run_pack(dict(self._data(), parallelism=parallelism))
+        for res in out.values():
+            # 各类目都带纯计算耗时
+            self.assertIsInstance(res.pop('elapsedMs'), float)
+        return out
+
+    def test_parallel_categories_match_serial(self):
+        with mock.patch.object(views_nesting, '_run_categories_parallel', wraps=views_nesting._run_categories_parallel) as par:
+            serial = self._run(1)
+            self.assertFalse(par.called)
+            parallel = self._run(4)
+            self.assertTrue(par.called)
+        self.assertEqual(list(parallel), ['vinyl', 'kt_board', 'banner'])
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel['kt_board']['algorithm'], 'guillotine')
+
+
+# 结果缓存与选材
+
+class PackCacheKeyTests(SimpleTestCase):
+    SHEET = {'width': 1220, 'height': 2440}
+    BASE = {'gap': 4, 'margin': 5, 'algorithm': 'maxrects'}
+
+    def _key(self, sheet=None, items=None, alg=None, **params):
+        opts = parse_pack_options({**self.BASE, **params})
+        return pack_cache_key(opts, sheet or self.SHEET, sample_items() if items is None else items, alg or opts['algorithm'])
+
+    def test_key_changes_with_layout_inputs(self):
+        keys = [self._key(), self._key(gap=5), self._key(margin=6), self._key(heuristic='baf'),
+                self._key(algorithm='shelf'), self._key(algorithm='skyline'), self._key(algorithm='guillotine'),
+                self._key(sheet={'width': 1220, 'height': 2000}), self._key(items=sample_items(seed=2))]
+        self.assertEqual(len(set(keys)), len(keys))
+        # 件的顺序不影响排版结果
+        self.assertEqual(self._key(items=sample_items()[::-1]), keys[0])
+        # 未指定 seed 的优化与 auto 竞赛不缓存
+        self.assertIsNone(self._key(optimize=True))
+        self.assertIsNone(self._key(algorithm='auto'))
+
+    def test_key_changes_with_stock_sheet(self):
+        # 选材时每种材料按其尺寸单独排版、单独缓存：尺寸不同的材料不共用缓存；
+        # 价格只影响选择、不影响排版
+        stock = [{'id': 'a', 'width': 1220, 'height': 2440, 'cost': 30}, {'id': 'b', 'width': 1600, 'height': 3200, 'cost': 45}]
+        opts = parse_pack_options({**self.BASE, 'stock': stock})
+        keys = {e['id']: pack_cache_key(opts, {'width': e['width'], 'height': e['height']}, sample_items(), 'maxrects')
+                for e in opts['stock']}
+        self.assertNotEqual(keys['a'], keys['b'])
+        self.assertEqual(keys['a'], self._key())
+        roll = parse_pack_options({**self.BASE, 'stock': [{'id': 'r', 'width': 1600, 'costPerMeter': 20}]})
+        roll_key = pack_cache_key(dict(roll, roll=True), {'width': 1600, 'height': None}, sample_items(), 'skyline')
+        self.assertNotIn(roll_key, keys.values())
+        self.assertEqual(roll_key, pack_cache_key(dict(roll, roll=True), {'width': 1600, 'height': 9999}, sample_items(), 'skyline'))
+
+
+class StockSelectionTests(SimpleTestCase):
+    STOCK = [
+        {'id': 'small', 'width': 1220, 'height': 2440, 'cost': 30},
+        {'id': 'big', 'width': 1600, 'height': 3200, 'cost': 45},
+        {'id': 'dup', 'width': 1220, 'height': 2440, 'cost': 35},
+        {'id': 'tiny', 'width': 100, 'height': 100, 'cost': 1},
+        {'id': 'roll', 'width': 1600, 'costPerMeter': 20},
+    ]
+
+    def _run(self, **params):
+        return run_pack({'items': sample_items(12), 'gap': 4, 'margin': 5, 'stock': self.STOCK, **params})
+
+    def test_cheapest_stock_wins(self):
+        out = self._run()
+        status = {r['id']: r['status'] for r in out['stockCandidates']}
+        self.assertEqual(status['dup'], 'dominated')
+        self.assertEqual(status['tiny'], 'infeasible')
+        evaluated = [r['cost'] for r in out['stockCandidates'] if r['status'] == 'evaluated']
+        self.assertEqual(out['cost'], min(evaluated))
+        # 未实排的材料，成本下界已不低于最优成本
+        for r in out['stockCandidates']:
+            if r['status'] == 'pruned':
+                self.assertGreaterEqual(r['lowerBound'], out['cost'])
+
+    def test_stamp_mode_scores_by_sheet_count(self):
+        out = self._run(stamp=True)
+        self.assertEqual(out['mode'], 'stamp')
+        self.assertEqual(out['cost'], out['sheetCount'] * out['stock']['cost'])
+        self.assertEqual({r['id']: r['status'] for r in out['stockCandidates']}['roll'], 'excluded')
+
+    def test_no_fitting_stock_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            run_pack({'items': sample_items(4), 'stock': [self.STOCK[3]]})
+        with self.assertRaises(ValidationError):
+            parse_pack_options({'stock': [{'id': 'x', 'width': 100}]})
+
+
+# 切割顺序
+
+def grid_placements(sheets: int, per_sheet: int, seed: int = 1):
+    rnd = random.Random(seed)
+    return [{'id': f's{s}-{k}', 'sheet': s, 'x': rnd.randint(0, 2000), 'y': rnd.randint(0, 3000), 'w': 40, 'h': 30}
+            for s in range(1, sheets + 1) for k in range(per_sheet)]
+
+
+class CutPathDeadlineTests(SimpleTestCase):
+    def test_time_limit_covers_whole_request(self):
+        # 上限是所有板合计，而不是每板各一份
+        out = order_cut_paths({'placements': grid_placements(12, 400)}, time_limit_ms=100)
+        self.assertEqual(len(out['sheets']), 12)
+        self.assertLess(out['elapsedMs'], 400)
+        self.assertFalse(out['complete'])
+
+    def test_expired_deadline_keeps_input_order(self):
+        placements = grid_placements(1, 50)
+        res = order_sheet(placements, deadline=time.perf_counter() - 1)
+        self.assertFalse(res['complete'])
+        self.assertEqual([step['id'] for step in res['path']], [p['id'] for p in placements])
+        self.assertEqual([step['startVertex'] for step in res['path']], [0] * 50)
+        self.assertEqual((res['travel'], res['saved']), (res['baselineTravel'], 0.0))
+        # 时间充裕时最近邻排完，且不比原顺序差
+        res = order_sheet(placements, time_limit_ms=2000)
+        self.assertTrue(res['complete'])
+        self.assertLessEqual(res['travel'], res['baselineTravel'])
+
+
+# HTTP 接口
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNELS)
+class NestingEndpointTests(TestCase):
+    SHEET = {'width': 1220, 'height': 2440}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='nester', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _post(self, url, data, status=200):
+        resp = self.client.post(url, data, format='json')
+        self.assertEqual(resp.status_code, status, getattr(resp, 'data', None))
+        return resp
+
+    def _layout(self, **params):
+        body = {'sheet': self.SHEET, 'gap': 4, 'margin': 5, 'items': sample_items(), 'algorithm': 'maxrects', **params}
+        return self._post('/api/nesting/pack', body).data
+
+    def test_requires_authentication(self):
+        self.assertIn(APIClient().post('/api/nesting/pack', {}, format='json').status_code, (401, 403))
+
+    def test_pack_rejects_invalid_options(self):
+        for body in [{'algorithm': 'nope'}, {'gap': 'x'}, {'mode': 'roll', 'algorithm': 'maxrects'},
+                     {'algorithm': 'maxrects', 'heuristic': 'nope'}, {'split': 'nope'}, {'stamp': True, 'algorithm': 'polygon'},
+                     {'optimize': True, 'stamp': True}, {'iterations': 0, 'optimize': True}, {'format': 'xml'},
+                     {'stream': True, 'format': 'columnar'}, {'cutPath': {'direction': 'up'}}, {'resolution': -1}]:
+            with self.subTest(body=body):
+                resp = self._post('/api/nesting/pack', {'items': sample_items(), **body}, status=400)
+                self.assertIn('detail', resp.data)
+
+    def test_pack_stream_and_columnar(self):
+        rows = self._layout(algorithm='shelf')
+        resp = self.client.post('/api/nesting/pack', {'sheet': self.SHEET, 'gap': 4, 'margin': 5, 'items': sample_items(),
+                                                      'algorithm': 'shelf', 'stream': True}, format='json')
+        records = [json.loads(line) for line in b''.join(resp.streaming_content).splitlines()]
+        self.assertEqual(records[-1]['type'], 'summary')
+        self.assertEqual(sum(len(r['placements']) for r in records[:-1]), len(rows['placements']))
+        columnar = self._layout(algorithm='shelf', format='columnar')
+        self.assertEqual(from_columnar(columnar)['placements'], rows['placements'])
+
+    def _stream(self, body):
+        resp = self.client.post('/api/nesting/pack', dict(body, stream=True), format='json')
+        self.assertEqual(resp.status_code, 200)
+        return [json.loads(line) for line in b''.join(resp.streaming_content).splitlines()]
+
+    def test_stream_roll_with_nothing_placed(self):
+        # 卷材耗用长度为 0 时不能中途报错截断流
+        for items in ([], [{'id': 'wide', 'w': 3000, 'h': 100, 'qty': 2, 'rotate': False}]):
+            with self.subTest(items=items):
+                records = self._stream({'mode': 'roll', 'sheet': {'width': 1000}, 'items': items})
+                summary = records[-1]
+                self.assertEqual(summary['type'], 'summary')
+                self.assertEqual(summary['utilization'], 0.0)
+                self.assertEqual(len(summary['unplaced']), len(items) and 2)
+                self.assertTrue(all(r['utilization'] == 0.0 for r in records[:-1]))
+
+    def test_validate(self):
+        out = self._layout()
+        body = {'sheet': self.SHEET, 'gap': 4, 'margin': 5, 'sheets': out['sheets'], 'placements': out['placements']}
+        self.assertTrue(self._post('/api/nesting/validate', body).data['valid'])
+        # 把第二件拖到第一件上，再把第三件拖出边距
+        moved = [dict(p) for p in out['placements']]
+        moved[1].update(sheet=moved[0]['sheet'], x=moved[0]['x'] + 1, y=moved[0]['y'] + 1)
+        moved[2].update(x=0)
+        res = self._post('/api/nesting/validate', dict(body, placements=moved)).data
+        self.assertFalse(res['valid'])
+        self.assertGreaterEqual(res['overlapCount'], 1)
+        self.assertEqual(res['overlaps'][0]['kind'], 'overlap')
+        self.assertIn({'sheet': moved[2]['sheet'], 'id': moved[2]['id'], 'sides': ['left']}, res['marginViolations'])
+        self._post('/api/nesting/validate', {'placements': [{'sheet': 1, 'x': 0}]}, status=400)
+
+    def test_validate_counts_overlaps_on_tall_roll(self):
+        # 4 列 × 1500 行紧排在卷材上，列距、行距恰为 gap；每 100 行把一行下移 2，与下一行间距不足
+        cols, rows, gap = 4, 1500, 4
+        placements = []
+        for r in range(rows):
+            shift = 2 if r % 100 == 50 else 0
+            for c in range(cols):
+                placements.append({'id': f'p{r}-{c}', 'sheet': 1, 'x': c * 104, 'y': r * 54 + shift, 'w': 100, 'h': 50})
+        # 再压一件跨 10 行的长件在第一列上
+        placements.append({'id': 'tall', 'sheet': 1, 'x': 0, 'y': 0, 'w': 100, 'h': 536})
+        body = {'sheet': {'width': 420}, 'mode': 'roll', 'gap': gap, 'margin': 0, 'placements': placements}
+        res = self._post('/api/nesting/validate', body).data
+        self.assertEqual(res['checked'], cols * rows + 1)
+        self.assertEqual(res['marginViolationCount'], 0)
+        self.assertEqual(res['overlapCount'], cols * (rows // 100) + 10)
+        kinds = [o['kind'] for o in res['overlaps']]
+        self.assertEqual(kinds.count('overlap'), 10)
+        self.assertEqual(kinds.count('gap'), cols * (rows // 100))
+
+    def test_cut_path(self):
+        out = self._layout()
+        res = self._post('/api/nesting/cut-path', {'placements': out['placements'], 'travelSpeed': 400}).data
+        cut_ids = sorted(step['id'] for sheet in res['sheets'] for step in sheet['path'])
+        self.assertEqual(cut_ids, sorted(p['id'] for p in out['placements'] if p['placed']))
+        self.assertEqual(res['saved'], round(res['baselineTravel'] - res['travel'], 1))
+        self._post('/api/nesting/cut-path', {'placements': out['placements'], 'direction': 'up'}, status=400)
+        self._post('/api/nesting/cut-path', {'placements': [{'sheet': 1, 'x': 'a', 'y': 0, 'w': 1, 'h': 1}]}, status=400)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                               'nesting': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'pack'}})
+    def test_pack_cache_header(self):
+        def header(**params):
+            resp = self._post('/api/nesting/pack', {'sheet': self.SHEET, 'gap': 4, 'margin': 5, 'items': sample_items(),
+                                                    'algorithm': 'maxrects', **params})
+            return resp['X-Nesting-Cache'], resp['X-Nesting-Cache-Hits'], resp.data
+
+        miss = header()
+        self.assertEqual(miss[:2], ('miss', '0/1'))
+        hit = header()
+        self.assertEqual(hit[:2], ('hit', '1/1'))
+        self.assertEqual(hit[2], miss[2])
+        self.assertEqual(header(items=sample_items()[::-1])[0], 'hit')
+        for params in ({'gap': 5}, {'margin': 6}, {'algorithm': 'skyline'}):
+            with self.subTest(params=params):
+                self.assertEqual(header(**params)[0], 'miss')
+        # 选材：每种实排的材料各查一次缓存；只改价格时排版全部命中，但成本按新价格重算
+        stock = [{'id': 'a', 'width': 1220, 'height': 2440, 'cost': 30}, {'id': 'b', 'width': 1600, 'height': 3200, 'cost': 45}]
+        items = sample_items(seed=9)
+        self.assertEqual(header(items=items, stock=stock)[0], 'miss')
+        state, _, cheaper = header(items=items, stock=[dict(stock[0], cost=10), stock[1]])
+        self.assertEqual(state, 'hit')
+        self.assertEqual((cheaper['stock']['id'], cheaper['cost']), ('a', 10 * len(cheaper['sheets'])))
+        self.assertEqual(header(items=items, stock=[dict(stock[0], width=1300), stock[1]])[0], 'miss')
+        # byCategory：各类目独立命中
+        vinyl = [dict(it, category='vinyl') for it in sample_items(seed=5)]
+        pvc = [dict(it, category='pvc', id='p' + it['id']) for it in sample_items(seed=6)]
+        self.assertEqual(header(items=vinyl, byCategory=True)[:2], ('miss', '0/1'))
+        self.assertEqual(header(items=vinyl + pvc, byCategory=True)[:2], ('miss', '1/2'))
+        self.assertEqual(header(items=vinyl + pvc, byCategory=True)[:2], ('hit', '2/2'))
+
+    def test_repack_keeps_fixed_parts(self):
+        out = self._layout()
+        fixed = [p for p in out['placements'] if p['placed']]
+        sent = json.loads(json.dumps(fixed))
+        new_items = [{'id': 'new', 'w': 120, 'h': 90, 'qty': 5}]
+        res = self._post('/api/nesting/repack', {'sheet': self.SHEET, 'gap': 4, 'margin': 5, 'placements': sent,
+                                                 'sheetCount': len(out['sheets']), 'items': new_items}).data
+        # 只返回新件，已放件的坐标保持请求中的原样
+        self.assertTrue(all(p['id'].startswith('new-') for p in res['placements']))
+        self.assertEqual(sum(1 for p in res['placements'] if p['placed']), 5)
+        self.assertEqual(sent, fixed)
+        self.assertGreaterEqual(len(res['sheets']), len(out['sheets']))
+        # 新件之间、新件与已放件之间都不重叠（含间距），也不越过边距
+        merged = dict(res, placements=fixed + res['placements'])
+        self.assertEqual(layout_faults(merged, 1220, 2440, gap=4, margin=5), 0)
+        for p in res['placements']:
+            for q in fixed:
+                if p['sheet'] == q['sheet']:
+                    self.assertFalse(p['x'] < q['x'] + q['w'] + 4 and q['x'] < p['x'] + p['w'] + 4
+                                     and p['y'] < q['y'] + q['h'] + 4 and q['y'] < p['y'] + p['h'] + 4, (p, q))
+        self._post('/api/nesting/repack', {'heuristic': 'nope'}, status=400)
+        self._post('/api/nesting/repack', {'placements': [{'sheet': 1, 'x': 0}]}, status=400)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                               'nesting': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'repack'}})
+    def test_repack_reuses_cached_layout(self):
+        out = self._layout()
+        body = {'sheet': self.SHEET, 'gap': 4, 'margin': 5, 'placements': out['placements'],
+                'sheetCount': len(out['sheets']), 'items': [{'id': 'a', 'w': 120, 'h': 90, 'qty': 3}]}
+        first = self._post('/api/nesting/repack', body)
+        self.assertEqual(first['X-Nesting-Cache'], 'miss')
+        # 拿返回的排版继续追加：空闲矩形取自缓存，结果与重建一致
+        layout = [p for p in out['placements'] if p['placed']] + [p for p in first.data['placements'] if p['placed']]
+        body = dict(body, placements=layout, sheetCount=len(first.data['sheets']), items=[{'id': 'b', 'w': 200, 'h': 150, 'qty': 4}])
+        second = self._post('/api/nesting/repack', body)
+        self.assertEqual(second['X-Nesting-Cache'], 'hit')
+        caches['nesting'].clear()
+        rebuilt = self._post('/api/nesting/repack', body)
+        self.assertEqual(rebuilt['X-Nesting-Cache'], 'miss')
+        self.assertEqual(second.data, rebuilt.data)
+
+    def test_roll_sweep(self):
+        res = self._post('/api/nesting/roll-sweep', {'widths': [1600, 1000, 1300], 'gap': 4, 'margin': 5,
+                                                     'items': sample_items()}).data
+        self.assertEqual([r[0] for r in res['rows']], [1000, 1300, 1600])
+        self.assertIn(res['best'], (1000, 1300, 1600))
+        ranged = self._post('/api/nesting/roll-sweep', {'widthRange': {'from': 1000, 'to': 1600, 'step': 300},
+                                                        'items': sample_items()}).data
+        self.assertEqual([r[0] for r in ranged['rows']], [1000, 1300, 1600])
+        self._post('/api/nesting/roll-sweep', {'items': sample_items()}, status=400)
+        self._post('/api/nesting/roll-sweep', {'widths': [8], 'margin': 5, 'items': sample_items()}, status=400)
+        self._post('/api/nesting/roll-sweep', {'widthRange': {'from': 1, 'to': 100000, 'step': 1}}, status=400)
+
+    def test_vectorize(self):
+        img = Image.new('RGB', (200, 160), 'white')
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([40, 30, 160, 130], fill='black')
+        draw.rectangle([80, 60, 120, 100], fill='white')
+        buf = BytesIO()
+        img.save(buf, format='PNG')
+        buf.seek(0)
+        buf.name = 'ring.png'
+        resp = self.client.post('/api/nesting/vectorize', {'files': [buf], 'tolerance_mm': 0.5}, format='multipart')
+        self.assertEqual(resp.status_code, 200)
+        result = resp.data['results'][0]
+        self.assertEqual((result['width'], result['height']), (200, 160))
+        self.assertEqual(sorted(c['hole'] for c in result['contours']), [False, True])
+        self.assertTrue(result['dataUrl'].startswith('data:image/png;base64,'))
+        bad = BytesIO(b'not an image')
+        bad.name = 'x.gif'
+        self.assertIn('error', self.client.post('/api/nesting/vectorize', {'files': [bad]}, format='multipart').data['results'][0])
+        self.assertEqual(self.client.post('/api/nesting/vectorize', {}, format='multipart').status_code, 400)
+        buf.seek(0)
+        self.assertEqual(self.client.post('/api/nesting/vectorize', {'files': [buf], 'tolerance_mm': 0},
+                                          format='multipart').status_code, 400)
+
+
+    def test_diagnostics_only_when_requested(self):
+        self.assertNotIn('diagnostics', self._layout())
+        # 请求体或查询参数都可开启；每次用不同的件，避免命中缓存跳过 pack 阶段
+        for seed, params in enumerate(({'diagnostics': True}, {}), start=2):
+            with self.subTest(params=params):
+                url = '/api/nesting/pack' if params else '/api/nesting/pack?diagnostics=1'
+                body = {'sheet': self.SHEET, 'items': sample_items(seed=seed), 'algorithm': 'shelf', **params}
+                diag = self._post(url, body).data['diagnostics']
+                self.assertTrue({'parse', 'cache', 'pack', 'pack.sort', 'pack.place'} <= set(diag['phases']))
+                self.assertEqual(diag['counters']['items'], 12)
+                self.assertEqual(diag['counters']['cacheMisses'], 1)
+        lines = self._post('/api/nesting/pack?diagnostics=1', {'items': sample_items(), 'stream': True}).streaming_content
+        self.assertTrue(all('diagnostics' not in json.loads(line) for line in b''.join(lines).splitlines()))
+
+    def test_metrics_admin_only(self):
+        metrics.reset()
+        self._layout()
+        self._layout(diagnostics=True)
+        self.assertEqual(self.client.get('/api/nesting/metrics').status_code, 403)
+        self.assertIn(APIClient().get('/api/nesting/metrics').status_code, (401, 403))
+        admin = APIClient()
+        admin.force_authenticate(get_user_model().objects.create_user(username='ops', password='x', is_staff=True))
+        resp = admin.get('/api/nesting/metrics')
+        self.assertEqual(resp.status_code, 200)
+        # 不论是否请求 diagnostics 都计入
+        self.assertEqual(resp.data['endpoints']['nesting.pack']['calls'], 2)
+
+
+# 异步任务、WebSocket 进度与排版保存
+
+@override_settings(NESTING_JOB_EXECUTOR='celery', CHANNEL_LAYERS=IN_MEMORY_CHANNELS)
+class NestingJobCancelTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='nester', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _submit(self):
+        # celery 执行方式在事务提交后才投递，测试事务内任务保持排队中
+        resp = self.client.post('/api/nesting/jobs/', {'items': sample_items(), 'optimize': True, 'seed': 3}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        return resp.data['id']
+
+    def test_cancel_pending_job(self):
+        job_id = self._submit()
+        resp = self.client.post(f'/api/nesting/jobs/{job_id}/cancel/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.data['status'], 'cancelled')
+        self.assertEqual(self.client.post(f'/api/nesting/jobs/{job_id}/cancel/').status_code, 409)
+        self.assertEqual(self.client.get(f'/api/nesting/jobs/{job_id}/result/').status_code, 409)
+        # 已撤销的任务被 worker 取到时直接跳过
+        execute_nesting_job(job_id)
+        self.assertEqual(NestingJob.objects.get(pk=job_id).status, 'cancelled')
+
+    def test_cancel_while_running_discards_result(self):
+        job_id = self._submit()
+        seen = {}
+
+        def run_and_cancel(data, opts, progress=None, job=None, cancel=None):
+            cancel_nesting_job(NestingJob.objects.get(pk=job_id))
+            seen['cancelled'] = cancel.is_set()
+            return {'sheets': [], 'placements': []}
+
+        with mock.patch('apps.production.views_nesting.run_pack', side_effect=run_and_cancel):
+            execute_nesting_job(job_id)
+        job = NestingJob.objects.get(pk=job_id)
+        self.assertTrue(seen['cancelled'])
+        self.assertEqual(job.status, 'cancelled')
+        self.assertIsNone(job.result)
+
+
+@override_settings(NESTING_JOB_EXECUTOR='inline', CHANNEL_LAYERS=IN_MEMORY_CHANNELS)
+class NestingJobInlineTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='nester', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_job_runs_to_result(self):
+        resp = self.client.post('/api/nesting/jobs/', {'items': sample_items(), 'algorithm': 'maxrects'}, format='json')
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(resp.data['status'], 'succeeded')
+        self.assertEqual(resp.data['progress'], 1.0)
+        result = self.client.get(f"/api/nesting/jobs/{resp.data['id']}/result/")
+        self.assertEqual(result.status_code, 200)
+        qty = sum(i['qty'] for i in sample_items())
+        self.assertEqual(len(result.data['placements']), qty)
+        self.assertEqual(layout_faults(result.data, 1220, 2440), 0)
+        # 已完成的任务不能撤销
+        self.assertEqual(self.client.post(f"/api/nesting/jobs/{resp.data['id']}/cancel/").status_code, 409)
+
+    def test_invalid_params_rejected_before_queueing(self):
+        resp = self.client.post('/api/nesting/jobs/', {'items': sample_items(), 'algorithm': 'nope'}, format='json')
+        self.assertEqual(resp.status_code, 400)
+        self.assertFalse(NestingJob.objects.exists())
+
+    def test_jobs_are_private(self):
+        resp = self.client.post('/api/nesting/jobs/', {'items': sample_items()}, format='json')
+        other = APIClient()
+        other.force_authenticate(get_user_model().objects.create_user(username='other', password='x'))
+        self.assertEqual(other.get(f"/api/nesting/jobs/{resp.data['id']}/").status_code, 404)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNELS)
+class NestingJobSocketTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='nester', password='x')
+        self.token = Token.objects.create(user=self.user)
+        self.job = NestingJob.objects.create(user=self.user, params={'items': sample_items()})
+        self.app = TokenAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+
+    def _connect(self, query='', headers=()):
+        # 直接用 asgiref 驱动 websocket 握手（channels.testing 依赖 daphne）
+        async def run():
+            comm = ApplicationCommunicator(self.app, {
+                'type': 'websocket', 'path': f'/ws/nesting/jobs/{self.job.pk}/',
+                'query_string': query.encode(), 'headers': list(headers), 'subprotocols': [],
+            })
+            await comm.send_input({'type': 'websocket.connect'})
+            reply = await comm.receive_output(1)
+            first = None
+            if reply['type'] == 'websocket.accept':
+                first = json.loads((await comm.receive_output(1))['text'])
+                await comm.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await comm.wait(1)
+            return reply['type'] == 'websocket.accept', first
+        return async_to_sync(run)()
+
+    def test_token_in_query_string(self):
+        connected, first = self._connect(f'token={self.token.key}')
+        self.assertTrue(connected)
+        self.assertEqual(first, {'status': 'pending', 'progress': 0.0})
+
+    def test_token_in_authorization_header(self):
+        connected, _ = self._connect(headers=[(b'authorization', f'Token {self.token.key}'.encode())])
+        self.assertTrue(connected)
+
+    def test_rejects_missing_bad_or_foreign_token(self):
+        other = get_user_model().objects.create_user(username='other', password='x')
+        for query in ('', 'token=bad', f'token={Token.objects.create(user=other).key}'):
+            self.assertFalse(self._connect(query)[0])
+
+
+class SavedLayoutTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='keeper', password='x')
+
+    def _result(self, sheets: int, per_sheet: int):
+        placements = [dict(p, rotated=k % 2 == 0, placed=True) for k, p in enumerate(grid_placements(sheets, per_sheet))]
+        return {'sheets': [{'index': s, 'w': 2440.0, 'h': 3660.0} for s in range(1, sheets + 1)], 'placements': placements}
+
+    def test_load_layout_uses_two_queries(self):
+        # 板与件各一次查询，与件数无关
+        for sheets, per_sheet in ((2, 5), (10, 100)):
+            with self.subTest(parts=sheets * per_sheet):
+                result = self._result(sheets, per_sheet)
+                job = save_layout(layout_job(self.user, {}), result)
+                with self.assertNumQueries(2):
+                    out = load_layout(job)
+                self.assertEqual([s['index'] for s in out['sheets']], list(range(1, sheets + 1)))
+                self.assertEqual(out['placements'], result['placements'])
+
+    def test_load_layout_by_category_uses_two_queries(self):
+        result = {'vinyl': self._result(3, 200), 'kt_board': self._result(2, 100)}
+        job = save_layout(layout_job(self.user, {'byCategory': True}), result, by_category=True)
+        with self.assertNumQueries(2):
+            out = load_layout(job)
+        self.assertEqual(sorted(out), ['kt_board', 'vinyl'])
+        for cat, res in result.items():
+            self.assertEqual(out[cat]['placements'], res['placements'])
+
+
+# 矢量化、渲染与 TIFF 输出
+
+def reference_foreground(img: Image.Image, threshold: float, step: int):
+    # 矢量化前的逐像素实现，作为 _foreground_mask 的对照
+    px = img.load()
+    w, h = img.size
+    lum = lambda r, g, b: 0.299 * r + 0.587 * g + 0.114 * b
+    pts = []
+    for y in range(0, h, step):
+        for x in range(0, w, step):
+            r, g, b, a = px[x, y]
+            if a <= 10:
+                continue
+            L = lum(r, g, b)
+            edge = 0
+            if x + 1 < w:
+                edge = max(edge, abs(int(lum(*px[x + 1, y][:3]) - L)))
+            if y + 1 < h:
+                edge = max(edge, abs(int(lum(*px[x, y + 1][:3]) - L)))
+            if L < threshold or edge > 12:
+                pts.append((x, y))
+    return pts
+
+
+class ForegroundMaskTests(SimpleTestCase):
+    def test_matches_per_pixel_reference(self):
+        rng = np.random.default_rng(24)
+        for k in range(40):
+            w, h = (int(v) for v in rng.integers(1, 48, size=2))
+            rgba = rng.integers(0, 256, size=(h, w, 4), dtype=np.uint8)
+            # 一部分图为近白底 + 色块，且整块透明，覆盖亮度差在 12 / 13 附近与 alpha 边界的情形
+            if k % 2:
+                rgba[..., :3] = 255 - rng.integers(0, 16, size=(h, w, 1), dtype=np.uint8)
+                rgba[h // 3:, w // 3:, :3] = rng.integers(0, 256, size=3, dtype=np.uint8)
+                rgba[..., 3] = np.where(rng.random((h, w)) < 0.2, rng.integers(0, 12), 255)
+            img = Image.fromarray(rgba, 'RGBA')
+            step = int(rng.integers(1, 4))
+            for threshold in (240, 128):
+                with self.subTest(image=k, threshold=threshold, step=step):
+                    mask, xs, ys = _foreground_mask(np.asarray(img), threshold, step)
+                    iy, ix = np.nonzero(mask)
+                    got = sorted(zip(xs[ix].tolist(), ys[iy].tolist()), key=lambda p: (p[1], p[0]))
+                    self.assertEqual(got, reference_foreground(img, threshold, step))
+
+
+class NestingRenderTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = get_user_model().objects.create_user(username='nester', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        src = BytesIO()
+        Image.new('RGB', (40, 30), 'red').save(src, format='PNG')
+        name = default_storage.save('uploads/red.png', ContentFile(src.getvalue()))
+        self.body = {
+            'sheets': [{'index': 1, 'w': 200, 'h': 100}],
+            'placements': [{'id': 'a-0', 'sheet': 1, 'x': 10, 'y': 10, 'w': 80, 'h': 60, 'rotated': False}],
+            'items': [{'id': 'a', 'w': 80, 'h': 60, 'image': '/media/' + name}],
+            'dpi': 50.8,
+        }
+
+    def test_pdf_stream(self):
+        resp = self.client.post('/api/nesting/render', self.body, format='json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(b''.join(resp.streaming_content).startswith(b'%PDF'))
+
+    def test_tiff_written_to_storage(self):
+        resp = self.client.post('/api/nesting/render', dict(self.body, format='tiff'), format='json')
+        self.assertEqual(resp.status_code, 200)
+        # 50.8 dpi = 2 px/mm
+        self.assertEqual(resp.data['sheets'], [{'index': 1, 'width': 400, 'height': 200}])
+        with default_storage.open(resp.data['name']) as f:
+            img = Image.open(f)
+            img.load()
+        self.assertEqual(img.size, (400, 200))
+        self.assertEqual(img.convert('RGB').getpixel((100, 80)), (255, 0, 0))
+        self.assertEqual(img.convert('RGB').getpixel((300, 150)), (255, 255, 255))
+
+    def test_rejects_bad_requests(self):
+        for patch in [{'format': 'png'}, {'dpi': 5000}, {'sheets': []}, {'placements': [{'sheet': 1, 'x': 0}]},
+                      {'items': [{'id': 'a', 'image': '/media/../settings.py'}]},
+                      {'items': [{'id': 'a', 'image': '/media/uploads/missing.png'}]}]:
+            with self.subTest(patch=patch):
+                self.assertEqual(self.client.post('/api/nesting/render', dict(self.body, **patch), format='json').status_code, 400)
+
+
+class TiffWriterTests(SimpleTestCase):
+    def _roundtrip(self, big: bool, rows_per_strip: int):
+        rng = np.random.default_rng(1)
+        pages = [rng.integers(0, 256, (37, 23, 3), dtype=np.uint8) for _ in range(2)]
+        buf = BytesIO()
+        writer = TiffWriter(buf, big=big)
+        for a in pages:
+            strips = (a[i:i + rows_per_strip].tobytes() for i in range(0, a.shape[0], rows_per_strip))
+            writer.add_page(a.shape[1], a.shape[0], rows_per_strip, strips, 150)
+        buf.seek(0)
+        img = Image.open(buf)
+        self.assertEqual(img.n_frames, 2)
+        self.assertEqual(img.info.get('dpi'), (150.0, 150.0))
+        for k, a in enumerate(pages):
+            img.seek(k)
+            np.testing.assert_array_equal(np.asarray(img.convert('RGB')), a)
+
+    def test_classic_tiff_reads_back(self):
+        self._roundtrip(big=False, rows_per_strip=5)
+        self._roundtrip(big=False, rows_per_strip=64)
+
+    def test_bigtiff_reads_back(self):
+        # BigTIFF 中 BitsPerSample、分辨率等不超过 8 字节的值内联在目录项里
+        self._roundtrip(big=True, rows_per_strip=5)
+        self._roundtrip(big=True, rows_per_strip=64)
+
+
+# 拼单与基准对比
+
+class GangSheetTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='nester', password='x')
+        self.merchant = Merchant.objects.create(name='m', slug='m')
+        self.order = Order.objects.create(merchant=self.merchant, user=self.user, order_number='O1', status='confirmed',
+                                          total_amount=0, shipping_address={})
+        self.options = {}
+        for name in ('a', 'b'):
+            product = Product.objects.create(merchant=self.merchant, name=name, category='banner', base_price=1)
+            config = ProductConfig.objects.create(product=product, config_type='material', config_name='材料')
+            self.options[name] = (product, config, {m: ConfigOption.objects.create(config=config, name=m) for m in ('440g', '510g')})
+
+    def _item(self, product, material, w=50, h=80, qty=2):
+        product, config, options = self.options[product]
+        cfg = {'width': w, 'height': h, 'unit': 'cm', 'options': {str(config.pk): options[material].pk}}
+        return OrderItem.objects.create(order=self.order, product=product, quantity=qty, unit_price=0, subtotal=0, config_data=cfg)
+
+    def test_groups_by_category_and_material(self):
+        # 不同产品同材料排在一起，同产品不同材料分开
+        for product, material in [('a', '440g'), ('b', '440g'), ('a', '510g')]:
+            self._item(product, material)
+        bad = OrderItem.objects.create(order=self.order, product=self.options['a'][0], quantity=1, unit_price=0,
+                                       subtotal=0, config_data={})
+        out = build_gang_plans(self.merchant, self.user)
+        groups = {(g['category'], g['material']): g for g in out['groups']}
+        self.assertEqual(set(groups), {('banner', '440g'), ('banner', '510g')})
+        self.assertEqual(groups[('banner', '440g')]['items'], 2)
+        self.assertEqual(groups[('banner', '440g')]['name'], '喷绘布 440g')
+        self.assertEqual(out['skipped'], [str(bad.pk)])
+        self.assertEqual(ProductionPlan.objects.count(), out['plans'])
+
+    def test_items_are_claimed_once(self):
+        self._item('a', '440g')
+        self.assertEqual(build_gang_plans(self.merchant, self.user, dry_run=True)['plans'], 1)
+        self.assertEqual(ProductionPlan.objects.count(), 0)
+        self.assertEqual(build_gang_plans(self.merchant, self.user)['plans'], 1)
+        again = build_gang_plans(self.merchant, self.user)
+        self.assertEqual((again['plans'], again['groups']), (0, []))
+
+
+class NestingBenchCompareTests(SimpleTestCase):
+    ROW = {'dataset': 'boards', 'parts': 1000, 'algorithm': 'maxrects', 'utilization': 0.8, 'sheets': 10,
+           'unplaced': 0, 'wallMs': 100.0, 'peakKb': 500.0}
+    META = {'datasets': ['boards'], 'sizes': [1000], 'algorithms': ['maxrects', 'shelf']}
+
+    def _compare(self, rows, baseline_rows, meta=META):
+        return compare({'meta': meta, 'results': rows}, {'results': baseline_rows}, 0.005, 0.5, 0.5, 50.0)
+
+    def test_equal_run_passes(self):
+        self.assertEqual(self._compare([self.ROW], [self.ROW]), [])
+
+    def test_regressions_reported(self):
+        worse = dict(self.ROW, utilization=0.7, sheets=11, wallMs=300.0, peakKb=900.0)
+        self.assertEqual(len(self._compare([worse], [self.ROW])), 4)
+
+    def test_newly_skipped_or_missing_rows_fail(self):
+        skipped = {'dataset': 'boards', 'parts': 1000, 'algorithm': 'maxrects', 'skipped': 'time-limit'}
+        self.assertEqual(len(self._compare([skipped], [self.ROW])), 1)
+        self.assertEqual(len(self._compare([], [self.ROW])), 1)
+        # 本次没选的组合、基线里本来就跳过的组合不算
+        self.assertEqual(self._compare([], [self.ROW], meta=dict(self.META, algorithms=['shelf'])), [])
+        self.assertEqual(self._compare([skipped], [skipped]), [])
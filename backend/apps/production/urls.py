@@ -1,12 +1,21 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path
 from .views import ProductionPlanViewSet
-from .views_nesting import NestingPackAPIView, VectorizePlaceholderAPIView
+from .views_nesting import NestingCutPathAPIView, NestingMetricsAPIView, NestingPackAPIView, NestingRepackAPIView, NestingRollSweepAPIView, NestingValidateAPIView, VectorizePlaceholderAPIView
+from .views_nesting_jobs import NestingJobViewSet
+from .views_nesting_render import NestingRenderAPIView
 
 router = DefaultRouter()
 router.register(r'production-plans', ProductionPlanViewSet, basename='production-plan')
+router.register(r'nesting/jobs', NestingJobViewSet, basename='nesting-job')
 
 urlpatterns = router.urls + [
     path('nesting/pack', NestingPackAPIView.as_view(), name='nesting-pack'),
+    path('nesting/repack', NestingRepackAPIView.as_view(), name='nesting-repack'),
+    path('nesting/roll-sweep', NestingRollSweepAPIView.as_view(), name='nesting-roll-sweep'),
+    path('nesting/validate', NestingValidateAPIView.as_view(), name='nesting-validate'),
+    path('nesting/cut-path', NestingCutPathAPIView.as_view(), name='nesting-cut-path'),
+    path('nesting/render', NestingRenderAPIView.as_view(), name='nesting-render'),
+    path('nesting/metrics', NestingMetricsAPIView.as_view(), name='nesting-metrics'),
     path('nesting/vectorize', VectorizePlaceholderAPIView.as_view(), name='nesting-vectorize'),
 ]
@@ -1,59 +1,109 @@
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional
+from bisect import bisect_left, bisect_right, insort
 from io import BytesIO
-from PIL import Image, ImageFile
+from PIL import Image, ImageFile, ImageDraw, ImageFilter
 import base64
+import hashlib
+import heapq
+import json
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import permissions
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.core.cache import caches
+from django.http import StreamingHttpResponse
 
+from .contours import mask_contours, svg_path
+from .cut_path import DIRECTIONS, order_cut_paths, order_sheet
+from .diagnostics import collect, count, metrics, phase
+from .layouts import layout_job, save_layout
+from .nesting_pool import get_manager, get_pool, pool_size, reset_pool
+from .renderers import NESTING_RENDERERS
 
-@dataclass
+
+def _tick(packer, k: int, n: int, used: float = 0.0):
+    # 每 512 件回报一次进度（0~1），供异步任务展示；used 为目前已用的板数（卷材为长度），只增不减，
+    # 算法竞赛据此叫停已不可能胜出的算法
+    if packer.progress is not None and n and k % 512 == 0:
+        packer.used = used
+        packer.progress(k / n)
+
+
+@dataclass(slots=True)
 class Rect:
     w: float
     h: float
     id: str
     rotate: bool
+    # 外形多边形（件自身坐标系，单位同 w/h）；为空时按矩形处理
+    poly: Optional[Tuple[Tuple[float, float], ...]] = None
 
 
 class ShelfPacker:
+    progress = None
+
     def __init__(self, sheet_w: float, sheet_h: float):
         self.SW = sheet_w
         self.SH = sheet_h
 
-    def pack(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0):
-        # sort by height descending (consider rotation)
+    def pack(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0, presorted: bool = False):
+        with phase('sort'):
+            items = self._sorted(rects, presorted)
+        sheets: List[Dict] = []
+        placements: List[Dict] = []
+        with phase('place'):
+            for sheet, group in self._shelves(items, gap, margin):
+                sheets.append(sheet)
+                placements.extend(group)
+        used_area = sum(p['w'] * p['h'] for p in placements if p['placed'])
+        total_area = sum(p['w'] * p['h'] for p in placements)
+        util = used_area / (len(sheets) * self.SW * self.SH) if sheets else 0.0
+        return {'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area}
+
+    def iter_sheets(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0):
+        """逐张产出 (sheet, placements)：货架式排版换板后前一张不会再变，可以边排边输出。
+
+        placements 按件的处理顺序排列，其中包含该板排版期间遇到的放不下的件（placed=False）。
+        """
+        yield from self._shelves(self._sorted(rects), gap, margin)
+
+    def _sorted(self, rects: List[Rect], presorted: bool = False):
+        # sort by height descending (consider rotation)；presorted 时保持传入顺序（多起点优化给定件序）
         items = []
         for r in rects:
             w, h = (r.w, r.h)
+            rotated = False
             if r.rotate and h > w and h <= self.SW and w <= self.SH:
                 # prefer rotate tall items to fit shelves better when needed
                 w, h = h, w
-            items.append((r.id, w, h, r.rotate))
-        items.sort(key=lambda x: max(x[1], x[2]), reverse=True)
+                rotated = True
+            items.append((r.id, w, h, rotated))
+        if not presorted:
+            items.sort(key=lambda x: max(x[1], x[2]), reverse=True)
+        return items
 
-        sheets: List[Dict] = []
+    def _shelves(self, items, gap: float, margin: float):
         placements: List[Dict] = []
-        current_sheet = 0
+        current_sheet = 1
         x = margin
         y = margin
         shelf_h = 0.0
-        used_area = 0.0
-
-        def new_sheet():
-            nonlocal current_sheet, x, y, shelf_h
-            current_sheet += 1
-            x = margin
-            y = margin
-            shelf_h = 0.0
-
-        new_sheet()
-        total_area = 0.0
-        for rid, w, h, rot in items:
-            total_area += w * h
+        for k, (rid, w, h, rot) in enumerate(items):
+            _tick(self, k, len(items), current_sheet)
             # place on current shelf or new shelf/sheet
             if w > self.SW:  # cannot fit ever
                 placements.append({'id': rid, 'sheet': None, 'x': None, 'y': None, 'w': w, 'h': h, 'rotated': False, 'placed': False})
@@ -65,60 +115,2502 @@ class ShelfPacker:
                 shelf_h = 0.0
             if y + h + margin > self.SH:
                 # new sheet
-                sheets.append({'index': current_sheet, 'w': self.SW, 'h': self.SH})
-                new_sheet()
+                yield {'index': current_sheet, 'w': self.SW, 'h': self.SH}, placements
+                placements = []
+                current_sheet += 1
+                x = margin
+                y = margin
+                shelf_h = 0.0
             # place
-            placements.append({'id': rid, 'sheet': current_sheet, 'x': x, 'y': y, 'w': w, 'h': h, 'rotated': False, 'placed': True})
-            used_area += w * h
+            placements.append({'id': rid, 'sheet': current_sheet, 'x': x, 'y': y, 'w': w, 'h': h, 'rotated': rot, 'placed': True})
             x += w + gap
             shelf_h = max(shelf_h, h)
-        # append last sheet meta
-        sheets.append({'index': current_sheet, 'w': self.SW, 'h': self.SH})
+        # last sheet
+        yield {'index': current_sheet, 'w': self.SW, 'h': self.SH}, placements
+
+
+class MaxRectsBin:
+    """单张板的 MaxRects 空闲矩形集合，坐标为去掉边距后的板内坐标。"""
+
+    def __init__(self, width: float, height: float):
+        self.width = width
+        self.height = height
+        self.free: List[Tuple[float, float, float, float]] = [(0.0, 0.0, width, height)]
+
+    @staticmethod
+    def _score(heuristic: str, fx, fy, fw, fh, w, h):
+        dw, dh = fw - w, fh - h
+        if heuristic == 'baf':
+            return (fw * fh - w * h, min(dw, dh))
+        if heuristic == 'bl':
+            return (fy + h, fx)
+        return (min(dw, dh), max(dw, dh))
+
+    def find(self, w: float, h: float, can_rotate: bool, heuristic: str):
+        return self._find_in(self.free, w, h, can_rotate, heuristic)
+
+    @classmethod
+    def _find_in(cls, free, w: float, h: float, can_rotate: bool, heuristic: str):
+        # 返回 (score, x, y, w, h, rotated)；放不下返回 None
+        best = None
+        for fx, fy, fw, fh in free:
+            if w <= fw and h <= fh:
+                s = cls._score(heuristic, fx, fy, fw, fh, w, h)
+                if best is None or s < best[0]:
+                    best = (s, fx, fy, w, h, False)
+            if can_rotate and w != h and h <= fw and w <= fh:
+                s = cls._score(heuristic, fx, fy, fw, fh, h, w)
+                if best is None or s < best[0]:
+                    best = (s, fx, fy, h, w, True)
+        return best
+
+    def occupy(self, x: float, y: float, w: float, h: float):
+        self.free = self._split(self.free, x, y, w, h)
+
+    @classmethod
+    def _split(cls, free, x: float, y: float, w: float, h: float):
+        # 切分所有与已占区域相交的空闲矩形，再剔除被包含的矩形
+        x2, y2 = x + w, y + h
+        kept = []
+        added = []
+        for f in free:
+            fx, fy, fw, fh = f
+            fx2, fy2 = fx + fw, fy + fh
+            if x >= fx2 or x2 <= fx or y >= fy2 or y2 <= fy:
+                kept.append(f)
+                continue
+            if x > fx:
+                added.append((fx, fy, x - fx, fh))
+            if x2 < fx2:
+                added.append((x2, fy, fx2 - x2, fh))
+            if y > fy:
+                added.append((fx, fy, fw, y - fy))
+            if y2 < fy2:
+                added.append((fx, y2, fw, fy2 - y2))
+        return cls._prune(kept, added)
+
+    @staticmethod
+    def _contains(a, b):
+        return b[0] >= a[0] and b[1] >= a[1] and b[0] + b[2] <= a[0] + a[2] and b[1] + b[3] <= a[1] + a[3]
+
+    @classmethod
+    def _prune(cls, kept, added):
+        # kept 内部互不包含，只需检查新增矩形；重复的新增矩形只保留第一个
+        out = []
+        for i, r in enumerate(added):
+            if any(cls._contains(k, r) for k in kept):
+                continue
+            if any(j != i and cls._contains(o, r) and (o != r or j < i) for j, o in enumerate(added)):
+                continue
+            out.append(r)
+        if out:
+            kept = [k for k in kept if not any(cls._contains(r, k) for r in out)]
+        return kept + out
+
+
+def _box_in(b, a) -> bool:
+    # 以 (x1, y1, x2, y2) 表示的矩形 b 是否落在 a 内
+    return b[0] >= a[0] and b[1] >= a[1] and b[2] <= a[2] and b[3] <= a[3]
+
+
+class ArrayMaxRectsBin(MaxRectsBin):
+    """MaxRectsBin 的数组版本：空闲矩形存为 (F, 4) 的 NumPy 数组 (x, y, w, h)。
+
+    空闲矩形不少于 VECTOR_MIN 个时，选位打分、切分与包含关系剔除都是对整组空闲矩形的一次向量运算；
+    更少时数组运算的固定开销反而更大，转成列表走 MaxRectsBin 的逐个实现。
+    两种路径的矩形顺序与平分时的取舍相同，排版结果与 MaxRectsBin 逐位一致。
+    """
+
+    VECTOR_MIN = 256
+    SPLIT_MIN = 16
+
+    def __init__(self, width: float, height: float):
+        self.width = width
+        self.height = height
+        self.free = np.array([[0.0, 0.0, width, height]])
+        self.kept = None
+
+    def find(self, w: float, h: float, can_rotate: bool, heuristic: str):
+        if len(self.free) < self.VECTOR_MIN:
+            return self._find_in(self.free.tolist(), w, h, can_rotate, heuristic)
+        fx, fy, fw, fh = self.free.T
+        dw, dh = fw - w, fh - h
+        if heuristic == 'baf':
+            first, second = fw * fh - w * h, np.minimum(dw, dh)
+        elif heuristic == 'bl':
+            first, second = fy + h, fx
+        else:
+            first, second = np.minimum(dw, dh), np.maximum(dw, dh)
+        # 候选按 (矩形 0 原向, 矩形 0 旋转, 矩形 1 原向, ...) 交错排列，与逐个比较时的先后一致
+        a = np.full((len(fx), 2), np.inf)
+        b = np.full((len(fx), 2), np.inf)
+        fit = (dw >= 0) & (dh >= 0)
+        a[fit, 0], b[fit, 0] = first[fit], second[fit]
+        if can_rotate and w != h:
+            rw, rh = fw - h, fh - w
+            if heuristic == 'baf':
+                first, second = fw * fh - h * w, np.minimum(rw, rh)
+            elif heuristic == 'bl':
+                first = fy + w
+            else:
+                first, second = np.minimum(rw, rh), np.maximum(rw, rh)
+            rot = (rw >= 0) & (rh >= 0)
+            a[rot, 1], b[rot, 1] = first[rot], second[rot]
+        a, b = a.ravel(), b.ravel()
+        best = a.min()
+        if best == np.inf:
+            return None
+        # 主分数最小者中取次级分数最小的第一个，等同于逐个按元组严格小于比较
+        k = int(np.argmin(np.where(a == best, b, np.inf)))
+        i, rotated = divmod(k, 2)
+        pw, ph = (h, w) if rotated else (w, h)
+        return (float(a[k]), float(b[k])), float(fx[i]), float(fy[i]), pw, ph, bool(rotated)
+
+    def occupy(self, x: float, y: float, w: float, h: float):
+        # kept：切分前的空闲矩形中原样保留者（它们按原顺序排在前面，新增矩形接在后面）；None 表示未记录
+        f = self.free
+        self.kept = None
+        if len(f) < self.SPLIT_MIN:
+            self.free = np.array(self._split(f.tolist(), x, y, w, h), dtype=np.float64).reshape(-1, 4)
+            return
+        fx, fy, fw, fh = f.T
+        fx2, fy2 = fx + fw, fy + fh
+        x2, y2 = x + w, y + h
+        hit = (x < fx2) & (x2 > fx) & (y < fy2) & (y2 > fy)
+        hits = np.flatnonzero(hit)
+        if not len(hits):
+            self.kept = ~hit
+            return
+        if len(hits) > self.SPLIT_MIN:
+            self.free = self._occupy_arrays(f, hit, x, y, x2, y2)
+            return
+        # 相交的通常只有几个：切分与包含关系剔除逐个比较，只有"靠近新增矩形"的筛选对整组做一次
+        added = []
+        for hx, hy, hw, hh in f[hits].tolist():
+            hx2, hy2 = hx + hw, hy + hh
+            if x > hx:
+                added.append((hx, hy, x - hx, hh))
+            if x2 < hx2:
+                added.append((x2, hy, hx2 - x2, hh))
+            if y > hy:
+                added.append((hx, hy, hw, y - hy))
+            if y2 < hy2:
+                added.append((hx, y2, hw, hy2 - y2))
+        if not added:
+            self.free = f[~hit]
+            self.kept = ~hit
+            return
+        boxes = [(r[0], r[1], r[0] + r[2], r[1] + r[3]) for r in added]
+        lx, ly, lx2, ly2 = (min(c) for c in zip(*boxes))
+        ux, uy, ux2, uy2 = (max(c) for c in zip(*boxes))
+        rest = ~hit
+        # 可能包含某个新增矩形的旧矩形，与可能被新增矩形包含的旧矩形（落在新增矩形外包框内）
+        outer = np.flatnonzero(rest & (fx <= ux) & (fy <= uy) & (fx2 >= lx2) & (fy2 >= ly2))
+        inner = np.flatnonzero(rest & (fx >= lx) & (fy >= ly) & (fx2 <= ux2) & (fy2 <= uy2))
+        outer_boxes = [(a, b, a + c, b + d) for a, b, c, d in f[outer].tolist()]
+        out = []
+        for j, bj in enumerate(boxes):
+            if any(_box_in(bj, k) for k in outer_boxes):
+                continue
+            # 被其他新增矩形包含则丢弃；完全相同的只保留第一个
+            if any(i != j and _box_in(bj, bi) and (bi != bj or i < j) for i, bi in enumerate(boxes)):
+                continue
+            out.append(j)
+        drop = hit
+        if out and len(inner):
+            inner_boxes = [(a, b, a + c, b + d) for a, b, c, d in f[inner].tolist()]
+            gone = [k for k, bk in zip(inner.tolist(), inner_boxes) if any(_box_in(bk, boxes[j]) for j in out)]
+            if gone:
+                drop = hit.copy()
+                drop[gone] = True
+        self.free = np.concatenate([f[~drop], np.array([added[j] for j in out], dtype=np.float64).reshape(-1, 4)])
+        self.kept = ~drop
+
+    @classmethod
+    def _occupy_arrays(cls, f: np.ndarray, hit: np.ndarray, x: float, y: float, x2: float, y2: float) -> np.ndarray:
+        kept = f[~hit]
+        hit_rects = f[hit]
+        hx, hy = hit_rects[:, 0], hit_rects[:, 1]
+        hx2, hy2 = hx + hit_rects[:, 2], hy + hit_rects[:, 3]
+        # 每个相交矩形依次切出 左、右、上、下 四块，按存在与否筛掉
+        parts = np.repeat(hit_rects[:, None, :], 4, axis=1)
+        parts[:, 0, 2] = x - hx
+        parts[:, 1, 0] = x2
+        parts[:, 1, 2] = hx2 - x2
+        parts[:, 2, 3] = y - hy
+        parts[:, 3, 1] = y2
+        parts[:, 3, 3] = hy2 - y2
+        valid = np.empty((len(hx), 4), dtype=bool)
+        valid[:, 0] = x > hx
+        valid[:, 1] = x2 < hx2
+        valid[:, 2] = y > hy
+        valid[:, 3] = y2 < hy2
+        return cls._prune_arrays(kept, parts[valid])
+
+    @staticmethod
+    def _contains_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        # m[i, j]：a[i] 包含 b[j]
+        m = b[None, :, 0] >= a[:, None, 0]
+        m &= b[None, :, 1] >= a[:, None, 1]
+        m &= (b[:, 0] + b[:, 2])[None, :] <= (a[:, 0] + a[:, 2])[:, None]
+        m &= (b[:, 1] + b[:, 3])[None, :] <= (a[:, 1] + a[:, 3])[:, None]
+        return m
+
+    @classmethod
+    def _prune_arrays(cls, kept: np.ndarray, added: np.ndarray) -> np.ndarray:
+        if not len(added):
+            return kept
+        # 与新增矩形有包含关系的旧矩形必然与新增矩形的外包框相交，只在这部分里比较
+        bx, by = added[:, 0].min(), added[:, 1].min()
+        bx2, by2 = (added[:, 0] + added[:, 2]).max(), (added[:, 1] + added[:, 3]).max()
+        near = (kept[:, 0] <= bx2) & (kept[:, 1] <= by2) & (kept[:, 0] + kept[:, 2] >= bx) & (kept[:, 1] + kept[:, 3] >= by)
+        near = np.flatnonzero(near)
+        drop = cls._contains_matrix(kept[near], added).any(axis=0)
+        inside = cls._contains_matrix(added, added)
+        same = (added[:, None, :] == added[None, :, :]).all(axis=2)
+        n = len(added)
+        j, i = np.indices((n, n))
+        # 被其他新增矩形包含则丢弃；完全相同的只保留第一个
+        drop |= (inside & (j != i) & (~same | (j < i))).any(axis=0)
+        out = added[~drop]
+        if len(out) and len(near):
+            gone = near[cls._contains_matrix(out, kept[near]).any(axis=0)]
+            if len(gone):
+                kept = np.delete(kept, gone, axis=0)
+        return np.concatenate([kept, out])
+
+
+class ArrayMaxRectsBins:
+    """多板 MaxRects 的选板索引：所有板的空闲矩形镜像在同一组 NumPy 数组 (短边, 长边, 所属板) 中，
+    "第一张放得下的板" 是一次整组向量运算，不再逐板循环。放件后只增量更新镜像：
+    释放被切掉的空闲矩形所占的槽位，为新增的空闲矩形分配槽位，其余槽位不动。
+
+    板内选位与切分由各板的 ArrayMaxRectsBin 完成，决策与逐板的 MaxRectsBin 实现完全一致。
+    剩余件都放不下的空闲矩形直接丢弃（不影响任何后续决策），已满的板随之不再参与筛选。
+    """
+
+    NO_BIN = np.iinfo(np.int64).max
+    # 同尺寸提示之后新增的板不超过这个数时逐板检查，否则整组筛选
+    HINT_SCAN = 32
+
+    def __init__(self, width: float, height: float):
+        self.width = width
+        self.height = height
+        self.bins: List[ArrayMaxRectsBin] = []
+        self._grow(256)
+        self.top = 0
+        self.pool: List[int] = []
+        self.slots: List[np.ndarray] = []
+        # 剩余件中最小的面积 / 短边 / 长边（已含间距）
+        self.floor = (0.0, 0.0, 0.0)
+        # 同尺寸件上次落到的板序号：空闲矩形只会被切小，序号更小的板之后也不可能放下
+        self.hint: Dict[Tuple[float, float, bool], int] = {}
+
+    def __len__(self):
+        return len(self.bins)
+
+    def _grow(self, cap: int):
+        # 空槽位的边长为 -1，任何件都放不下
+        lo, hi, owner = np.full(cap, -1.0), np.full(cap, -1.0), np.full(cap, -1, dtype=np.int64)
+        if self.bins:
+            lo[:self.top], hi[:self.top], owner[:self.top] = self.lo[:self.top], self.hi[:self.top], self.owner[:self.top]
+        self.lo, self.hi, self.owner = lo, hi, owner
+
+    def _alloc(self, free: np.ndarray, idx: int) -> np.ndarray:
+        need = len(free)
+        reuse = min(need, len(self.pool))
+        take = self.pool[len(self.pool) - reuse:]
+        del self.pool[len(self.pool) - reuse:]
+        extra = need - reuse
+        if self.top + extra > len(self.owner):
+            self._grow(max(len(self.owner) * 2, self.top + extra))
+        take = np.array(take + list(range(self.top, self.top + extra)), dtype=np.int64)
+        self.top += extra
+        if need:
+            self.lo[take] = np.minimum(free[:, 2], free[:, 3])
+            self.hi[take] = np.maximum(free[:, 2], free[:, 3])
+            self.owner[take] = idx
+        return take
+
+    def _release(self, slots: np.ndarray):
+        if len(slots):
+            self.lo[slots] = -1.0
+            self.hi[slots] = -1.0
+            self.owner[slots] = -1
+            self.pool.extend(slots.tolist())
+
+    def _compact(self):
+        # 空槽位过半时把有效槽位挪到前面，缩短每次筛选扫描的长度
+        live = np.flatnonzero(self.owner[:self.top] >= 0)
+        n = len(live)
+        remap = np.full(self.top, -1, dtype=np.int64)
+        remap[live] = np.arange(n)
+        for v in (self.lo, self.hi, self.owner):
+            v[:n] = v[live]
+            v[n:self.top] = -1
+        self.slots = [remap[s] for s in self.slots]
+        self.top = n
+        self.pool = []
+
+    def _alive_mask(self, free: np.ndarray) -> np.ndarray:
+        min_area, min_side, min_long = self.floor
+        fw, fh = free[:, 2], free[:, 3]
+        return (fw * fh >= min_area) & (np.minimum(fw, fh) >= min_side) & (np.maximum(fw, fh) >= min_long)
+
+    def _alive(self, free: np.ndarray) -> np.ndarray:
+        return free[self._alive_mask(free)]
+
+    def open(self) -> int:
+        idx = len(self.bins)
+        self.bins.append(ArrayMaxRectsBin(self.width, self.height))
+        self.slots.append(self._alloc(self.bins[idx].free, idx))
+        return idx
+
+    def drop_last(self):
+        self.bins.pop()
+        self._release(self.slots.pop())
+
+    def set_floor(self, min_area: float, min_side: float, min_long: float):
+        self.floor = (min_area, min_side, min_long)
+        lo, hi = self.lo[:self.top], self.hi[:self.top]
+        dead = (self.owner[:self.top] >= 0) & ((lo * hi < min_area) | (lo < min_side) | (hi < min_long))
+        for idx in np.unique(self.owner[:self.top][dead]).tolist():
+            self.sync(idx, self._alive(self.bins[idx].free))
+        if len(self.pool) * 2 > self.top:
+            self._compact()
+
+    def sync(self, idx: int, free=None):
+        # 板 idx 的空闲矩形变化后重写它在数组中的镜像
+        b = self.bins[idx]
+        if free is not None:
+            b.free = free
+        self._release(self.slots[idx])
+        self.slots[idx] = self._alloc(b.free, idx)
+
+    def first_fit(self, w: float, h: float, can_rotate: bool) -> Optional[int]:
+        # 有空闲矩形放得下该件的板中序号最小的一张；没有返回 None
+        key = (w, h, can_rotate)
+        start = self.hint.get(key)
+        if start is not None and len(self.bins) - start <= self.HINT_SCAN:
+            idx = self._scan_from(start, w, h, can_rotate)
+        else:
+            idx = self._first_fit(w, h, can_rotate)
+        self.hint[key] = len(self.bins) if idx is None else idx
+        return idx
+
+    def _fits(self, idx: int, w: float, h: float, can_rotate: bool) -> bool:
+        f = self.bins[idx].free
+        if len(f) < ArrayMaxRectsBin.SPLIT_MIN:
+            return any((fw >= w and fh >= h) or (can_rotate and fw >= h and fh >= w) for fw, fh in f[:, 2:].tolist())
+        fw, fh = f[:, 2], f[:, 3]
+        fit = (fw >= w) & (fh >= h)
+        if can_rotate:
+            fit |= (fw >= h) & (fh >= w)
+        return bool(fit.any())
+
+    def _scan_from(self, start: int, w: float, h: float, can_rotate: bool) -> Optional[int]:
+        for idx in range(start, len(self.bins)):
+            if self._fits(idx, w, h, can_rotate):
+                return idx
+        return None
+
+    def _first_fit(self, w: float, h: float, can_rotate: bool) -> Optional[int]:
+        fit = self.lo[:self.top] >= min(w, h)
+        fit &= self.hi[:self.top] >= max(w, h)
+        owner = self.owner[:self.top]
+        if can_rotate:
+            idx = int(owner.min(where=fit, initial=self.NO_BIN))
+            return None if idx == self.NO_BIN else idx
+        # 不可旋转件：镜像只存短边 / 长边，按可旋转筛出候选板后再按原方向逐板确认
+        for idx in np.unique(owner[fit]).tolist():
+            if self._fits(idx, w, h, False):
+                return idx
+        return None
+
+    def place(self, idx: int, w: float, h: float, can_rotate: bool, heuristic: str):
+        b = self.bins[idx]
+        found = b.find(w, h, can_rotate, heuristic)
+        if found:
+            _, x, y, pw, ph, _ = found
+            b.occupy(x, y, pw, ph)
+            if b.kept is None:
+                self.sync(idx, self._alive(b.free) if self.floor[0] > 0 else None)
+            else:
+                self._sync_kept(idx, b.kept)
+        return found
+
+    def _sync_kept(self, idx: int, kept: np.ndarray):
+        # 只改了少数空闲矩形：释放被切掉的槽位、为新增矩形分配槽位，其余镜像不动
+        b = self.bins[idx]
+        slots = self.slots[idx]
+        self._release(slots[~kept])
+        slots = slots[kept]
+        if self.floor[0] > 0:
+            alive = self._alive_mask(b.free)
+            if not alive.all():
+                self._release(slots[~alive[:len(slots)]])
+                slots = slots[alive[:len(slots)]]
+                b.free = b.free[alive]
+        self.slots[idx] = np.concatenate([slots, self._alloc(b.free[len(slots):], idx)])
+
+
+class MaxRectsPacker:
+    """MaxRects 多板装箱：按面积降序逐件放入第一张能容纳的板，板内按启发式选位并试排 90° 旋转。
+
+    件数达到 ARRAY_MIN_PARTS 时改用 ArrayMaxRectsBins（NumPy 数组存储，结果与逐个对象的实现一致），
+    内存随件数线性增长。贪心放置逐件依赖前一件的结果，向量化的是每件对全部候选板与空闲矩形的筛选与打分，
+    耗时随件数、开板数与每板空闲矩形数增长。nesting_bench（单核、固定种子）10 万件实测：stickers 约 7 秒、
+    boards 约 6.5 秒、banners 约 17 秒（开板 4.4 万张，选板时扫描的镜像随之变长）；
+    stickers 排 3200×50000 卷材约 23 秒（每卷数百个空闲矩形，耗时主要在板内切分与剔除）。
+    """
+
+    HEURISTICS = ('bssf', 'baf', 'bl')
+    ARRAY_MIN_PARTS = 512
+    progress = None
+
+    def __init__(self, sheet_w: float, sheet_h: float, heuristic: str = 'bssf'):
+        self.SW = sheet_w
+        self.SH = sheet_h
+        self.heuristic = heuristic if heuristic in self.HEURISTICS else 'bssf'
+
+    def pack(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0, presorted: bool = False):
+        if len(rects) >= self.ARRAY_MIN_PARTS:
+            return self._pack_arrays(rects, gap, margin, presorted)
+        return self._pack_into([], 0.0, rects, gap, margin, presorted)
+
+    def _pack_arrays(self, rects: List[Rect], gap: float, margin: float, presorted: bool):
+        inner_w = self.SW - 2 * margin + gap
+        inner_h = self.SH - 2 * margin + gap
+        items = list(rects) if presorted else sorted(rects, key=lambda r: (r.w * r.h, max(r.w, r.h)), reverse=True)
+        n = len(items)
+        # 件的尺寸放进数组；剩余件的最小面积 / 短边 / 长边用后缀最小值一次算好
+        dims = np.array([(r.w, r.h) for r in items], dtype=np.float64).reshape(-1, 2) + gap
+        area_floor = np.minimum.accumulate((dims[:, 0] * dims[:, 1])[::-1])[::-1]
+        side_floor = np.minimum.accumulate(dims.min(axis=1)[::-1])[::-1]
+        long_floor = np.minimum.accumulate(dims.max(axis=1)[::-1])[::-1]
+        bins = ArrayMaxRectsBins(inner_w, inner_h)
+
+        placements: List[Dict] = []
+        used_area = 0.0
+        total_area = 0.0
+        for k, r in enumerate(items):
+            _tick(self, k, n, len(bins))
+            if k % 256 == 0:
+                bins.set_floor(float(area_floor[k]), float(side_floor[k]), float(long_floor[k]))
+            total_area += r.w * r.h
+            w, h = float(dims[k, 0]), float(dims[k, 1])
+            idx = bins.first_fit(w, h, r.rotate)
+            if idx is None:
+                idx = bins.open()
+            found = bins.place(idx, w, h, r.rotate, self.heuristic)
+            if not found:
+                # 新开的板也放不下：撤掉这张空板
+                bins.drop_last()
+                placements.append({'id': r.id, 'sheet': None, 'x': None, 'y': None, 'w': r.w, 'h': r.h, 'rotated': False, 'placed': False})
+                continue
+            _, x, y, pw, ph, rotated = found
+            pw, ph = pw - gap, ph - gap
+            placements.append({'id': r.id, 'sheet': idx + 1, 'x': x + margin, 'y': y + margin, 'w': pw, 'h': ph, 'rotated': rotated, 'placed': True})
+            used_area += pw * ph
+        sheets = [{'index': i + 1, 'w': self.SW, 'h': self.SH} for i in range(max(len(bins), 1))]
         util = used_area / (len(sheets) * self.SW * self.SH) if sheets else 0.0
         return {'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area}
 
+    def repack(self, fixed: List[Dict], rects: List[Rect], gap: float = 0.0, margin: float = 0.0, sheet_count: int = 0,
+               hits: list = None):
+        """增量排版：fixed 为已有排版中的件（保持原位，作为障碍物），只把 rects 插入剩余空闲矩形。
+
+        返回的 placements 只含新插入的件；sheets 与 utilization 覆盖全部板（含新开的板）。
+        已有排版的空闲矩形按排版缓存（CACHES['nesting']，键为板尺寸、间距、边距与按序的已放件）：
+        未命中时按序逐件占位重建（ArrayMaxRectsBin，耗时约为 已放件数 × 每板空闲矩形数）；
+        排完后把结果排版（原有件在前、新放下的件按返回顺序在后）的空闲矩形写回缓存，
+        客户端拿返回的排版继续追加时不再重建。hits 收集是否命中。
+        """
+        inner_w = self.SW - 2 * margin + gap
+        inner_h = self.SH - 2 * margin + gap
+        fixed = [p for p in fixed if p.get('placed', True) and p.get('sheet')]
+        sheet_count = max([sheet_count] + [int(p['sheet']) for p in fixed])
+        key = self._layout_key(fixed, sheet_count, gap, margin)
+        state = caches['nesting'].get(key)
+        if hits is not None:
+            hits.append(state is not None)
+        if state is not None:
+            bins, used_area = state
+        else:
+            bins = [ArrayMaxRectsBin(inner_w, inner_h) for _ in range(sheet_count)]
+            used_area = 0.0
+            for p in fixed:
+                w, h = float(p['w']), float(p['h'])
+                bins[int(p['sheet']) - 1].occupy(float(p['x']) - margin, float(p['y']) - margin, w + gap, h + gap)
+                used_area += w * h
+        out = self._pack_into(bins, used_area, rects, gap, margin, False)
+        placed = [p for p in out['placements'] if p['placed']]
+        used_area += sum(p['w'] * p['h'] for p in placed)
+        caches['nesting'].set(self._layout_key(fixed + placed, len(bins), gap, margin), (bins, used_area))
+        return out
+
+    def _layout_key(self, placements: List[Dict], sheet_count: int, gap: float, margin: float) -> str:
+        # 占位顺序影响空闲矩形的切分结果，件按原顺序参与哈希
+        canon = [self.SW, self.SH, gap, margin, sheet_count,
+                 [[int(p['sheet']), float(p['x']), float(p['y']), float(p['w']), float(p['h'])] for p in placements]]
+        raw = json.dumps(canon, separators=(',', ':'))
+        return 'nesting:layout:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _pack_into(self, bins: List[MaxRectsBin], used_area: float, rects: List[Rect], gap: float, margin: float, presorted: bool):
+        # 每件外扩一个间距，板内可用区同样外扩一个间距，等价于件与件之间保留 gap
+        inner_w = self.SW - 2 * margin + gap
+        inner_h = self.SH - 2 * margin + gap
+        # presorted：沿用调用方给定的顺序（多起点优化会传入不同顺序）
+        items = list(rects) if presorted else sorted(rects, key=lambda r: (r.w * r.h, max(r.w, r.h)), reverse=True)
+
+        placements: List[Dict] = []
+        total_area = 0.0
+        for k, r in enumerate(items):
+            _tick(self, k, len(items), len(bins))
+            total_area += r.w * r.h
+            w, h = r.w + gap, r.h + gap
+            found = None
+            for idx, b in enumerate(bins):
+                found = b.find(w, h, r.rotate, self.heuristic)
+                if found:
+                    break
+            if not found:
+                b = MaxRectsBin(inner_w, inner_h)
+                found = b.find(w, h, r.rotate, self.heuristic)
+                if not found:
+                    placements.append({'id': r.id, 'sheet': None, 'x': None, 'y': None, 'w': r.w, 'h': r.h, 'rotated': False, 'placed': False})
+                    continue
+                bins.append(b)
+                idx = len(bins) - 1
+            _, x, y, pw, ph, rotated = found
+            b.occupy(x, y, pw, ph)
+            pw, ph = pw - gap, ph - gap
+            placements.append({'id': r.id, 'sheet': idx + 1, 'x': x + margin, 'y': y + margin, 'w': pw, 'h': ph, 'rotated': rotated, 'placed': True})
+            used_area += pw * ph
+        if not bins:
+            bins.append(MaxRectsBin(inner_w, inner_h))
+        sheets = [{'index': i + 1, 'w': self.SW, 'h': self.SH} for i in range(len(bins))]
+        util = used_area / (len(sheets) * self.SW * self.SH) if sheets else 0.0
+        return {'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area}
+
+
+class SkylinePacker:
+    """Skyline 装箱：维护一条天际线逐件落位。sheet_h 为 None 时按卷材处理（长度无限），输出实际耗用长度。"""
+
+    progress = None
+
+    def __init__(self, sheet_w: float, sheet_h: float = None):
+        self.SW = sheet_w
+        self.SH = sheet_h
+
+    @staticmethod
+    def _fit(xs, ys, ws, i, w, limit_w):
+        # 从第 i 段起放宽 w 的件，返回落位高度；越界返回 None
+        x = xs[i]
+        if x + w > limit_w:
+            return None
+        y = ys[i]
+        remain = w
+        j = i
+        while remain > 0:
+            if j >= len(xs):
+                return None
+            if ys[j] > y:
+                y = ys[j]
+            remain -= ws[j]
+            j += 1
+        return y
+
+    @staticmethod
+    def _add(xs, ys, ws, x, y, w):
+        # 在 [x, x+w) 上把天际线抬到 y，并合并同高的相邻段
+        x2 = x + w
+        nx, ny, nw = [], [], []
+        for sx, sy, sw in zip(xs, ys, ws):
+            sx2 = sx + sw
+            if sx2 <= x or sx >= x2:
+                nx.append(sx); ny.append(sy); nw.append(sw)
+                continue
+            if sx < x:
+                nx.append(sx); ny.append(sy); nw.append(x - sx)
+            if sx <= x < sx2:
+                nx.append(x); ny.append(y); nw.append(w)
+            if sx2 > x2:
+                nx.append(x2); ny.append(sy); nw.append(sx2 - x2)
+        mx, my, mw = [nx[0]], [ny[0]], [nw[0]]
+        for sx, sy, sw in zip(nx[1:], ny[1:], nw[1:]):
+            if sy == my[-1]:
+                mw[-1] += sw
+            else:
+                mx.append(sx); my.append(sy); mw.append(sw)
+        xs[:], ys[:], ws[:] = mx, my, mw
+
+    def pack(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0, presorted: bool = False):
+        inner_w = self.SW - 2 * margin + gap
+        inner_h = None if self.SH is None else self.SH - 2 * margin + gap
+        items = list(rects) if presorted else sorted(rects, key=lambda r: (max(r.w, r.h), r.w * r.h), reverse=True)
+
+        bins: List[Tuple[list, list, list]] = []
+        placements: List[Dict] = []
+        used_area = 0.0
+        total_area = 0.0
+        bottom = 0.0
+        for k, r in enumerate(items):
+            _tick(self, k, len(items), len(bins) if inner_h is not None else bottom + 2 * margin)
+            total_area += r.w * r.h
+            options = [(r.w + gap, r.h + gap, False)]
+            if r.rotate and r.w != r.h:
+                options.append((r.h + gap, r.w + gap, True))
+            best = None
+            min_h = min(h for _, h, _ in options)
+            for idx, (xs, ys, ws) in enumerate(bins):
+                if inner_h is not None and min(ys) + min_h > inner_h:
+                    continue
+                for w, h, rotated in options:
+                    for i in range(len(xs)):
+                        y = self._fit(xs, ys, ws, i, w, inner_w)
+                        if y is None or (inner_h is not None and y + h > inner_h):
+                            continue
+                        key = (y + h, xs[i])
+                        if best is None or key < best[0]:
+                            best = (key, idx, i, y, w, h, rotated)
+                if best:
+                    break
+            if not best:
+                fits = [(w, h, rot) for w, h, rot in options if w <= inner_w and (inner_h is None or h <= inner_h)]
+                if not fits:
+                    placements.append({'id': r.id, 'sheet': None, 'x': None, 'y': None, 'w': r.w, 'h': r.h, 'rotated': False, 'placed': False})
+                    continue
+                # 新开一张板：取占用长度最短的方向
+                w, h, rotated = min(fits, key=lambda o: (o[1], o[0]))
+                bins.append(([0.0], [0.0], [inner_w]))
+                best = ((h, 0.0), len(bins) - 1, 0, 0.0, w, h, rotated)
+            _, idx, i, y, w, h, rotated = best
+            xs, ys, ws = bins[idx]
+            x = xs[i]
+            self._add(xs, ys, ws, x, y + h, w)
+            pw, ph = w - gap, h - gap
+            placements.append({'id': r.id, 'sheet': idx + 1, 'x': x + margin, 'y': y + margin, 'w': pw, 'h': ph, 'rotated': rotated, 'placed': True})
+            used_area += pw * ph
+            bottom = max(bottom, y + ph)
+        if self.SH is None:
+            # 卷材：耗用长度 = 最低件底边 + 两端边距
+            length = bottom + 2 * margin if placements and any(p['placed'] for p in placements) else 0.0
+            sheets = [{'index': 1, 'w': self.SW, 'h': length}]
+            util = used_area / (self.SW * length) if length > 0 else 0.0
+            return {'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area, 'length': round(length, 2)}
+        if not bins:
+            bins.append(([0.0], [0.0], [inner_w]))
+        sheets = [{'index': i + 1, 'w': self.SW, 'h': self.SH} for i in range(len(bins))]
+        util = used_area / (len(sheets) * self.SW * self.SH) if sheets else 0.0
+        return {'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area}
+
+
+class GuillotinePacker:
+    """Guillotine 装箱：每次放件都用贯穿当前余料的直刀切开，适合只能整边裁切的硬板。
+
+    同时输出裁切树：cuts 按执行顺序排列，parent 指向切出该余料的上一刀（None 表示整板）。
+    """
+
+    HEURISTICS = ('baf', 'bssf', 'blsf')
+    SPLITS = ('slas', 'llas', 'minas', 'maxas', 'sas', 'las')
+    progress = None
+
+    def __init__(self, sheet_w: float, sheet_h: float, heuristic: str = 'baf', split: str = 'slas'):
+        self.SW = sheet_w
+        self.SH = sheet_h
+        self.heuristic = heuristic if heuristic in self.HEURISTICS else 'baf'
+        self.split = split if split in self.SPLITS else 'slas'
+
+    def _split_horizontal(self, fw, fh, w, h):
+        lw, lh = fw - w, fh - h
+        if self.split == 'llas':
+            return lw > lh
+        if self.split in ('minas', 'maxas'):
+            # 横切得到 fw*lh 与 lw*h 两块，竖切得到 lw*fh 与 w*lh 两块
+            h_min = min(fw * lh, lw * h)
+            v_min = min(lw * fh, w * lh)
+            return h_min <= v_min if self.split == 'minas' else h_min > v_min
+        if self.split == 'sas':
+            return fw <= fh
+        if self.split == 'las':
+            return fw > fh
+        return lw <= lh
+
+    def _score(self, fw, fh, w, h):
+        dw, dh = fw - w, fh - h
+        if self.heuristic == 'bssf':
+            return (min(dw, dh), max(dw, dh))
+        if self.heuristic == 'blsf':
+            return (max(dw, dh), min(dw, dh))
+        return (fw * fh - w * h, min(dw, dh))
+
+    def pack(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0, presorted: bool = False):
+        inner_w = self.SW - 2 * margin + gap
+        inner_h = self.SH - 2 * margin + gap
+        half = gap / 2.0
+        items = list(rects) if presorted else sorted(rects, key=lambda r: (r.w * r.h, max(r.w, r.h)), reverse=True)
+        # 剩余件的最短边 / 最小面积（后缀最小值），用来丢弃再也放不下任何件的余料
+        n = len(items)
+        min_side = [0.0] * (n + 1)
+        min_area = [0.0] * (n + 1)
+        min_side[n] = min_area[n] = float('inf')
+        for i in range(n - 1, -1, -1):
+            r = items[i]
+            min_side[i] = min(min_side[i + 1], min(r.w, r.h) + gap)
+            min_area[i] = min(min_area[i + 1], (r.w + gap) * (r.h + gap))
+
+        # 余料按面积升序保存：(area, sheet, y, x, w, h, parent_cut)，面积不足的余料可以二分跳过
+        free: List[Tuple[float, int, float, float, float, float, int]] = []
+        cuts: List[Dict] = []
+        placements: List[Dict] = []
+        sheet_count = 0
+        used_area = 0.0
+        total_area = 0.0
+        baf = self.heuristic == 'baf'
+
+        def add_cut(sheet, axis, pos, lo, hi, parent):
+            # 刀位取在间距（刀缝）中线，起止为所切余料的实际边界
+            limit = self.SH if axis == 'x' else self.SW
+            cuts.append({
+                'id': len(cuts), 'parent': parent, 'sheet': sheet, 'axis': axis,
+                'pos': round(margin + pos - half, 3),
+                'from': round(max(margin, margin + lo - half), 3),
+                'to': round(min(limit - margin, margin + hi - half), 3),
+            })
+            return len(cuts) - 1
+
+        def add_free(sheet, x, y, w, h, parent, floor):
+            if w >= floor and h >= floor:
+                insort(free, (w * h, sheet, y, x, w, h, parent))
+
+        for k, r in enumerate(items):
+            _tick(self, k, n, sheet_count)
+            total_area += r.w * r.h
+            # 比剩余最小件还小的余料永远用不上，直接从头部丢弃
+            drop = bisect_left(free, (min_area[k],))
+            if drop:
+                del free[:drop]
+            options = [(r.w + gap, r.h + gap, False)]
+            if r.rotate and r.w != r.h:
+                options.append((r.h + gap, r.w + gap, True))
+            need = (r.w + gap) * (r.h + gap)
+            best = None
+            for fi in range(bisect_left(free, (need,)), len(free)):
+                area, fs, fy, fx, fw, fh, _ = free[fi]
+                if baf and best is not None and area > best[0][0][0] + need:
+                    # 面积升序：此后余料的 BAF 分数只会更差
+                    break
+                if fw < min_side[k] or fh < min_side[k]:
+                    continue
+                for w, h, rotated in options:
+                    if w <= fw and h <= fh:
+                        key = (self._score(fw, fh, w, h), fs, fy, fx)
+                        if best is None or key < best[0]:
+                            best = (key, fi, w, h, rotated)
+            if best is None:
+                fits = [o for o in options if o[0] <= inner_w and o[1] <= inner_h]
+                if not fits:
+                    placements.append({'id': r.id, 'sheet': None, 'x': None, 'y': None, 'w': r.w, 'h': r.h, 'rotated': False, 'placed': False})
+                    continue
+                sheet_count += 1
+                w, h, rotated = min(fits, key=lambda o: self._score(inner_w, inner_h, o[0], o[1]))
+                fs, fx, fy, fw, fh, parent = sheet_count, 0.0, 0.0, inner_w, inner_h, None
+            else:
+                _, fi, w, h, rotated = best
+                _, fs, fy, fx, fw, fh, parent = free.pop(fi)
+            lw, lh = fw - w, fh - h
+            floor = min_side[k + 1]
+            if self._split_horizontal(fw, fh, w, h):
+                c1 = add_cut(fs, 'y', fy + h, fx, fx + fw, parent) if lh > 0 else parent
+                c2 = add_cut(fs, 'x', fx + w, fy, fy + h, c1) if lw > 0 else c1
+                if lh > 0:
+                    add_free(fs, fx, fy + h, fw, lh, c1, floor)
+                if lw > 0:
+                    add_free(fs, fx + w, fy, lw, h, c2, floor)
+            else:
+                c1 = add_cut(fs, 'x', fx + w, fy, fy + fh, parent) if lw > 0 else parent
+                c2 = add_cut(fs, 'y', fy + h, fx, fx + w, c1) if lh > 0 else c1
+                if lw > 0:
+                    add_free(fs, fx + w, fy, lw, fh, c1, floor)
+                if lh > 0:
+                    add_free(fs, fx, fy + h, w, lh, c2, floor)
+            pw, ph = w - gap, h - gap
+            placements.append({'id': r.id, 'sheet': fs, 'x': fx + margin, 'y': fy + margin, 'w': pw, 'h': ph, 'rotated': rotated, 'placed': True})
+            used_area += pw * ph
+        sheet_count = max(sheet_count, 1)
+        sheets = [{'index': i + 1, 'w': self.SW, 'h': self.SH} for i in range(sheet_count)]
+        util = used_area / (len(sheets) * self.SW * self.SH) if sheets else 0.0
+        return {'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area, 'cuts': cuts}
+
+
+def _polygon_area(pts) -> float:
+    area = 0.0
+    for i in range(len(pts)):
+        x1, y1 = pts[i]
+        x2, y2 = pts[(i + 1) % len(pts)]
+        area += x1 * y2 - x2 * y1
+    return abs(area) / 2.0
+
+
+class PolygonPacker:
+    """真实外形排版：把凸包多边形按 resolution（mm/格）光栅化，在列高度轮廓上做左下重力落位。
+
+    每个外形在每个允许角度下的光栅与轮廓只计算一次（按多边形缓存），同一任务里的重复外形直接复用。
+    结果只取决于输入顺序与参数，相同输入得到相同排版。
+    """
+
+    progress = None
+
+    def __init__(self, sheet_w: float, sheet_h: float, rotations=(0, 90, 180, 270), resolution: float = None):
+        self.SW = sheet_w
+        self.SH = sheet_h
+        self.rotations = tuple(dict.fromkeys(float(a) % 360 for a in rotations)) or (0.0,)
+        self.res = float(resolution) if resolution else max(0.5, max(sheet_w, sheet_h) / 1000.0)
+        self._cache: Dict[Tuple, List[Dict]] = {}
+        self.cache_hits = 0
+
+    @staticmethod
+    def _rotate(pts, angle):
+        rad = math.radians(angle)
+        c, s = round(math.cos(rad), 12), round(math.sin(rad), 12)
+        return [(x * c - y * s, x * s + y * c) for x, y in pts]
+
+    def _shape(self, poly, gap):
+        # 返回各角度下的光栅轮廓：top/bot 为每列最上/最下占用格，空列 top 置为极大值
+        key = (poly, gap)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        res = self.res
+        # 外扩半径：gap/2 再加半格以上的光栅余量，保证件间距与边距不被栅格误差吃掉
+        grow = int(math.ceil(gap / (2.0 * res))) + 1
+        pad = (grow + 1) * res
+        variants = []
+        for angle in self.rotations:
+            pts = self._rotate(poly, angle)
+            minx = min(x for x, _ in pts)
+            miny = min(y for _, y in pts)
+            bw = max(x for x, _ in pts) - minx
+            bh = max(y for _, y in pts) - miny
+            cols = int(math.ceil((bw + 2 * pad) / res)) + 1
+            rows = int(math.ceil((bh + 2 * pad) / res)) + 1
+            img = Image.new('L', (cols, rows), 0)
+            scaled = [((x - minx + pad) / res, (y - miny + pad) / res) for x, y in pts]
+            ImageDraw.Draw(img).polygon(scaled, fill=255)
+            img = img.filter(ImageFilter.MaxFilter(2 * grow + 1))
+            mask = np.asarray(img, dtype=bool)
+            ys, xs = np.nonzero(mask)
+            r0, r1, c0, c1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+            mask = mask[r0:r1, c0:c1]
+            filled = mask.any(axis=0)
+            top = np.where(filled, mask.argmax(axis=0), 1 << 30)
+            bot = np.where(filled, mask.shape[0] - 1 - mask[::-1].argmax(axis=0), -1)
+            variants.append({
+                'angle': angle, 'top': top, 'bot': bot, 'rows': mask.shape[0], 'cols': mask.shape[1],
+                # 多边形包围盒左上角相对裁剪后光栅左上角的偏移（mm）
+                'off': (pad - int(c0) * res, pad - int(r0) * res), 'origin': (minx, miny), 'bw': bw, 'bh': bh,
+            })
+        self._cache[key] = variants
+        return variants
+
+    def _drop(self, heights, v, limit_rows):
+        # 所有列偏移一次性求落位高度：y(x) = max_c(H[x+c] - top[c])
+        cols = v['cols']
+        if cols > heights.shape[0]:
+            return None
+        win = sliding_window_view(heights, cols)
+        ys = np.maximum((win - v['top']).max(axis=1), 0)
+        bottoms = ys + v['rows']
+        ok = bottoms <= limit_rows
+        if not ok.any():
+            return None
+        score = np.where(ok, bottoms, np.iinfo(np.int64).max)
+        x = int(score.argmin())
+        return int(score[x]), x, int(ys[x])
+
+    def pack(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0):
+        res = self.res
+        grid_w = int((self.SW - 2 * margin + gap) / res)
+        grid_h = int((self.SH - 2 * margin + gap) / res)
+        origin = margin - gap / 2.0
+        shapes = []
+        for r in rects:
+            poly = r.poly or ((0.0, 0.0), (r.w, 0.0), (r.w, r.h), (0.0, r.h))
+            shapes.append((_polygon_area(poly), poly, r))
+        # 面积降序，稳定排序保证同输入同结果
+        shapes.sort(key=lambda t: t[0], reverse=True)
+
+        sheets_h: List[np.ndarray] = []
+        placements: List[Dict] = []
+        used_area = 0.0
+        total_area = 0.0
+        for k, (area, poly, r) in enumerate(shapes):
+            _tick(self, k, len(shapes), len(sheets_h))
+            total_area += area
+            variants = self._shape(poly, gap)
+            if not r.rotate:
+                variants = [v for v in variants if v['angle'] == 0.0] or variants[:1]
+            best = None
+            for idx, heights in enumerate(sheets_h):
+                for v in variants:
+                    found = self._drop(heights, v, grid_h)
+                    if found and (best is None or found[:2] < best[0][:2]):
+                        best = (found, idx, v)
+                if best:
+                    break
+            if best is None:
+                fresh = np.zeros(grid_w, dtype=np.int64)
+                for v in variants:
+                    found = self._drop(fresh, v, grid_h)
+                    if found and (best is None or found[:2] < best[0][:2]):
+                        best = (found, len(sheets_h), v)
+                if best is None:
+                    placements.append({'id': r.id, 'sheet': None, 'x': None, 'y': None, 'w': r.w, 'h': r.h, 'rotated': False, 'placed': False})
+                    continue
+                sheets_h.append(fresh)
+            (_, gx, gy), idx, v = best
+            heights = sheets_h[idx]
+            seg = heights[gx:gx + v['cols']]
+            np.maximum(seg, np.where(v['bot'] >= 0, gy + v['bot'] + 1, 0), out=seg)
+            # 件坐标 p 落到板上：R(angle)·p + (tx, ty)
+            bx = origin + gx * res + v['off'][0]
+            by = origin + gy * res + v['off'][1]
+            tx, ty = bx - v['origin'][0], by - v['origin'][1]
+            placed_poly = [[round(x + tx, 2), round(y + ty, 2)] for x, y in self._rotate(poly, v['angle'])]
+            placements.append({
+                'id': r.id, 'sheet': idx + 1, 'x': round(bx, 2), 'y': round(by, 2),
+                'w': round(v['bw'], 2), 'h': round(v['bh'], 2),
+                'rotated': v['angle'] != 0.0, 'rotation': v['angle'], 'placed': True,
+                'transform': {'rotation': v['angle'], 'tx': round(tx, 3), 'ty': round(ty, 3)},
+                'polygon': placed_poly,
+            })
+            used_area += area
+        sheets = [{'index': i + 1, 'w': self.SW, 'h': self.SH} for i in range(max(len(sheets_h), 1))]
+        util = used_area / (len(sheets) * self.SW * self.SH) if sheets else 0.0
+        return {
+            'sheets': sheets, 'placements': placements, 'utilization': round(util, 4), 'totalArea': total_area,
+            'resolution': res, 'shapeCache': {'shapes': len(self._cache), 'hits': self.cache_hits},
+        }
+
+
+class PatternStamper:
+    """数量感知的阵列排版：同一件只计算一次最优行列阵列，输出重复描述（原点、步距、行列数）而不是逐件坐标。
+
+    整板按阵列铺满，余下不足一整板的件按整行 / 末行切成块，交给 remainder 排版器与其他件的余块合板。
+    响应大小与不同件数成正比，与总数量无关。
+    """
+
+    def __init__(self, sheet_w: float, sheet_h: float, remainder=None):
+        self.SW = sheet_w
+        self.SH = sheet_h
+        self.remainder = remainder or MaxRectsPacker(sheet_w, sheet_h)
+
+    @staticmethod
+    def _pattern(inner_w, inner_h, w, h, rotate):
+        # 主阵列 + 右侧或下方余条里的旋转阵列，取单板数量最多者；返回 [(ox, oy, px, py, cols, rows, rotated)]
+        best = []
+        best_n = 0
+        orients = [(w, h, False)] + ([(h, w, True)] if rotate and w != h else [])
+        for pw, ph, rot in orients:
+            cols, rows = int(inner_w // pw), int(inner_h // ph)
+            if cols < 1 or rows < 1:
+                continue
+            main = (0.0, 0.0, pw, ph, cols, rows, rot)
+            options = [[main]]
+            for qw, qh, qrot in orients:
+                if qrot == rot:
+                    continue
+                # 右侧余条
+                c2, r2 = int((inner_w - cols * pw) // qw), int(inner_h // qh)
+                if c2 > 0 and r2 > 0:
+                    options.append([main, (cols * pw, 0.0, qw, qh, c2, r2, qrot)])
+                # 下方余条
+                c3, r3 = int(inner_w // qw), int((inner_h - rows * ph) // qh)
+                if c3 > 0 and r3 > 0:
+                    options.append([main, (0.0, rows * ph, qw, qh, c3, r3, qrot)])
+            for grids in options:
+                n = sum(g[4] * g[5] for g in grids)
+                if n > best_n:
+                    best, best_n = grids, n
+        return best, best_n
+
+    def pack(self, items: List[Tuple[str, float, float, int, bool]], gap: float = 0.0, margin: float = 0.0):
+        inner_w = self.SW - 2 * margin + gap
+        inner_h = self.SH - 2 * margin + gap
+        repeats: List[Dict] = []
+        unplaced: List[Dict] = []
+        blocks: List[Rect] = []
+        block_meta: Dict[str, Dict] = {}
+        sheet_no = 0
+        used_area = 0.0
+        total_area = 0.0
+        placed_count = 0
+
+        def grid_desc(iid, w, h, start, stride, sheet, count, ox, oy, g, cols, rows):
+            _, _, px, py, _, _, rot = g
+            return {
+                'id': iid, 'sheet': sheet, 'sheetCount': count, 'origin': [round(ox, 3), round(oy, 3)],
+                'pitch': [round(px, 3), round(py, 3)], 'count': [cols, rows],
+                'w': h if rot else w, 'h': w if rot else h, 'rotated': rot, 'start': start, 'stride': stride,
+            }
+
+        for iid, w, h, qty, rotate in items:
+            total_area += w * h * qty
+            # 尺寸非正的件无法排（gap 为 0 时步距为 0 会除零），与其他排版器一样记为未放置
+            if w <= 0 or h <= 0:
+                unplaced.append({'id': iid, 'qty': qty, 'w': w, 'h': h})
+                continue
+            grids, per_sheet = self._pattern(inner_w, inner_h, w + gap, h + gap, rotate)
+            if per_sheet == 0:
+                unplaced.append({'id': iid, 'qty': qty, 'w': w, 'h': h})
+                continue
+            full, rem = divmod(qty, per_sheet)
+            if full:
+                start = 0
+                for g in grids:
+                    repeats.append(grid_desc(iid, w, h, start, per_sheet, sheet_no + 1, full, margin + g[0], margin + g[1], g, g[4], g[5]))
+                    start += g[4] * g[5]
+                sheet_no += full
+            # 余数：按阵列顺序切成整行块与末行块
+            start = full * per_sheet
+            for g in grids:
+                if rem <= 0:
+                    break
+                _, _, px, py, cols, rows, rot = g
+                k = min(rem, cols * rows)
+                r_full, tail = divmod(k, cols)
+                for bcols, brows in ((cols, r_full), (tail, 1)):
+                    if bcols and brows:
+                        bid = f'{len(block_meta)}'
+                        block_meta[bid] = {'item': (iid, w, h), 'g': g, 'cols': bcols, 'rows': brows, 'start': start}
+                        blocks.append(Rect(w=bcols * px - gap, h=brows * py - gap, id=bid, rotate=False))
+                        start += bcols * brows
+                rem -= k
+            used_area += w * h * (qty - rem)
+            placed_count += qty - rem
+        if blocks:
+            out = self.remainder.pack(blocks, gap=gap, margin=margin)
+            for pl in out['placements']:
+                meta = block_meta[pl['id']]
+                iid, w, h = meta['item']
+                if not pl['placed']:
+                    n = meta['cols'] * meta['rows']
+                    unplaced.append({'id': iid, 'qty': n, 'w': w, 'h': h})
+                    used_area -= w * h * n
+                    placed_count -= n
+                    continue
+                repeats.append(grid_desc(iid, w, h, meta['start'], 0, sheet_no + pl['sheet'], 1, pl['x'], pl['y'], meta['g'], meta['cols'], meta['rows']))
+            sheet_no += len(out['sheets'])
+        sheet_count = max(sheet_no, 1)
+        util = used_area / (sheet_count * self.SW * self.SH)
+        return {
+            'mode': 'stamp', 'sheet': {'w': self.SW, 'h': self.SH}, 'sheetCount': sheet_count,
+            'repeats': repeats, 'unplaced': unplaced, 'placedCount': placed_count,
+            'utilization': round(util, 4), 'totalArea': total_area,
+        }
+
+
+PACKERS = {
+    'shelf': ShelfPacker,
+    'maxrects': MaxRectsPacker,
+    'skyline': SkylinePacker,
+    'guillotine': GuillotinePacker,
+    'polygon': PolygonPacker,
+}
+# 卷材模式（高度不限）仅 skyline 支持
+ROLL_PACKERS = ('skyline',)
+# 硬板（KT板 / PVC板）只能整边直切，byCategory 下自动改用 guillotine
+RIGID_BOARD_CATEGORIES = ('kt_board', 'pvc_board')
+
+
+def _make_packer(algorithm: str, sheet_w: float, sheet_h: float, heuristic: str = 'bssf', split: str = 'slas',
+                 rotations=(0, 90, 180, 270), resolution: float = None):
+    if algorithm == 'maxrects':
+        return MaxRectsPacker(sheet_w, sheet_h, heuristic=heuristic)
+    if algorithm == 'skyline':
+        return SkylinePacker(sheet_w, sheet_h)
+    if algorithm == 'guillotine':
+        return GuillotinePacker(sheet_w, sheet_h, heuristic=heuristic, split=split)
+    if algorithm == 'polygon':
+        return PolygonPacker(sheet_w, sheet_h, rotations=rotations, resolution=resolution)
+    return ShelfPacker(sheet_w, sheet_h)
+
+
+def _layout_score(out) -> Tuple:
+    # 越小越好：未放下件数、板数（卷材为长度）、最后一张板的占用面积（越少说明前面的板排得越满）
+    placed = [p for p in out['placements'] if p['placed']]
+    unplaced = len(out['placements']) - len(placed)
+    if 'length' in out:
+        return (unplaced, out['length'], 0.0)
+    last = len(out['sheets'])
+    return (unplaced, last, round(sum(p['w'] * p['h'] for p in placed if p['sheet'] == last), 3))
+
+
+ORDER_KEYS = {
+    'area': lambda r: r.w * r.h,
+    'maxside': lambda r: max(r.w, r.h),
+    'perimeter': lambda r: r.w + r.h,
+    'width': lambda r: r.w,
+    'height': lambda r: r.h,
+}
+
+
+def _candidate_order(rects: List[Rect], order: str, noise_seed: Optional[int]) -> List[Rect]:
+    key = ORDER_KEYS[order]
+    if noise_seed is None:
+        return sorted(rects, key=key, reverse=True)
+    # 排序键乘以随机扰动，得到“大体由大到小、局部打乱”的顺序
+    rng = random.Random(noise_seed)
+    noisy = [(key(r) * rng.uniform(0.7, 1.3), i) for i, r in enumerate(rects)]
+    noisy.sort(reverse=True)
+    return [rects[i] for _, i in noisy]
+
+
+def _optimize_batch(spec, rect_rows, candidates, deadline):
+    """进程池任务：依次评估一批候选，超过 deadline 立即停止。返回各候选得分与本批最优排版。"""
+    sheet_w, sheet_h, gap, margin = spec
+    rects = [Rect(w=w, h=h, id=rid, rotate=rot) for w, h, rid, rot in rect_rows]
+    scores = []
+    best = None
+    for idx, (alg, heuristic, split, order, noise_seed) in candidates:
+        if time.time() > deadline:
+            break
+        packer = _make_packer(alg, sheet_w, sheet_h, heuristic, split)
+        out = packer.pack(_candidate_order(rects, order, noise_seed), gap=gap, margin=margin, presorted=True)
+        score = _layout_score(out)
+        scores.append((idx, score))
+        if best is None or (score, idx) < (best[0], best[1]):
+            best = (score, idx, out)
+    return scores, best
+
+
+class MultiStartOptimizer:
+    """多起点排版优化：在时间预算内用进程池并行评估多种件序与启发式，返回得分最好的排版。
+
+    候选 i 完全由 (seed, i) 决定：前若干个是各启发式 × 固定排序，之后是带随机扰动的排序。
+    最终只在连续评估完成的前缀 [0, evaluated) 中取最优（同分取序号小者）。
+    给定 iterations 时固定评估前 iterations 个候选，time_budget_ms 不再截断，同一 seed 的结果可复现；
+    此时只有超过 NESTING_MAX_TIME_BUDGET_MS 才会截断，结果中 complete 为 False。
+    """
+
+    BATCH = 8
+    # 指定 seed 而未指定 iterations 时评估的候选数
+    SEEDED_ITERATIONS = 32
+    # 有撤销标志时，等待进程池结果的最长间隔（秒），以便及时响应撤销
+    CANCEL_POLL = 0.2
+
+    def __init__(self, sheet_w: float, sheet_h: Optional[float], algorithm: str, heuristic: str = 'bssf', split: str = 'slas',
+                 time_budget_ms: int = 2000, seed: int = 0, iterations: Optional[int] = None, cancel=None, progress=None):
+        self.SW = sheet_w
+        self.SH = sheet_h
+        self.seed = int(seed)
+        self.time_budget_ms = int(time_budget_ms)
+        self.iterations = iterations
+        # cancel：可选的撤销标志（threading.Event 或 tasks.JobCancelFlag 等带 is_set() 的对象），
+        # 置位后不再派发新批次并撤销排队中的任务，返回已评估候选中的最优
+        self.cancel = cancel
+        self.progress = progress
+        # 只在所请求的算法内搜索（启发式 × 件序），结果的 algorithm 与请求一致
+        if algorithm == 'guillotine':
+            self.variants = [('guillotine', h, sp) for h in GuillotinePacker.HEURISTICS for sp in ('slas', 'minas', 'sas', 'llas')]
+        elif algorithm == 'maxrects':
+            self.variants = [('maxrects', h, split) for h in MaxRectsPacker.HEURISTICS]
+        else:
+            self.variants = [(algorithm, heuristic, split)]
+
+    def candidate(self, i: int):
+        orders = list(ORDER_KEYS)
+        alg, heuristic, split = self.variants[i % len(self.variants)]
+        fixed = len(self.variants) * len(orders)
+        if i < fixed:
+            return (alg, heuristic, split, orders[i // len(self.variants)], None)
+        noise_seed = self.seed * 1000003 + i
+        order = orders[random.Random(noise_seed).randrange(len(orders))]
+        return (alg, heuristic, split, order, noise_seed)
+
+    def _cancelled(self):
+        return self.cancel is not None and self.cancel.is_set()
+
+    def _next_batch(self, start):
+        end = start + self.BATCH
+        if self.iterations is not None:
+            end = min(end, self.iterations)
+        return [(i, self.candidate(i)) for i in range(start, end)], end
+
+    def run(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0):
+        started = time.time()
+        # 固定候选数时时间预算不截断（结果可复现），只受全局上限保护
+        budget_ms = settings.NESTING_MAX_TIME_BUDGET_MS if self.iterations is not None else self.time_budget_ms
+        deadline = started + budget_ms / 1000.0
+        spec = (self.SW, self.SH, gap, margin)
+        rows = [(r.w, r.h, r.id, r.rotate) for r in rects]
+        scores: Dict[int, Tuple] = {}
+        layouts: Dict[int, Dict] = {}
+
+        def collect(result):
+            batch_scores, best = result
+            scores.update(batch_scores)
+            if best is not None:
+                layouts[best[1]] = best[2]
+            if self.progress is not None:
+                done = len(scores) / self.iterations if self.iterations else (time.time() - started) * 1000 / self.time_budget_ms
+                self.progress(min(done, 1.0))
+
+        def more(nxt):
+            return (self.iterations is None or nxt < self.iterations) and time.time() < deadline and not self._cancelled()
+
+        nxt = 0
+        pool = get_pool()
+        if pool is None:
+            while more(nxt):
+                batch, nxt = self._next_batch(nxt)
+                collect(_optimize_batch(spec, rows, batch, deadline))
+        else:
+            inflight = set()
+            try:
+                while True:
+                    while len(inflight) < 2 * pool_size() and more(nxt):
+                        batch, nxt = self._next_batch(nxt)
+                        inflight.add(pool.submit(_optimize_batch, spec, rows, batch, deadline))
+                    if not inflight:
+                        break
+                    timeout = max(0.0, deadline - time.time())
+                    if self.cancel is not None:
+                        timeout = min(timeout, self.CANCEL_POLL)
+                    done, inflight = wait(inflight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        collect(fut.result())
+                    if self._cancelled() or (not done and time.time() >= deadline):
+                        break
+            except BrokenProcessPool:
+                reset_pool()
+                raise
+            finally:
+                # 请求级撤销：未开始的批次直接取消；已在执行的批次会在下一个候选前因 deadline 退出
+                for fut in inflight:
+                    fut.cancel()
+
+        evaluated = 0
+        while evaluated in scores:
+            evaluated += 1
+        if evaluated == 0:
+            # 预算过小一个候选都没跑完：退回默认排序的第一个候选
+            batch, _ = self._next_batch(0)
+            collect(_optimize_batch(spec, rows, batch[:1], float('inf')))
+            evaluated = 1
+        best_idx = min(range(evaluated), key=lambda i: (scores[i], i))
+        out = layouts.get(best_idx)
+        if out is None:
+            # 最优候选不是所在批次的最优（前缀截断），在本进程内按同一候选重算
+            _, best = _optimize_batch(spec, rows, [(best_idx, self.candidate(best_idx))], float('inf'))
+            out = best[2]
+        alg, heuristic, split, order, noise_seed = self.candidate(best_idx)
+        out['optimizer'] = {
+            'seed': self.seed, 'evaluated': evaluated, 'timeBudgetMs': self.time_budget_ms, 'iterations': self.iterations,
+            # 固定候选数全部评估完成（可复现）；按时间预算运行时恒为 False
+            'complete': self.iterations is not None and evaluated >= self.iterations,
+            'cancelled': self._cancelled(),
+            'elapsedMs': round((time.time() - started) * 1000, 1),
+            'best': {'index': best_idx, 'algorithm': alg, 'heuristic': heuristic, 'split': split, 'order': order, 'randomized': noise_seed is not None},
+        }
+        out['algorithm'] = alg
+        return out
+
+
+class _RaceStopped(Exception):
+    pass
+
+
+def _race_contender(spec, rect_rows, alg: str, heuristic: str, split: str, deadline: float, stop, best):
+    """进程池任务：跑一个参赛算法，返回 (排版, 用时, 状态)。
+
+    每 512 件检查一次：过了截止时间返回状态 timeout；stop 已置位，或已用板数（卷材为长度）超过
+    best.value（已完成且全部放下的最好成绩），即不可能再胜出，返回状态 cancelled。
+    stop 与 best 在进程池中为 Manager 的 Event / Value 代理，在本进程内为 threading.Event 与普通对象。
+    """
+    sheet_w, sheet_h, gap, margin = spec
+    rects = [Rect(w=w, h=h, id=rid, rotate=rot) for w, h, rid, rot in rect_rows]
+    packer = _make_packer(alg, sheet_w, sheet_h, heuristic, split)
+
+    def check(_):
+        if time.time() > deadline:
+            raise _RaceStopped('timeout')
+        # 长度按两位小数比较成绩，留出舍入余量
+        if stop.is_set() or packer.used > best.value + 0.01:
+            raise _RaceStopped('cancelled')
+
+    packer.progress = check
+    t0 = time.perf_counter()
+    try:
+        out, status = packer.pack(rects, gap=gap, margin=margin), None
+    except _RaceStopped as exc:
+        out, status = None, str(exc)
+    finally:
+        # packer 与 check 互相引用：断开后 stop / best 代理随任务结束立即释放，不必等垃圾回收
+        packer.progress = None
+    return out, round((time.perf_counter() - t0) * 1000, 1), status
+
+
+class _Best:
+    # 本进程内串行竞赛时 best 的替身，与 Manager().Value 一样只用 value 属性
+    def __init__(self, value: float):
+        self.value = value
+
+
+class PortfolioRace:
+    """algorithm=auto：多个排版算法在同一截止时间下并行计算，取最好的排版并附带各算法的成绩表。
+
+    排名：未放下件数少者优先，其次板数（卷材为长度）少、利用率高，完全相同时用时短者胜。
+    某个算法全部放下后，其成绩（板数或长度）共享给其余参赛者：已用板数超过它的算法不可能再胜出，
+    在下一次检查时自行停止；达到面积下界（板数 = ceil(件总面积 / 单板面积)）时其余算法全部叫停。
+    截止时间到了仍未完成的同样停止。shelf 作为保底不受截止时间限制，保证总有结果。
+    """
+
+    CONTENDERS = ('shelf', 'maxrects', 'skyline', 'guillotine')
+
+    def __init__(self, sheet_w: float, sheet_h: Optional[float], heuristic: str = 'bssf', split: str = 'slas',
+                 time_budget_ms: int = 2000):
+        self.SW = sheet_w
+        self.SH = sheet_h
+        self.split = split
+        self.time_budget_ms = int(time_budget_ms)
+        self.contenders = [a for a in self.CONTENDERS if sheet_h is not None or a in ROLL_PACKERS]
+        self.heuristics = {
+            'maxrects': heuristic if heuristic in MaxRectsPacker.HEURISTICS else 'bssf',
+            'guillotine': heuristic if heuristic in GuillotinePacker.HEURISTICS else 'baf',
+        }
+
+    @staticmethod
+    def _rank(out, elapsed_ms: float) -> Tuple:
+        unplaced, size, _ = _layout_score(out)
+        return (unplaced, size, -out['utilization'], elapsed_ms)
+
+    def _lower_bound(self, rects: List[Rect], gap: float, margin: float) -> Optional[int]:
+        if self.SH is None:
+            return None
+        inner = (self.SW - 2 * margin + gap) * (self.SH - 2 * margin + gap)
+        area = sum((r.w + gap) * (r.h + gap) for r in rects)
+        return max(1, math.ceil(area / inner - 1e-9)) if inner > 0 else None
+
+    def run(self, rects: List[Rect], gap: float = 0.0, margin: float = 0.0):
+        started = time.time()
+        deadline = started + self.time_budget_ms / 1000.0
+        spec = (self.SW, self.SH, gap, margin)
+        rows = [(r.w, r.h, r.id, r.rotate) for r in rects]
+        bound = self._lower_bound(rects, gap, margin)
+        results: Dict[str, Tuple] = {}
+        pool = get_pool()
+        if pool is None:
+            stop, best = threading.Event(), _Best(float('inf'))
+        else:
+            manager = get_manager()
+            stop, best = manager.Event(), manager.Value('d', float('inf'))
+
+        def args(alg):
+            # shelf 为保底，不受截止时间限制
+            return (spec, rows, alg, self.heuristics.get(alg, 'bssf'), self.split,
+                    float('inf') if alg == 'shelf' else deadline, stop, best)
+
+        def finished(alg, res):
+            # 记录成绩；全部放下时更新共享的最好成绩，达到下界时返回 True
+            results[alg] = res
+            out = res[0]
+            if out is None:
+                return False
+            unplaced, size, _ = _layout_score(out)
+            if unplaced == 0 and size < best.value:
+                best.value = size
+            return bound is not None and (unplaced, size) == (0, bound)
+
+        try:
+            if pool is None:
+                for alg in self.contenders:
+                    if stop.is_set():
+                        results[alg] = (None, 0.0, 'cancelled')
+                    elif finished(alg, _race_contender(*args(alg))):
+                        stop.set()
+            else:
+                futures = {pool.submit(_race_contender, *args(alg)): alg for alg in self.contenders}
+                pending = set(futures)
+                try:
+                    while pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for fut in done:
+                            if fut.cancelled():
+                                results[futures[fut]] = (None, 0.0, 'cancelled')
+                            elif finished(futures[fut], fut.result()):
+                                stop.set()
+                                for other in pending:
+                                    other.cancel()
+                except BrokenProcessPool:
+                    reset_pool()
+                    raise
+        finally:
+            # 任何路径退出都置位，仍在运行的参赛者在下一次检查时结束，不再占用进程池
+            stop.set()
+
+        ranked = sorted((self._rank(res[0], res[1]), alg) for alg, res in results.items() if res[0] is not None)
+        winner = ranked[0][1]
+        places = {alg: k + 1 for k, (_, alg) in enumerate(ranked)}
+        board = []
+        for alg in self.contenders:
+            out, elapsed, status = results.get(alg, (None, 0.0, 'cancelled'))
+            row = {'algorithm': alg, 'elapsedMs': elapsed}
+            if alg in self.heuristics:
+                row['heuristic'] = self.heuristics[alg]
+            if out is None:
+                # cancelled：已不可能胜出被叫停；timeout：截止时间内未完成
+                row['status'] = status
+            else:
+                score = _layout_score(out)
+                row.update(status='won' if alg == winner else 'finished', rank=places[alg], utilization=out['utilization'],
+                           unplaced=score[0], **({'length': out['length']} if 'length' in out else {'sheets': len(out['sheets'])}))
+            board.append(row)
+        out = results[winner][0]
+        out['algorithm'] = winner
+        out['portfolio'] = {
+            'winner': winner, 'lowerBound': bound, 'timeBudgetMs': self.time_budget_ms,
+            'elapsedMs': round((time.time() - started) * 1000, 1), 'contenders': board,
+        }
+        return out
+
+
+def _item_poly(it, w: float, h: float):
+    # hull 来自 /nesting/vectorize（原图像素坐标）；hullSize 给出该坐标系的宽高，缺省视为与 w/h 相同
+    hull = it.get('hull')
+    if not hull or len(hull) < 3:
+        return None
+    size = it.get('hullSize') or [w, h]
+    sx = w / float(size[0] or w or 1)
+    sy = h / float(size[1] or h or 1)
+    return tuple((round(float(x) * sx, 3), round(float(y) * sy, 3)) for x, y in hull)
+
+
+def _build_stamp_items(items) -> List[Tuple[str, float, float, int, bool]]:
+    # 阵列模式不展开数量，每个不同件只保留一条
+    return [(
+        str(it.get('id') or 'item'),
+        float(it.get('w') or it.get('width') or 0),
+        float(it.get('h') or it.get('height') or 0),
+        int(it.get('qty') or 1),
+        bool(it.get('rotate', True)),
+    ) for it in items]
+
+
+def _build_rects(items, with_poly: bool = False) -> List[Rect]:
+    rects: List[Rect] = []
+    for it in items:
+        qty = int(it.get('qty') or 1)
+        w = float(it.get('w') or it.get('width') or 0)
+        h = float(it.get('h') or it.get('height') or 0)
+        poly = _item_poly(it, w, h) if with_poly else None
+        for i in range(qty):
+            rects.append(Rect(
+                w=w,
+                h=h,
+                id=f"{it.get('id') or 'item'}-{i}",
+                rotate=bool(it.get('rotate', True)),
+                poly=poly,
+            ))
+    return rects
+
+
+def parse_cut_options(raw, fail) -> Dict:
+    """切割顺序参数：true 使用默认值，或 {home, direction, timeLimitMs, returnHome, travelSpeed}。"""
+    raw = raw if isinstance(raw, dict) else {}
+    try:
+        home = [float(v) for v in (raw.get('home') or [0, 0])][:2]
+        time_limit = float(raw.get('timeLimitMs') or 200)
+        speed = float(raw.get('travelSpeed') or settings.NESTING_CUT_TRAVEL_SPEED)
+        if len(home) != 2 or time_limit <= 0 or speed <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        fail('cutPath 参数无效：home 为 [x, y]，timeLimitMs / travelSpeed 须为正数')
+    direction = str(raw.get('direction') or 'cw').lower()
+    if direction not in DIRECTIONS:
+        fail('不支持的切割方向', direction=direction, choices=list(DIRECTIONS))
+    return {
+        'home': home, 'direction': direction, 'time_limit_ms': min(time_limit, settings.NESTING_MAX_TIME_BUDGET_MS),
+        'return_home': bool(raw.get('returnHome', False)), 'travel_speed': speed,
+    }
+
+
+def parse_pack_options(data) -> Dict:
+    """解析 /nesting/pack 参数，非法时抛出 ValidationError（400）。异步任务提交时也先经过这里校验。"""
+    def fail(detail, **extra):
+        raise ValidationError({'detail': detail, **extra})
+
+    try:
+        gap = float(data.get('gap') or 0.0)
+        margin = float(data.get('margin') or 0.0)
+    except (TypeError, ValueError):
+        fail('gap / margin 参数无效')
+    # mode=roll：卷材按固定幅宽、长度不限排版，默认使用 skyline
+    roll = str(data.get('mode') or 'sheet').lower() == 'roll'
+    algorithm = str(data.get('algorithm') or ('skyline' if roll else 'shelf')).lower()
+    heuristic = str(data.get('heuristic') or 'bssf').lower()
+    split = str(data.get('split') or 'slas').lower()
+    # stamp：同件按阵列铺排，返回重复描述而不是逐件坐标
+    stamp = bool(data.get('stamp', False))
+    # optimize：多起点优化。给定 seed 时按固定候选数（iterations，默认 SEEDED_ITERATIONS）评估，结果可复现；
+    # 未给 seed 时随机取 seed，在 timeBudgetMs 内评估尽可能多的候选
+    optimize = bool(data.get('optimize', False))
+    try:
+        budget = int(data.get('timeBudgetMs') or 2000)
+        seed = int(data['seed']) if data.get('seed') is not None else random.randrange(1 << 31)
+        iterations = int(data['iterations']) if data.get('iterations') not in (None, '') else None
+    except (TypeError, ValueError):
+        fail('timeBudgetMs / seed / iterations 参数无效')
+    budget = max(1, min(budget, settings.NESTING_MAX_TIME_BUDGET_MS))
+    if iterations is not None and iterations < 1:
+        fail('iterations 须为正整数')
+    if optimize and iterations is None and data.get('seed') is not None:
+        iterations = MultiStartOptimizer.SEEDED_ITERATIONS
+    # polygon 模式：允许的旋转角度与光栅精度（mm/格）
+    try:
+        rotations = [float(a) for a in (data.get('rotations') or [0, 90, 180, 270])]
+        resolution = float(data['resolution']) if data.get('resolution') else None
+    except (TypeError, ValueError):
+        fail('rotations / resolution 参数无效')
+    if resolution is not None and resolution <= 0:
+        fail('resolution 必须大于 0')
+    if roll and algorithm not in ROLL_PACKERS + ('auto',):
+        fail('卷材模式仅支持 skyline 算法', algorithm=algorithm)
+    # auto：多个算法限时竞赛，取最优（时间预算同 timeBudgetMs）
+    if algorithm not in PACKERS and algorithm != 'auto':
+        fail('不支持的拼版算法', algorithm=algorithm, choices=list(PACKERS) + ['auto'])
+    if algorithm in ('maxrects', 'guillotine') and heuristic not in PACKERS[algorithm].HEURISTICS:
+        fail('不支持的启发式', heuristic=heuristic, choices=list(PACKERS[algorithm].HEURISTICS))
+    if split not in GuillotinePacker.SPLITS:
+        fail('不支持的切分规则', split=split, choices=list(GuillotinePacker.SPLITS))
+    if stamp and (roll or algorithm == 'polygon'):
+        fail('阵列模式仅支持矩形整板排版')
+    if optimize and (stamp or algorithm == 'polygon'):
+        fail('优化模式不支持阵列或外形排版')
+    if algorithm == 'auto' and (stamp or optimize):
+        fail('auto 不能与阵列模式或优化模式同时使用')
+    # byCategory 下同时计算的类目数上限（再受 NESTING_MAX_PARALLELISM 限制）
+    try:
+        parallelism = int(data.get('parallelism') or settings.NESTING_MAX_PARALLELISM)
+    except (TypeError, ValueError):
+        fail('parallelism 参数无效')
+    parallelism = max(1, min(parallelism, settings.NESTING_MAX_PARALLELISM))
+    # format=columnar：placements 改为按列输出的平行数组，整数列再做差分 / 游程压缩（见 to_columnar）
+    layout_format = str(data.get('format') or 'rows').lower()
+    if layout_format not in ('rows', 'columnar'):
+        fail('不支持的返回格式', format=layout_format, choices=['rows', 'columnar'])
+    # stream：按 NDJSON 逐板输出，每排完一张板输出一行，最后一行为汇总
+    stream = bool(data.get('stream', False))
+    if stream and (stamp or layout_format != 'rows'):
+        fail('流式输出不支持阵列模式或 columnar 格式')
+    # cutPath：排版后为每张板计算切割顺序（入刀点与方向），减少刀头空走
+    cut = parse_cut_options(data['cutPath'], fail) if data.get('cutPath') else None
+    if cut and stamp:
+        fail('阵列模式不支持切割顺序')
+    # save：把排版结果保存为任务记录（板 / 件逐条入库），以后按 id 直接取回重印
+    save = bool(data.get('save', False))
+    if save and (stamp or stream):
+        fail('阵列模式与流式输出不支持保存排版')
+    # stock：可选材料目录，给出后按总成本自动选材
+    stock = None
+    if data.get('stock'):
+        stock = []
+        try:
+            for k, entry in enumerate(data['stock']):
+                width = float(entry['width'])
+                height = float(entry['height']) if entry.get('height') else None
+                cost = float(entry['costPerMeter'] if height is None else entry['cost'])
+                if width <= 0 or (height is not None and height <= 0) or cost < 0:
+                    raise ValueError
+                cats = entry.get('categories')
+                stock.append({
+                    'id': str(entry.get('id') or f'stock-{k + 1}'), 'width': width, 'height': height, 'cost': cost,
+                    'categories': [str(c) for c in cats] if cats else None,
+                })
+        except (KeyError, TypeError, ValueError):
+            fail('stock 参数无效：板材需要 width/height/cost，卷材需要 width/costPerMeter')
+    return {
+        'gap': gap, 'margin': margin, 'byCategory': bool(data.get('byCategory', False)), 'roll': roll,
+        'algorithm': algorithm, 'heuristic': heuristic, 'split': split, 'stamp': stamp,
+        'optimize': optimize, 'timeBudgetMs': budget, 'seed': seed, 'seedGiven': data.get('seed') is not None, 'iterations': iterations,
+        'rotations': rotations, 'resolution': resolution, 'parallelism': parallelism, 'stock': stock,
+        'format': layout_format, 'stream': stream, 'cutPath': cut, 'save': save,
+    }
+
+
+def pack_one(opts: Dict, sheet_obj, items, alg: str = None, progress=None, cancel=None):
+    alg = alg or opts['algorithm']
+    gap, margin = opts['gap'], opts['margin']
+    SW = float(sheet_obj.get('width') or 1000)
+    SH = None if opts['roll'] and alg in ROLL_PACKERS + ('auto',) else float(sheet_obj.get('height') or 1000)
+    if opts['stamp']:
+        # 余块仍按所选算法合板（硬板类目为 guillotine）
+        stamper = PatternStamper(SW, SH, remainder=_make_packer(alg, SW, SH, opts['heuristic'], opts['split']))
+        out = stamper.pack(_build_stamp_items(items), gap=gap, margin=margin)
+        out['algorithm'] = alg
+        return out
+    with phase('expand'):
+        rects = _build_rects(items, with_poly=alg == 'polygon')
+    with phase('pack'):
+        if alg == 'auto':
+            race = PortfolioRace(SW, SH, opts['heuristic'], opts['split'], time_budget_ms=opts['timeBudgetMs'])
+            out = race.run(rects, gap=gap, margin=margin)
+        elif opts['optimize']:
+            optimizer = MultiStartOptimizer(SW, SH, alg, opts['heuristic'], opts['split'], time_budget_ms=opts['timeBudgetMs'],
+                                            seed=opts['seed'], iterations=opts['iterations'], cancel=cancel, progress=progress)
+            out = optimizer.run(rects, gap=gap, margin=margin)
+        else:
+            packer = _make_packer(alg, SW, SH, opts['heuristic'], opts['split'], opts['rotations'], opts['resolution'])
+            packer.progress = progress
+            out = packer.pack(rects, gap=gap, margin=margin)
+            out['algorithm'] = alg
+    if SH is None:
+        out['mode'] = 'roll'
+    return out
+
+
+def pack_cache_key(opts: Dict, sheet_obj, items, alg: str) -> Optional[str]:
+    """把一次排版的输入规范化（件按内容排序）后取 sha256；未指定 seed 的优化结果与 auto 竞赛结果不可复现，不缓存。"""
+    if (opts['optimize'] and not opts['seedGiven']) or alg == 'auto':
+        return None
+    roll = opts['roll'] and alg in ROLL_PACKERS
+    canon_items = []
+    for it in items:
+        w = float(it.get('w') or it.get('width') or 0)
+        h = float(it.get('h') or it.get('height') or 0)
+        entry = [str(it.get('id') or 'item'), w, h, int(it.get('qty') or 1), bool(it.get('rotate', True))]
+        if alg == 'polygon':
+            entry += [_item_poly(it, w, h)]
+        canon_items.append(entry)
+    canon_items.sort(key=lambda e: json.dumps(e))
+    canon = {
+        'sheet': [float(sheet_obj.get('width') or 1000), None if roll else float(sheet_obj.get('height') or 1000)],
+        'gap': opts['gap'], 'margin': opts['margin'], 'algorithm': alg, 'heuristic': opts['heuristic'],
+        'split': opts['split'], 'stamp': opts['stamp'], 'items': canon_items,
+    }
+    if alg == 'polygon':
+        canon.update(rotations=opts['rotations'], resolution=opts['resolution'])
+    if opts['optimize']:
+        # 缓存只针对给定 seed 的固定候选数优化，时间预算不影响其结果
+        canon.update(optimize=[opts['seed'], opts['iterations']])
+    raw = json.dumps(canon, sort_keys=True, separators=(',', ':'))
+    return 'nesting:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _cache_lookup(opts: Dict, sheet_obj, items, alg: str, hits: list = None):
+    with phase('cache'):
+        key = pack_cache_key(opts, sheet_obj, items, alg)
+        out = caches['nesting'].get(key) if key else None
+    count('cacheHits' if out is not None else 'cacheMisses')
+    if hits is not None:
+        hits.append(out is not None)
+    return key, out
+
+
+def cached_pack_one(opts: Dict, sheet_obj, items, alg: str = None, progress=None, hits: list = None, cancel=None):
+    """pack_one 外加内容哈希缓存（CACHES['nesting']，有界 LRU）；hits 收集每次查询是否命中。
+
+    被截断或撤销的优化结果（optimizer.complete 为 False）不可复现，不写入缓存。
+    """
+    alg = alg or opts['algorithm']
+    key, out = _cache_lookup(opts, sheet_obj, items, alg, hits)
+    if out is None:
+        out = pack_one(opts, sheet_obj, items, alg, progress=progress, cancel=cancel)
+        if key and out.get('optimizer', {}).get('complete', True):
+            with phase('cache'):
+                caches['nesting'].set(key, out)
+    return out
+
+
+def _pack_category(opts: Dict, sheet_obj, items, alg: str):
+    # 进程池任务：返回排版结果与纯计算耗时（毫秒）
+    t0 = time.perf_counter()
+    out = pack_one(opts, sheet_obj, items, alg)
+    return out, round((time.perf_counter() - t0) * 1000, 1)
+
+
+def _run_categories_parallel(pool, opts: Dict, jobs: List[Tuple], out: Dict, progress=None, hits: list = None):
+    """类目并行排版：缓存命中的直接返回，其余最多 opts['parallelism'] 个同时在进程池中计算。"""
+    pending = []
+    for cat, sheet_obj, arr, alg in jobs:
+        t0 = time.perf_counter()
+        key, cached = _cache_lookup(opts, sheet_obj, arr, alg, hits)
+        if cached is not None:
+            cached['elapsedMs'] = round((time.perf_counter() - t0) * 1000, 1)
+            out[cat] = cached
+        else:
+            pending.append((cat, sheet_obj, arr, alg, key))
+    total = len(jobs)
+    done_count = total - len(pending)
+    inflight = {}
+    try:
+        while pending or inflight:
+            while pending and len(inflight) < opts['parallelism']:
+                cat, sheet_obj, arr, alg, key = pending.pop(0)
+                inflight[pool.submit(_pack_category, opts, sheet_obj, arr, alg)] = (cat, key)
+            done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                cat, key = inflight.pop(fut)
+                result, elapsed = fut.result()
+                if key:
+                    caches['nesting'].set(key, result)
+                result['elapsedMs'] = elapsed
+                out[cat] = result
+                done_count += 1
+                if progress is not None:
+                    progress(done_count / total)
+    except BrokenProcessPool:
+        reset_pool()
+        raise
+    finally:
+        for fut in inflight:
+            fut.cancel()
+
+
+def _stock_lower_bound(entry: Dict, dims: np.ndarray, gap: float, margin: float) -> Optional[float]:
+    """材料成本下界；有件放不下时返回 None。dims 每行为 (w, h, rotate)，已按数量展开。"""
+    w, h, rot = dims[:, 0] + gap, dims[:, 1] + gap, dims[:, 2] > 0
+    inner_w = entry['width'] - 2 * margin + gap
+    if entry['height'] is None:
+        # 卷材：每件取放得下且占长最短的方向；面积 / 幅宽 给出最短长度
+        along = np.where(w <= inner_w, h, np.inf)
+        along = np.where(rot & (h <= inner_w), np.minimum(along, w), along)
+        if not np.isfinite(along).all():
+            return None
+        length = max(float((w * h).sum()) / inner_w, float(along.max())) - gap + 2 * margin
+        return length / 1000.0 * entry['cost']
+    inner_h = entry['height'] - 2 * margin + gap
+    fit = (w <= inner_w) & (h <= inner_h)
+    fit_rot = rot & (h <= inner_w) & (w <= inner_h)
+    if not (fit | fit_rot).all():
+        return None
+    # 任一可用方向上宽高都超过半板的件两两不能同板，各占一张
+    big = (w > inner_w / 2) & (h > inner_h / 2) & (~rot | (h > inner_w / 2) & (w > inner_h / 2))
+    sheets = max(math.ceil(float((w * h).sum()) / (inner_w * inner_h) - 1e-9), int(big.sum()), 1)
+    return sheets * entry['cost']
+
+
+def _stock_dominates(a: Dict, b: Dict, all_rotate: bool) -> bool:
+    # a 不比 b 贵且尺寸覆盖 b：b 上的任何排法在 a 上都成立
+    if (a['height'] is None) != (b['height'] is None) or a['cost'] > b['cost']:
+        return False
+    if a['height'] is None:
+        return a['width'] >= b['width']
+    if a['width'] >= b['width'] and a['height'] >= b['height']:
+        return True
+    # 整板转 90° 等于每件都转，只有全部件可旋转时成立
+    return all_rotate and a['width'] >= b['height'] and a['height'] >= b['width']
+
+
+def select_stock(opts: Dict, items, category: str = None, hits: list = None) -> Dict:
+    """在材料目录中为一组件选总成本最低的材料。
+
+    先剔除放不下的与被支配的材料，再按成本下界从低到高逐个实排，
+    下界已不低于当前最优成本时停止。返回最优排版，附 stock/cost/stockCandidates。
+    """
+    gap, margin = opts['gap'], opts['margin']
+    rows = [(float(it.get('w') or it.get('width') or 0), float(it.get('h') or it.get('height') or 0),
+             1.0 if it.get('rotate', True) else 0.0, int(it.get('qty') or 1)) for it in items]
+    table = np.array([r[:3] for r in rows], dtype=np.float64).reshape(-1, 3)
+    dims = np.repeat(table, [r[3] for r in rows], axis=0)
+    all_rotate = bool((dims[:, 2] > 0).all())
+    rigid = category in RIGID_BOARD_CATEGORIES
+    report = []
+    options = []
+    for entry in opts['stock']:
+        row = {'id': entry['id'], 'lowerBound': None, 'cost': None}
+        report.append(row)
+        if entry['categories'] is not None and category not in entry['categories']:
+            row['status'] = 'excluded'
+            continue
+        # 硬板不上卷材；阵列模式只支持整板
+        if entry['height'] is None and (rigid or opts['stamp']):
+            row['status'] = 'excluded'
+            continue
+        lb = _stock_lower_bound(entry, dims, gap, margin)
+        if lb is None:
+            row['status'] = 'infeasible'
+            continue
+        row['lowerBound'] = round(lb, 4)
+        options.append((lb, entry, row))
+    live = []
+    for lb, entry, row in options:
+        # 互相支配（同尺寸同价）时保留 id 较小的一个
+        if any(_stock_dominates(other, entry, all_rotate)
+               and (not _stock_dominates(entry, other, all_rotate) or other['id'] < entry['id'])
+               for _, other, _ in options if other is not entry):
+            row['status'] = 'dominated'
+        else:
+            live.append((lb, entry, row))
+    live.sort(key=lambda o: (o[0], o[1]['cost']))
+    best = None
+    for lb, entry, row in live:
+        if best is not None and lb >= best[0]:
+            row['status'] = 'pruned'
+            continue
+        roll = entry['height'] is None
+        sub_opts = {**opts, 'roll': roll}
+        if roll:
+            sub_alg = 'skyline'
+        else:
+            sub_alg = 'guillotine' if rigid else opts['algorithm']
+        sheet = {'width': entry['width'], 'height': entry['height']}
+        out = cached_pack_one(sub_opts, sheet, items, sub_alg, hits=hits)
+        row['status'] = 'evaluated'
+        # 阵列模式的结果是重复描述：没有 placements / sheets，按 unplaced 与 sheetCount 评估
+        stamped = out.get('mode') == 'stamp'
+        if out['unplaced'] if stamped else any(not p['placed'] for p in out['placements']):
+            row['status'] = 'infeasible'
+            continue
+        if roll:
+            cost = out['length'] / 1000.0 * entry['cost']
+        else:
+            cost = (out['sheetCount'] if stamped else len(out['sheets'])) * entry['cost']
+        row['cost'] = round(cost, 4)
+        if best is None or cost < best[0]:
+            best = (cost, entry, out)
+    if best is None:
+        raise ValidationError({'detail': '材料目录中没有能放下全部件的材料', 'category': category, 'stockCandidates': report})
+    cost, entry, out = best
+    out = dict(out)
+    out['stock'] = {k: v for k, v in entry.items() if k != 'categories'}
+    out['cost'] = round(cost, 4)
+    out['stockCandidates'] = report
+    return out
+
+
+def _compact_column(values: list):
+    # 整列都是整数值时返回 int64 数组（JSON 中省去 ".0"，且可做差分 / 游程编码）；含 null（未放置件）时原样返回列表
+    if any(v is None for v in values):
+        return values
+    arr = np.fromiter(values, dtype=np.float64, count=len(values))
+    if arr.size and np.array_equal(arr, np.floor(arr)) and np.abs(arr).max() < 2 ** 53:
+        return arr.astype(np.int64)
+    return arr.tolist()
+
+
+def _runs(arr: np.ndarray) -> np.ndarray:
+    # 游程编码：展平的 [值, 个数, 值, 个数, ...]
+    if not arr.size:
+        return arr
+    starts = np.flatnonzero(np.diff(arr, prepend=arr[0] - 1))
+    counts = np.diff(np.append(starts, arr.size))
+    return np.column_stack([arr[starts], counts]).ravel()
+
+
+def _json_chars(arr: np.ndarray) -> int:
+    # 整数数组写成 JSON 的近似字符数：位数 + 负号 + 逗号
+    if not arr.size:
+        return 0
+    mag = np.maximum(np.abs(arr), 1).astype(np.float64)
+    return int((np.floor(np.log10(mag)) + 2).sum() + (arr < 0).sum())
+
+
+# 整数列的编码方式；还原顺序与编码相反：先展开游程，再做前缀和
+COLUMN_ENCODINGS = ('delta', 'rle', 'delta+rle')
+
+
+def _encode_int_column(arr: np.ndarray) -> Tuple[Optional[str], list]:
+    """在原样 / 差分 / 游程 / 差分后游程中取 JSON 最短的一种，返回 (编码名或 None, 列)。"""
+    delta = np.diff(arr, prepend=0)
+    candidates = [(None, arr), ('delta', delta), ('rle', _runs(arr)), ('delta+rle', _runs(delta))]
+    name, encoded = min(candidates, key=lambda c: _json_chars(c[1]))
+    return name, encoded.tolist()
+
+
+def _decode_int_column(encoding: Optional[str], values: list) -> list:
+    arr = np.asarray(values, dtype=np.int64)
+    if encoding in ('rle', 'delta+rle'):
+        arr = np.repeat(arr[0::2], arr[1::2])
+    if encoding in ('delta', 'delta+rle'):
+        arr = np.cumsum(arr)
+    return arr.tolist()
+
+
+def to_columnar(out: Dict) -> Dict:
+    """把一次排版结果的 placements 转为平行数组（columns），其余字段不变。
+
+    件 id 形如 "{item}-{序号}" 时按字典编码为 items / item / copy 三列，否则直接给 id 列；
+    rotated 用 0/1，未放置件的 sheet/x/y 为 null。polygon 等附加字段原样作为额外的列。
+    整数列（不含 null）再按 encoding 中记录的方式压缩，未列出的列为原样：
+    delta 为首值加逐项差分，rle 为展平的 [值, 个数, ...]，delta+rle 为差分后再游程。
+    件按排版顺序排列，同一件的各份、同一张板大多相邻，item / copy / sheet / w / h / rotated 几乎都压成游程。
+    还原见 from_columnar。
+    """
+    placements = out.get('placements') or []
+    result = {k: v for k, v in out.items() if k != 'placements'}
+    columns: Dict[str, list] = {}
+    parts = [str(p['id']).rpartition('-') for p in placements]
+    if all(sep and copy.isdigit() for _, sep, copy in parts):
+        index: Dict[str, int] = {}
+        columns['items'] = []
+        item_col = []
+        for item, _, _ in parts:
+            k = index.get(item)
+            if k is None:
+                k = index[item] = len(columns['items'])
+                columns['items'].append(item)
+            item_col.append(k)
+        columns['item'] = np.asarray(item_col, dtype=np.int64)
+        columns['copy'] = np.asarray([int(copy) for _, _, copy in parts], dtype=np.int64)
+    else:
+        columns['id'] = [p['id'] for p in placements]
+    columns['sheet'] = _compact_column([p['sheet'] for p in placements])
+    for key in ('x', 'y', 'w', 'h'):
+        columns[key] = _compact_column([p[key] for p in placements])
+    columns['rotated'] = np.asarray([1 if p['rotated'] else 0 for p in placements], dtype=np.int64)
+    encoding: Dict[str, str] = {}
+    for key, col in columns.items():
+        if isinstance(col, np.ndarray):
+            name, columns[key] = _encode_int_column(col)
+            if name:
+                encoding[key] = name
+    base = {'id', 'sheet', 'x', 'y', 'w', 'h', 'rotated', 'placed'}
+    # 各件都带齐 base 字段，只有字段数不同的件才可能有附加列
+    extra = set()
+    for p in placements:
+        if len(p) != len(base):
+            extra.update(p.keys())
+    for key in sorted(extra - base):
+        columns[key] = [p.get(key) for p in placements]
+    result['format'] = 'columnar'
+    result['count'] = len(placements)
+    result['encoding'] = encoding
+    result['columns'] = columns
+    return result
+
+
+def from_columnar(result: Dict) -> Dict:
+    """to_columnar 的逆变换，还原为按件的 placements（数值列为整数时保持整数）。"""
+    encoding = result.get('encoding') or {}
+    columns = {k: _decode_int_column(encoding[k], v) if k in encoding else v for k, v in result['columns'].items()}
+    out = {k: v for k, v in result.items() if k not in ('format', 'count', 'encoding', 'columns')}
+    items = columns.pop('items', None)
+    if items is not None:
+        ids = [f'{items[k]}-{c}' for k, c in zip(columns.pop('item'), columns.pop('copy'))]
+    else:
+        ids = columns.pop('id')
+    rotated = columns.pop('rotated')
+    out['placements'] = [
+        {'id': pid, **{k: col[i] for k, col in columns.items()}, 'rotated': bool(rotated[i]),
+         'placed': columns['sheet'][i] is not None}
+        for i, pid in enumerate(ids)
+    ]
+    return out
+
+
+def run_pack(data, opts: Dict = None, progress=None, hits: list = None, job=None, cancel=None) -> Dict:
+    """执行一次排版请求；progress(fraction) 可选，用于异步任务回报进度；hits 可选，收集各次缓存命中情况。
+
+    job 给出时把排版保存到该任务（NestingSheet / NestingPlacement），结果中附带 layoutId。
+    cancel 为带 is_set() 的撤销标志（异步任务的撤销）：多起点优化在批次之间检查，分类目排版不再开始剩余类目。
+    """
+    opts = opts or parse_pack_options(data)
+    out = _run_pack(data, opts, progress=progress, hits=hits, cancel=cancel)
+    layouts = list(out.values()) if opts['byCategory'] else [out]
+    for res in layouts:
+        _count_layout(res)
+    if job is not None and not (cancel is not None and cancel.is_set()):
+        # 已撤销的任务不保存（save_layout 会整行写回任务记录）
+        with phase('save'):
+            save_layout(job, out, data.get('items'), opts['byCategory'])
+        for res in layouts:
+            res['layoutId'] = str(job.pk)
+    if opts['cutPath']:
+        with phase('cutPath'):
+            # 所有类目共用一个截止时间
+            deadline = time.perf_counter() + opts['cutPath']['time_limit_ms'] / 1000.0
+            for res in layouts:
+                res['cutPaths'] = order_cut_paths(res, **opts['cutPath'], deadline=deadline)
+    if opts['format'] == 'columnar':
+        with phase('format'):
+            out = {cat: to_columnar(res) for cat, res in out.items()} if opts['byCategory'] else to_columnar(out)
+    return out
+
+
+def _count_layout(out: Dict):
+    # 诊断计数：件数、板数、未放下件数（阵列模式按数量计）
+    if out.get('mode') == 'stamp':
+        unplaced = sum(u['qty'] for u in out['unplaced'])
+        count('parts', out['placedCount'] + unplaced)
+        count('sheets', out['sheetCount'])
+        count('unplaced', unplaced)
+        return
+    unplaced = sum(1 for p in out['placements'] if not p['placed'])
+    count('parts', len(out['placements']))
+    count('sheets', len(out['sheets']))
+    count('unplaced', unplaced)
+
+
+def _run_pack(data, opts: Dict, progress=None, hits: list = None, cancel=None) -> Dict:
+    items = data.get('items') or []
+    if not opts['byCategory']:
+        if opts['stock']:
+            return select_stock(opts, items, hits=hits)
+        sheet = data.get('sheet') or {'width': 1000, 'height': 1000}
+        return cached_pack_one(opts, sheet, items, progress=progress, hits=hits, cancel=cancel)
+    # items 按 category 分组；sheetByCategory 为 {category: {width,height}}
+    # 每个类目结果附带 elapsedMs（该类目排版耗时），便于定位耗时最多的材料
+    sheet_map = data.get('sheetByCategory') or {}
+    cats = {}
+    for it in items:
+        cats.setdefault(it.get('category') or 'default', []).append(it)
+    jobs = []
+    for cat, arr in cats.items():
+        sheet_obj = sheet_map.get(cat) or data.get('sheet') or {'width': 1000, 'height': 1000}
+        alg = 'guillotine' if cat in RIGID_BOARD_CATEGORIES else opts['algorithm']
+        jobs.append((cat, sheet_obj, arr, alg))
+    out = {cat: None for cat in cats}
+    if opts['stock']:
+        # 选材对每个类目单独进行，类目之间串行
+        for i, (cat, sheet_obj, arr, alg) in enumerate(jobs):
+            t0 = time.perf_counter()
+            out[cat] = select_stock(opts, arr, category=cat, hits=hits)
+            out[cat]['elapsedMs'] = round((time.perf_counter() - t0) * 1000, 1)
+            if progress is not None:
+                progress((i + 1) / len(jobs))
+        return out
+    # 优化模式自身已占用进程池，类目之间保持串行
+    pool = get_pool() if len(jobs) > 1 and opts['parallelism'] > 1 and not opts['optimize'] else None
+    if pool is not None:
+        _run_categories_parallel(pool, opts, jobs, out, progress=progress, hits=hits)
+        return out
+    for i, (cat, sheet_obj, arr, alg) in enumerate(jobs):
+        if cancel is not None and cancel.is_set():
+            # 已撤销：剩余类目不再计算
+            del out[cat]
+            continue
+        sub = None
+        if progress is not None:
+            sub = (lambda base: lambda f: progress((base + f) / len(jobs)))(i)
+        t0 = time.perf_counter()
+        out[cat] = cached_pack_one(opts, sheet_obj, arr, alg, progress=sub, hits=hits, cancel=cancel)
+        out[cat]['elapsedMs'] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+
+def _layout_sheets(out: Dict):
+    # 已排完的结果按板切分；放不下的件随最后一张板给出
+    groups: Dict[int, List[Dict]] = {}
+    unplaced = []
+    for p in out['placements']:
+        if p['placed']:
+            groups.setdefault(p['sheet'], []).append(p)
+        else:
+            unplaced.append(p)
+    for k, sheet in enumerate(out['sheets']):
+        group = groups.pop(sheet['index'], [])
+        yield sheet, group + unplaced if k == len(out['sheets']) - 1 else group
+
+
+def _sheet_records(opts: Dict, sheet_obj, items, alg: str, category: str = None, hits: list = None, cut_budget: list = None):
+    """逐板产出 NDJSON 记录，生成器的返回值为该次排版的汇总。
+
+    shelf 算法边排边输出，内存只保留当前一张板；其余算法（及缓存命中、选材）排完后再逐板输出。
+    cut_budget 为整个请求剩余的切割顺序时间（秒，单元素列表），各板按实际用时扣减。
+    """
+    extra: Dict = {}
+    if opts['stock']:
+        out = select_stock(opts, items, category=category, hits=hits)
+        sheets = _layout_sheets(out)
+    else:
+        key, out = _cache_lookup(opts, sheet_obj, items, alg, hits)
+        if out is None and alg == 'shelf' and not opts['optimize']:
+            packer = ShelfPacker(float(sheet_obj.get('width') or 1000), float(sheet_obj.get('height') or 1000))
+            sheets = packer.iter_sheets(_build_rects(items), gap=opts['gap'], margin=opts['margin'])
+            extra['algorithm'] = alg
+        else:
+            if out is None:
+                out = pack_one(opts, sheet_obj, items, alg)
+                if key:
+                    caches['nesting'].set(key, out)
+            sheets = _layout_sheets(out)
+    if out is not None:
+        extra = {k: v for k, v in out.items() if k not in ('sheets', 'placements', 'utilization', 'totalArea')}
+    count = 0
+    used_area = sheet_area = total_area = 0.0
+    unplaced = []
+    for sheet, group in sheets:
+        placed = []
+        area = 0.0
+        for p in group:
+            total_area += p['w'] * p['h']
+            if p['placed']:
+                placed.append(p)
+                area += p['w'] * p['h']
+            else:
+                unplaced.append(p)
+        count += 1
+        used_area += area
+        # 卷材没有件放下时耗用长度为 0，这张“板”面积为 0，利用率按 0 计
+        size = sheet['w'] * sheet['h']
+        sheet_area += size
+        record = {'type': 'sheet', 'sheet': sheet, 'placements': placed, 'utilization': round(area / size, 4) if size else 0.0}
+        if category is not None:
+            record['category'] = category
+        if opts['cutPath'] and placed:
+            cut = dict(opts['cutPath'])
+            speed = cut.pop('travel_speed')
+            if cut_budget is None:
+                cut_budget = [cut['time_limit_ms'] / 1000.0]
+            # 板与板之间还在排版，不能用一个固定的截止时刻：按各板实际用时扣减，整个请求合计不超过上限
+            started = time.perf_counter()
+            record['cutPath'] = order_sheet(placed, **cut, deadline=started + cut_budget[0])
+            cut_budget[0] = max(0.0, cut_budget[0] - (time.perf_counter() - started))
+            record['cutPath']['savedSeconds'] = round(record['cutPath']['saved'] / speed, 1)
+        yield record
+    return {
+        'sheets': count, 'utilization': round(used_area / sheet_area, 4) if sheet_area else 0.0,
+        'totalArea': total_area, 'unplaced': unplaced, **extra,
+    }
+
+
+def stream_pack(data, opts: Dict):
+    """/nesting/pack 的流式版本：逐行产出 NDJSON（每张板一行，最后一行 type=summary）。
+
+    只有 shelf 路径边排边输出；其他路径的内存占用与整体排版相同，见 _sheet_records。
+    """
+    items = data.get('items') or []
+    cut_budget = [opts['cutPath']['time_limit_ms'] / 1000.0] if opts['cutPath'] else None
+    if not opts['byCategory']:
+        sheet = data.get('sheet') or {'width': 1000, 'height': 1000}
+        summary = yield from _sheet_records(opts, sheet, items, opts['algorithm'], cut_budget=cut_budget)
+        yield {'type': 'summary', **summary}
+        return
+    # 类目依次输出（不并行），保证记录按类目连续
+    sheet_map = data.get('sheetByCategory') or {}
+    cats = {}
+    for it in items:
+        cats.setdefault(it.get('category') or 'default', []).append(it)
+    summaries = {}
+    for cat, arr in cats.items():
+        sheet_obj = sheet_map.get(cat) or data.get('sheet') or {'width': 1000, 'height': 1000}
+        alg = 'guillotine' if cat in RIGID_BOARD_CATEGORIES else opts['algorithm']
+        t0 = time.perf_counter()
+        summaries[cat] = yield from _sheet_records(opts, sheet_obj, arr, alg, category=cat, cut_budget=cut_budget)
+        summaries[cat]['elapsedMs'] = round((time.perf_counter() - t0) * 1000, 1)
+    yield {'type': 'summary', 'categories': summaries}
+
+
+def _ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _sweep_widths(spec, rect_rows, widths):
+    """进程池任务：同一批件依次按各幅宽排卷材，只回传汇总行。"""
+    gap, margin, sheet_length = spec
+    rects = [Rect(w=w, h=h, id=rid, rotate=rot) for w, h, rid, rot in rect_rows]
+    rows = []
+    for width in widths:
+        out = SkylinePacker(width, sheet_length).pack(rects, gap=gap, margin=margin)
+        placed = [p for p in out['placements'] if p['placed']]
+        if sheet_length is None:
+            length, sheets = out['length'], 1 if placed else 0
+        else:
+            # 分段裁切：前面整段按满长计，最后一段按实际用到的长度
+            sheets = len(out['sheets']) if placed else 0
+            last = max((p['y'] + p['h'] for p in placed if p['sheet'] == sheets), default=0.0)
+            length = round((sheets - 1) * sheet_length + last + margin, 2) if sheets else 0.0
+        used = sum(p['w'] * p['h'] for p in placed)
+        util = used / (width * length) if length > 0 else 0.0
+        rows.append([width, length, round(util, 4), sheets, len(out['placements']) - len(placed)])
+    return rows
+
+
+class NestingRollSweepAPIView(APIView):
+    """幅宽扫描：同一批件在多个卷材幅宽上排版，返回各幅宽的利用率、耗用长度与段数，用于报价选材。"""
 
-class NestingPackAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [JSONParser]
+    MAX_WIDTHS = 200
 
     def post(self, request):
-        gap = float(request.data.get('gap') or 0.0)
-        margin = float(request.data.get('margin') or 0.0)
-        by_cat = bool(request.data.get('byCategory', False))
-
-        def pack_one(sheet_obj, items):
-            SW = float(sheet_obj.get('width') or 1000)
-            SH = float(sheet_obj.get('height') or 1000)
-            rects: List[Rect] = []
-            for it in items:
-                qty = int(it.get('qty') or 1)
-                for i in range(qty):
-                    rects.append(Rect(
-                        w=float(it.get('w') or it.get('width') or 0),
-                        h=float(it.get('h') or it.get('height') or 0),
-                        id=f"{it.get('id') or 'item'}-{i}",
-                        rotate=bool(it.get('rotate', True)),
-                    ))
-            packer = ShelfPacker(SW, SH)
-            return packer.pack(rects, gap=gap, margin=margin)
-
-        if by_cat:
-            # items 按 category 分组；sheetByCategory 为 {category: {width,height}}
-            items = request.data.get('items') or []
-            sheet_map = request.data.get('sheetByCategory') or {}
-            out = {}
-            cats = {}
-            for it in items:
-                cats.setdefault(it.get('category') or 'default', []).append(it)
-            for cat, arr in cats.items():
-                sheet_obj = sheet_map.get(cat) or request.data.get('sheet') or {'width': 1000, 'height': 1000}
-                out[cat] = pack_one(sheet_obj, arr)
-            return Response(out)
+        data = request.data
+        try:
+            gap = float(data.get('gap') or 0.0)
+            margin = float(data.get('margin') or 0.0)
+            sheet_length = float(data['sheetLength']) if data.get('sheetLength') else None
+            if data.get('widths'):
+                widths = [float(w) for w in data['widths']]
+            else:
+                # widthRange: {from, to, step}，含两端
+                rng = data.get('widthRange') or {}
+                lo, hi, step = float(rng['from']), float(rng['to']), float(rng['step'])
+                if step <= 0 or hi < lo:
+                    raise ValueError
+                count = int(math.floor((hi - lo) / step + 1e-9)) + 1
+                widths = [round(lo + i * step, 3) for i in range(min(count, self.MAX_WIDTHS + 1))]
+        except (KeyError, TypeError, ValueError):
+            return Response({'detail': '需要 widths 列表或 widthRange {from,to,step}'}, status=400)
+        widths = sorted(set(w for w in widths if w > 2 * margin))
+        if not widths:
+            return Response({'detail': '没有可用的幅宽'}, status=400)
+        if len(widths) > self.MAX_WIDTHS:
+            return Response({'detail': '幅宽数量过多', 'max': self.MAX_WIDTHS}, status=400)
+        # 件只解析一次，各幅宽共用
+        rows = [(r.w, r.h, r.id, r.rotate) for r in _build_rects(data.get('items') or [])]
+        spec = (gap, margin, sheet_length)
+        pool = get_pool()
+        started = time.perf_counter()
+        if pool is None or len(widths) == 1:
+            table = _sweep_widths(spec, rows, widths)
         else:
-            sheet = request.data.get('sheet') or {'width': 1000, 'height': 1000}
-            items = request.data.get('items') or []
-            return Response(pack_one(sheet, items))
+            # 按池大小交错分组，宽窄幅宽均匀分到各进程
+            groups = [widths[i::pool_size()] for i in range(min(pool_size(), len(widths)))]
+            try:
+                parts = list(pool.map(_sweep_widths, [spec] * len(groups), [rows] * len(groups), groups))
+            except BrokenProcessPool:
+                reset_pool()
+                raise
+            table = sorted((r for part in parts for r in part), key=lambda r: r[0])
+        complete = [r for r in table if r[4] == 0]
+        best = max(complete, key=lambda r: (r[2], -r[1]))[0] if complete else None
+        return Response({
+            'columns': ['width', 'length', 'utilization', 'sheets', 'unplaced'],
+            'rows': table,
+            'best': best,
+            'sheetLength': sheet_length,
+            'elapsedMs': round((time.perf_counter() - started) * 1000, 1),
+        })
+
+
+def _overlap_pairs(x, y, w, h, gap: float, eps: float = 1e-6):
+    """同一张板上的冲突对（按 x 排序后的下标 a < b），扫描线实现。
+
+    件按左边界从左到右扫过，活动集只含右边界（含间距）尚未被扫过的件，按 y 有序存放；
+    新件只与活动集中 y 落在 (y - 最大件高 - gap, y + h + gap) 内的件比较，
+    高卷材上同一 x 区间叠着成千上万件时也只看上下邻近的几件。整体 O(n log n + 候选对数)。
+    """
+    n = len(x)
+    order = np.argsort(x, kind='stable')
+    xs, ys, ws, hs = (v[order].tolist() for v in (x, y, w, h))
+    reach = max(hs, default=0.0) + gap - eps
+    active: List[Tuple[float, int]] = []
+    ends: List[Tuple[float, int]] = []
+    found_a: List[int] = []
+    found_b: List[int] = []
+    for j in range(n):
+        xj, yj, hj = xs[j], ys[j], hs[j]
+        # 右边界已在 xj 左侧（含间距）的件之后不会再与任何件冲突
+        while ends and ends[0][0] <= xj:
+            _, i = heapq.heappop(ends)
+            del active[bisect_left(active, (ys[i], i))]
+        lo = bisect_right(active, (yj - reach, n))
+        hi = bisect_left(active, (yj + hj + gap - eps, -1))
+        for yi, i in active[lo:hi]:
+            if yj < yi + hs[i] + gap - eps:
+                found_a.append(i)
+                found_b.append(j)
+        insort(active, (yj, j))
+        heapq.heappush(ends, (xj + ws[j] + gap - eps, j))
+    a = np.array(found_a, dtype=np.int64)
+    b = np.array(found_b, dtype=np.int64)
+    keep = np.lexsort((b, a))
+    return a[keep], b[keep], order
+
+
+class NestingValidateAPIView(APIView):
+    """校验一份排版（如手工拖动后）：找出重叠或间距不足 gap 的件对，以及越过边距的件。"""
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+    MAX_REPORTED = 1000
+
+    def post(self, request):
+        data = request.data
+        try:
+            gap = float(data.get('gap') or 0.0)
+            margin = float(data.get('margin') or 0.0)
+            # 每张板尺寸：优先取排版结果中的 sheets，否则统一用 sheet；卷材 h 为 None 时不查底边
+            sheet = data.get('sheet') or {'width': 1000, 'height': 1000}
+            default_size = (float(sheet.get('width') or 1000), float(sheet['height']) if sheet.get('height') else None)
+            sizes = {int(s['index']): (float(s['w']), float(s['h']) if s.get('h') and data.get('mode') != 'roll' else None)
+                     for s in (data.get('sheets') or [])}
+            rows = [p for p in (data.get('placements') or []) if p.get('placed', True) and p.get('sheet')]
+            ids = [str(p.get('id')) for p in rows]
+            arr = np.array([[int(p['sheet']), float(p['x']), float(p['y']), float(p['w']), float(p['h'])] for p in rows],
+                           dtype=np.float64).reshape(-1, 5)
+        except (KeyError, TypeError, ValueError):
+            return Response({'detail': '排版数据无效，需要 sheet/x/y/w/h'}, status=400)
+        started = time.perf_counter()
+        eps = 1e-6
+        overlaps = []
+        overlap_count = 0
+        margin_rows = []
+        for sheet_no in np.unique(arr[:, 0]).astype(int).tolist():
+            idx = np.flatnonzero(arr[:, 0] == sheet_no)
+            _, x, y, w, h = arr[idx].T
+            sw, sh = sizes.get(sheet_no, default_size)
+            # 边距：四边逐一判断
+            sides = np.stack([x < margin - eps, y < margin - eps, x + w > sw - margin + eps,
+                              (y + h > sh - margin + eps) if sh is not None else np.zeros(len(idx), dtype=bool)], axis=1)
+            for k in np.flatnonzero(sides.any(axis=1)).tolist():
+                margin_rows.append((sheet_no, int(idx[k]), sides[k]))
+            a, b, order = _overlap_pairs(x, y, w, h, gap, eps)
+            overlap_count += len(a)
+            if len(overlaps) < self.MAX_REPORTED and len(a):
+                a, b = order[a], order[b]
+                # 真正相交的为 overlap，只是间距小于 gap 的为 gap
+                dx = np.minimum(x[a] + w[a], x[b] + w[b]) - np.maximum(x[a], x[b])
+                dy = np.minimum(y[a] + h[a], y[b] + h[b]) - np.maximum(y[a], y[b])
+                for i, j, ox, oy in zip(a[:self.MAX_REPORTED].tolist(), b[:self.MAX_REPORTED].tolist(),
+                                        dx[:self.MAX_REPORTED].tolist(), dy[:self.MAX_REPORTED].tolist()):
+                    if len(overlaps) >= self.MAX_REPORTED:
+                        break
+                    overlaps.append({
+                        'sheet': sheet_no, 'a': ids[idx[i]], 'b': ids[idx[j]],
+                        'kind': 'overlap' if ox > eps and oy > eps else 'gap',
+                        'overlapX': round(ox, 3), 'overlapY': round(oy, 3),
+                    })
+        names = ('left', 'top', 'right', 'bottom')
+        margin_violations = [{'sheet': sheet_no, 'id': ids[k], 'sides': [n for n, bad in zip(names, flags) if bad]}
+                             for sheet_no, k, flags in margin_rows[:self.MAX_REPORTED]]
+        return Response({
+            'valid': overlap_count == 0 and not margin_rows,
+            'checked': len(rows),
+            'overlapCount': overlap_count,
+            'marginViolationCount': len(margin_rows),
+            'overlaps': overlaps,
+            'marginViolations': margin_violations,
+            'truncated': overlap_count > len(overlaps) or len(margin_rows) > len(margin_violations),
+            'elapsedMs': round((time.perf_counter() - started) * 1000, 1),
+        })
+
+
+class NestingCutPathAPIView(APIView):
+    """为已有排版（含手工调整后）逐板计算切割顺序：最近邻 + 2-opt，返回每板的切割路径与节省的空走。"""
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        def fail(detail, **extra):
+            raise ValidationError({'detail': detail, **extra})
+
+        cut = parse_cut_options(request.data, fail)
+        placements = request.data.get('placements') or []
+        try:
+            for p in placements:
+                if p.get('placed', True) and p.get('sheet'):
+                    int(p['sheet'])
+                    if not p.get('polygon'):
+                        float(p['x']), float(p['y']), float(p['w']), float(p['h'])
+        except (KeyError, TypeError, ValueError):
+            return Response({'detail': '排版数据无效，需要 sheet/x/y/w/h'}, status=400)
+        return Response(order_cut_paths({'placements': placements}, **cut))
+
+
+class NestingRepackAPIView(APIView):
+    """在现有排版（含手工拖动后的位置）上追加新件：已放件原地不动，新件只填入剩余空间。"""
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def post(self, request):
+        sheet = request.data.get('sheet') or {'width': 1000, 'height': 1000}
+        heuristic = str(request.data.get('heuristic') or 'bssf').lower()
+        if heuristic not in MaxRectsPacker.HEURISTICS:
+            return Response({'detail': '不支持的启发式', 'heuristic': heuristic, 'choices': list(MaxRectsPacker.HEURISTICS)}, status=400)
+        try:
+            gap = float(request.data.get('gap') or 0.0)
+            margin = float(request.data.get('margin') or 0.0)
+            SW = float(sheet.get('width') or 1000)
+            SH = float(sheet.get('height') or 1000)
+            fixed = list(request.data.get('placements') or [])
+            for p in fixed:
+                if p.get('placed', True) and p.get('sheet'):
+                    float(p['x']), float(p['y']), float(p['w']), float(p['h']), int(p['sheet'])
+            sheet_count = int(request.data.get('sheetCount') or 0)
+        except (KeyError, TypeError, ValueError):
+            return Response({'detail': '现有排版数据无效，需要 sheet/x/y/w/h'}, status=400)
+        rects = _build_rects(request.data.get('items') or [])
+        hits = []
+        out = MaxRectsPacker(SW, SH, heuristic=heuristic).repack(fixed, rects, gap=gap, margin=margin, sheet_count=sheet_count,
+                                                                 hits=hits)
+        out['algorithm'] = 'maxrects'
+        resp = Response(out)
+        # hit：已有排版的空闲矩形取自缓存，未重建
+        resp['X-Nesting-Cache'] = 'hit' if all(hits) else 'miss'
+        return resp
+
+
+class NestingPackAPIView(APIView):
+    """同步排版。stream=true 时按 NDJSON 逐板输出（每张板一行，最后一行 type=summary，未放下的件在汇总的 unplaced 里）。
+
+    流式只让客户端更早看到第一张板；服务端内存保持平稳仅限 shelf 算法（不优化、未命中缓存、不选材）——
+    其余算法、优化与选材都要先在内存中排完整个结果，再逐板输出，峰值内存与非流式相同。
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+    renderer_classes = NESTING_RENDERERS
+
+    def post(self, request):
+        # diagnostics：附带分阶段耗时与计数（流式输出不附带）；无论是否开启都计入进程内 metrics
+        with collect() as diag:
+            with phase('parse'):
+                opts = parse_pack_options(request.data)
+            if opts['stream']:
+                resp = StreamingHttpResponse(_ndjson(stream_pack(request.data, opts)), content_type='application/x-ndjson')
+                # 禁止反向代理缓冲，否则前端要等到全部排完才收到第一行
+                resp['X-Accel-Buffering'] = 'no'
+                resp['Cache-Control'] = 'no-cache'
+                return resp
+            count('items', len(request.data.get('items') or []))
+            hits = []
+            job = layout_job(request.user, request.data) if opts['save'] else None
+            out = run_pack(request.data, opts, hits=hits, job=job)
+        metrics.record('nesting.pack', diag)
+        if _wants_diagnostics(request):
+            out['diagnostics'] = diag.as_dict()
+        resp = Response(out)
+        # 全部命中才算 hit；byCategory 下各类目独立命中，命中数另见 X-Nesting-Cache-Hits
+        resp['X-Nesting-Cache'] = 'hit' if hits and all(hits) else 'miss'
+        resp['X-Nesting-Cache-Hits'] = f'{sum(hits)}/{len(hits)}'
+        return resp
+
+
+def _wants_diagnostics(request) -> bool:
+    raw = request.query_params.get('diagnostics') or request.data.get('diagnostics')
+    return str(raw).lower() in ('1', 'true', 'yes')
+
+
+class NestingMetricsAPIView(APIView):
+    """进程内排版 / 矢量化接口的累计耗时与计数（各工作进程独立统计）。"""
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({'pid': os.getpid(), 'endpoints': metrics.snapshot()})
+
+
+def _luminance(px: np.ndarray) -> np.ndarray:
+    # 与逐像素的 0.299*r + 0.587*g + 0.114*b 按相同顺序计算（float64），结果逐位一致
+    return 0.299 * px[..., 0].astype(np.float64) + 0.587 * px[..., 1] + 0.114 * px[..., 2]
+
+
+def _foreground_mask(rgba: np.ndarray, threshold: float, step: int = 1):
+    """按 step 采样的前景掩码：不透明（alpha > 10）且亮度低于 threshold 或与右侧 / 下方相邻像素亮度差至少 13。
+
+    返回 (mask, xs, ys)，mask[i, j] 对应像素 (xs[j], ys[i])。相邻像素取原图中紧邻的像素（不是下一个采样点）。
+    """
+    h, w = rgba.shape[:2]
+    grid = rgba[::step, ::step]
+    lum = _luminance(grid)
+    mask = lum < threshold
+    # 原实现为 abs(int(diff)) > 12，int 向零取整，等价于 |diff| >= 13；
+    # 采样点 x 的右邻 x + 1 恰为切片 1::step（越界的最后一列自然被截掉），下邻同理
+    right = _luminance(rgba[::step, 1::step])
+    n = right.shape[1]
+    mask[:, :n] |= np.abs(right - lum[:, :n]) >= 13
+    down = _luminance(rgba[1::step, ::step])
+    n = down.shape[0]
+    mask[:n] |= np.abs(down - lum[:n]) >= 13
+    mask &= grid[..., 3] > 10
+    return mask, np.arange(0, w, step), np.arange(0, h, step)
 
 
 def _convex_hull(points: List[Tuple[int, int]]):
@@ -146,98 +2638,131 @@ class VectorizePlaceholderAPIView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     parser_classes = [MultiPartParser, FormParser]
 
+    DEFAULT_DPI = 300
+    DEFAULT_TOLERANCE_MM = 0.2
+
     def post(self, request):
-        # 简易矢量化：取非透明/非白背景像素采样点，计算凸包输出 SVG 多边形
+        # 简易矢量化：取非透明/非白背景像素采样点，计算凸包输出 SVG 多边形；
+        # 同时在采样掩码上追踪外轮廓与孔洞，按 tolerance_mm 简化后输出为 SVG path（刀线）
         files = request.FILES.getlist('files') or ([request.FILES.get('file')] if request.FILES.get('file') else [])
         if not files:
             return Response({'detail': '缺少文件'}, status=400)
         threshold = int(request.data.get('threshold') or 240)
         max_side = int(request.data.get('max_side') or 600)
-        results = []
-        for f in files:
-            logs = []
+        try:
+            tolerance_mm = float(request.data.get('tolerance_mm') or self.DEFAULT_TOLERANCE_MM)
+            dpi = float(request.data.get('dpi') or 0)  # 0 表示取图像自带 DPI，没有则按 DEFAULT_DPI
+        except (TypeError, ValueError):
+            return Response({'detail': 'tolerance_mm / dpi 无效'}, status=400)
+        if not (0 < tolerance_mm <= 50) or not (0 <= dpi <= 2400):
+            return Response({'detail': 'tolerance_mm / dpi 超出范围'}, status=400)
+        with collect() as diag:
+            results = [self._vectorize(f, threshold, max_side, tolerance_mm, dpi) for f in files]
+        metrics.record('nesting.vectorize', diag)
+        out = {'results': results}
+        if _wants_diagnostics(request):
+            out['diagnostics'] = diag.as_dict()
+        return Response(out)
+
+    def _vectorize(self, f, threshold: int, max_side: int, tolerance_mm: float, dpi: float) -> Dict:
+        count('files')
+        logs = []
+        with phase('decode'):
             try:
                 raw = f.read()
                 if len(raw) == 0:
-                    results.append({'name': f.name, 'error': '文件为空'})
-                    continue
+                    return {'name': f.name, 'error': '文件为空'}
                 # 基本格式校验
                 ext = (f.name.split('.')[-1] or '').lower()
                 if ext not in {'png','jpg','jpeg','tif','tiff'}:
-                    results.append({'name': f.name, 'error': '不支持的格式', 'ext': ext})
-                    continue
+                    return {'name': f.name, 'error': '不支持的格式', 'ext': ext}
+                count('bytesIn', len(raw))
                 img = Image.open(BytesIO(raw)).convert('RGBA')
                 logs.append({'step':'open','mode': img.mode})
             except Exception:
-                results.append({'name': f.name, 'error': '无法读取图像'})
-                continue
-            w0, h0 = img.size
-            if w0 <= 1 or h0 <= 1 or w0 > 8000 or h0 > 8000:
-                results.append({'name': f.name, 'error': '尺寸异常', 'width': w0, 'height': h0})
-                continue
-            # 缩放到 max_side 以内以加速
-            scale = 1.0
-            if max(w0, h0) > max_side:
-                scale = max_side / max(w0, h0)
+                return {'name': f.name, 'error': '无法读取图像'}
+        w0, h0 = img.size
+        if not dpi:
+            try:
+                dpi = round(float((img.info.get('dpi') or (0,))[0]), 2) or self.DEFAULT_DPI
+            except (TypeError, ValueError):
+                dpi = self.DEFAULT_DPI
+        if w0 <= 1 or h0 <= 1 or w0 > 8000 or h0 > 8000:
+            return {'name': f.name, 'error': '尺寸异常', 'width': w0, 'height': h0}
+        # 缩放到 max_side 以内以加速
+        scale = 1.0
+        if max(w0, h0) > max_side:
+            scale = max_side / max(w0, h0)
+            with phase('resize'):
                 img = img.resize((int(w0*scale), int(h0*scale)))
-            w, h = img.size
-            px = img.load()
-            pts: List[Tuple[int,int]] = []
+        w, h = img.size
+        with phase('scan'):
             step = max(1, int(max(1, max(w,h)) // 300))  # 更细采样
-            # 同时使用透明度、亮度与边缘梯度三种判定
-            def lum(r,g,b):
-                return (0.299*r + 0.587*g + 0.114*b)
-            for y in range(0, h, step):
-                for x in range(0, w, step):
-                    r,g,b,a = px[x,y]
-                    if a <= 10:
-                        continue
-                    L = lum(r,g,b)
-                    edge = 0
-                    if x+1 < w:
-                        r2,g2,b2,a2 = px[x+1,y]
-                        edge = max(edge, abs(int(lum(r2,g2,b2) - L)))
-                    if y+1 < h:
-                        r3,g3,b3,a3 = px[x,y+1]
-                        edge = max(edge, abs(int(lum(r3,g3,b3) - L)))
-                    if L < threshold or edge > 12:
-                        pts.append((x,y))
-            if not pts:
-                # 兜底使用整图
-                pts = [(0,0),(w,0),(w,h),(0,h)]
+            mask, xs, ys = _foreground_mask(np.asarray(img), threshold, step)
+            # 同一行的前景点都落在该行最左、最右两点之间，凸包只需每行的两个端点
+            rows = np.flatnonzero(mask.any(axis=1))
+            sub = mask[rows]
+            left = xs[sub.argmax(axis=1)]
+            right = xs[sub.shape[1] - 1 - sub[:, ::-1].argmax(axis=1)]
+            row_y = ys[rows]
+            wide = right != left  # 只有一个前景点的行不重复加入
+            pts: List[Tuple[int,int]] = list(zip(left.tolist(), row_y.tolist())) + list(zip(right[wide].tolist(), row_y[wide].tolist()))
+            count('pixelsScanned', mask.size)
+            count('foregroundPoints', int(mask.sum()))
+        if not pts:
+            # 兜底使用整图
+            pts = [(0,0),(w,0),(w,h),(0,h)]
+        with phase('hull'):
             hull = _convex_hull(pts)
-            # 还原到原图尺寸
-            inv = 1.0/scale
-            hull_orig = [(round(x*inv,2), round(y*inv,2)) for x,y in hull]
-            # 宽高兜底，避免 0 尺寸
-            minX = min(x for x,_ in hull_orig); minY = min(y for _,y in hull_orig)
-            maxX = max(x for x,_ in hull_orig); maxY = max(y for _,y in hull_orig)
-            if maxX - minX < 1 or maxY - minY < 1:
-                minX, minY, maxX, maxY = 0, 0, w0, h0
-            points_attr = ' '.join([f"{x},{y}" for x,y in hull_orig])
-            svg = f'<svg xmlns="http://www.w3.org/2000/svg" width="{w0}" height="{h0}"><polygon points="{points_attr}" fill="none" stroke="black"/></svg>'
-            bbox = {
-                'minX': minX,
-                'minY': minY,
-                'maxX': maxX,
-                'maxY': maxY,
-            }
-            # 生成独立 SVG（嵌入原图 dataURL，无损PNG）
+        count('hullPoints', len(hull))
+        # 还原到原图尺寸
+        inv = 1.0/scale
+        hull_orig = [(round(x*inv,2), round(y*inv,2)) for x,y in hull]
+        with phase('contour'):
+            # 掩码一格对应原图 step / scale 个像素；容差由 mm 换算为格
+            cell = step * inv
+            tol = tolerance_mm / (25.4 / dpi * cell)
+            contours = [{'hole': c['hole'], 'points': np.round(c['points'] * cell, 2).tolist()}
+                        for c in mask_contours(mask, tol)]
+            contour_d = svg_path([c['points'] for c in contours])
+        count('contours', len(contours))
+        count('contourPoints', sum(len(c['points']) for c in contours))
+        # 宽高兜底，避免 0 尺寸
+        minX = min(x for x,_ in hull_orig); minY = min(y for _,y in hull_orig)
+        maxX = max(x for x,_ in hull_orig); maxY = max(y for _,y in hull_orig)
+        if maxX - minX < 1 or maxY - minY < 1:
+            minX, minY, maxX, maxY = 0, 0, w0, h0
+        points_attr = ' '.join([f"{x},{y}" for x,y in hull_orig])
+        svg = f'<svg xmlns="http://www.w3.org/2000/svg" width="{w0}" height="{h0}"><polygon points="{points_attr}" fill="none" stroke="black"/></svg>'
+        contour_svg = f'<svg xmlns="http://www.w3.org/2000/svg" width="{w0}" height="{h0}"><path d="{contour_d}" fill="none" fill-rule="evenodd" stroke="black"/></svg>'
+        bbox = {
+            'minX': minX,
+            'minY': minY,
+            'maxX': maxX,
+            'maxY': maxY,
+        }
+        # 生成独立 SVG（嵌入原图 dataURL，无损PNG）
+        with phase('encode'):
             buf = BytesIO()
             img_full = Image.open(BytesIO(raw)).convert('RGBA')
             img_full.save(buf, format='PNG', optimize=True)
             data_url = 'data:image/png;base64,' + base64.b64encode(buf.getvalue()).decode('ascii')
-            svg_standalone = f'<svg xmlns="http://www.w3.org/2000/svg" width="{w0}" height="{h0}"><image href="{data_url}" width="{w0}" height="{h0}" preserveAspectRatio="xMidYMid meet"/></svg>'
-            results.append({
-                'name': f.name,
-                'format': 'png' if ext=='png' else ext,
-                'svg': svg,
-                'svgStandalone': svg_standalone,
-                'dataUrl': data_url,
-                'width': w0,
-                'height': h0,
-                'hull': hull_orig,
-                'bbox': bbox,
-                'log': logs,
-            })
-        return Response({'results': results})
+        count('bytesOut', len(data_url))
+        svg_standalone = f'<svg xmlns="http://www.w3.org/2000/svg" width="{w0}" height="{h0}"><image href="{data_url}" width="{w0}" height="{h0}" preserveAspectRatio="xMidYMid meet"/></svg>'
+        return {
+            'name': f.name,
+            'format': 'png' if ext=='png' else ext,
+            'svg': svg,
+            'svgStandalone': svg_standalone,
+            'dataUrl': data_url,
+            'width': w0,
+            'height': h0,
+            'hull': hull_orig,
+            'contours': contours,
+            'contourPath': contour_d,
+            'contourSvg': contour_svg,
+            'dpi': dpi,
+            'toleranceMm': tolerance_mm,
+            'bbox': bbox,
+            'log': logs,
+        }
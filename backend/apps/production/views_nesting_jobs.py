@@ -0,0 +1,62 @@
+from rest_framework import mixins, viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.parsers import JSONParser
+
+from .layouts import load_layout
+from .models import NestingJob
+from .renderers import NESTING_RENDERERS
+from .serializers import NestingJobSerializer
+from .tasks import cancel_nesting_job, submit_nesting_job
+from .views_nesting import parse_pack_options
+
+
+class NestingJobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.ListModelMixin, viewsets.GenericViewSet):
+    """异步排版：提交与 /nesting/pack 相同的参数，返回任务 id；轮询状态与进度，完成后取 result，未完成时可 cancel。
+
+    参数带 save=true（或由合版生成）的任务另存逐板记录，可用 layout 按任务 id 取回。
+    """
+
+    serializer_class = NestingJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+
+    def get_queryset(self):
+        return NestingJob.objects.filter(user=self.request.user).order_by('-created_at')
+
+    def create(self, request, *args, **kwargs):
+        # 参数在提交时同步校验，非法参数直接 400，不进入队列
+        parse_pack_options(request.data)
+        job = NestingJob.objects.create(user=request.user, params=request.data)
+        submit_nesting_job(job)
+        job.refresh_from_db()
+        return Response(NestingJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=True, methods=['post'])
+    def cancel(self, request, pk=None):
+        """撤销排队中或计算中的任务：多起点优化在下一批次前停止，结果不保存。"""
+        job = self.get_object()
+        if not cancel_nesting_job(job):
+            return Response({'detail': '排版任务已结束，无法撤销', 'status': job.status}, status=status.HTTP_409_CONFLICT)
+        job.refresh_from_db()
+        return Response(NestingJobSerializer(job).data)
+
+    @action(detail=True, methods=['get'], renderer_classes=NESTING_RENDERERS)
+    def result(self, request, pk=None):
+        job = self.get_object()
+        if job.status == 'failed':
+            return Response({'detail': '排版任务失败', 'error': job.error}, status=status.HTTP_409_CONFLICT)
+        if job.status == 'cancelled':
+            return Response({'detail': '排版任务已撤销', 'status': job.status}, status=status.HTTP_409_CONFLICT)
+        if job.status != 'succeeded':
+            return Response({'detail': '排版任务尚未完成', 'status': job.status, 'progress': job.progress}, status=status.HTTP_409_CONFLICT)
+        # 合版与同步保存的任务只有逐板记录，没有整体 result
+        return Response(job.result if job.result is not None else load_layout(job))
+
+    @action(detail=True, methods=['get'], renderer_classes=NESTING_RENDERERS)
+    def layout(self, request, pk=None):
+        """已保存的排版（板与件记录），含每件关联的订单项；查询次数固定，与件数无关。"""
+        job = self.get_object()
+        if not job.sheets.exists():
+            return Response({'detail': '该任务没有保存排版'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(load_layout(job))
@@ -0,0 +1,355 @@
+import math
+import os
+import struct
+import tempfile
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageDraw
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.http import StreamingHttpResponse
+from rest_framework import permissions
+from rest_framework.parsers import JSONParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+MM_PER_INCH = 25.4
+# 单个条带 RGB 缓冲的上限；整张板的位图从不整体放进内存
+STRIP_BYTES = 16 * 1024 * 1024
+
+
+class _SourceImages:
+    """按需打开源图的小 LRU 缓存。解码时按输出尺寸缩小（JPEG draft + 整数倍 reduce），高分辨率原图不常驻。"""
+
+    def __init__(self, paths: Dict[str, str], size: int = 6):
+        self.paths = paths
+        self.size = size
+        self._cache: 'OrderedDict[tuple, Image.Image]' = OrderedDict()
+
+    def get(self, item_id: str, target: Tuple[int, int]) -> Optional[Image.Image]:
+        path = self.paths.get(item_id)
+        if not path:
+            return None
+        key = (path, target)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+        with default_storage.open(path, 'rb') as f:
+            img = Image.open(f)
+            img.draft('RGB', target)
+            img = img.convert('RGBA')
+        factor = int(min(img.size[0] / target[0], img.size[1] / target[1]))
+        if factor >= 2:
+            img = img.reduce(factor)
+        self._cache[key] = img
+        if len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return img
+
+
+def _part_transform(p: Dict, item: Dict) -> Tuple[float, float, float, float, float]:
+    """件坐标 → 板坐标：board = R(angle)·p + (tx, ty)，返回 (angle, tx, ty, 件宽, 件高)，单位 mm。"""
+    t = p.get('transform')
+    if t:
+        # polygon 排版直接给出变换；件宽高取自 items
+        return float(t['rotation']), float(t['tx']), float(t['ty']), float(item['w']), float(item['h'])
+    x, y, w, h = float(p['x']), float(p['y']), float(p['w']), float(p['h'])
+    if p.get('rotated'):
+        # 矩形旋转件按顺时针 90° 处理，与 polygon 的 90° 一致
+        return 90.0, x + w, y, h, w
+    return 0.0, x, y, w, h
+
+
+class SheetRenderer:
+    """把一张排好的板按给定 DPI 逐条带合成为 RGB 位图。
+
+    每个条带只处理与之相交的件，源图经仿射变换直接采样到条带坐标，
+    因此内存只与条带大小和源图缓存有关，与板长无关。
+    """
+
+    def __init__(self, sheet: Dict, placements: List[Dict], items: Dict[str, Dict], sources: _SourceImages,
+                 dpi: float, outlines: bool = False):
+        self.dpi = dpi
+        self.px_per_mm = dpi / MM_PER_INCH
+        self.width = max(1, int(round(float(sheet['w']) * self.px_per_mm)))
+        self.height = max(1, int(round(float(sheet['h']) * self.px_per_mm)))
+        self.rows_per_strip = max(1, min(self.height, STRIP_BYTES // (self.width * 3)))
+        self.items = items
+        self.sources = sources
+        self.outlines = outlines
+        parts = []
+        for p in placements:
+            y0 = int(math.floor(float(p['y']) * self.px_per_mm))
+            y1 = int(math.ceil((float(p['y']) + float(p['h'])) * self.px_per_mm))
+            parts.append((y0, y1, p))
+        parts.sort(key=lambda e: e[0])
+        self.parts = parts
+
+    def _draw_part(self, strip: Image.Image, s0: int, p: Dict):
+        key = _item_key(p['id'], self.items)
+        item = self.items.get(key) or {'w': p['w'], 'h': p['h']}
+        m = 1.0 / self.px_per_mm
+        x0 = max(0, int(math.floor(float(p['x']) * self.px_per_mm)))
+        x1 = min(self.width, int(math.ceil((float(p['x']) + float(p['w'])) * self.px_per_mm)))
+        y0 = max(s0, int(math.floor(float(p['y']) * self.px_per_mm)))
+        y1 = min(s0 + strip.size[1], int(math.ceil((float(p['y']) + float(p['h'])) * self.px_per_mm)))
+        if x1 <= x0 or y1 <= y0:
+            return
+        angle, tx, ty, iw, ih = _part_transform(p, item)
+        src = self.sources.get(key, (max(1, round(iw * self.px_per_mm)), max(1, round(ih * self.px_per_mm))))
+        if src is not None:
+            # 输出像素 (u, v) → 板坐标 → 件坐标（逆旋转）→ 源图像素
+            rad = math.radians(angle)
+            c, s = math.cos(rad), math.sin(rad)
+            kx, ky = src.size[0] / iw, src.size[1] / ih
+            X0, Y0 = x0 * m - tx, y0 * m - ty
+            coeffs = (kx * c * m, kx * s * m, kx * (c * X0 + s * Y0),
+                      -ky * s * m, ky * c * m, ky * (-s * X0 + c * Y0))
+            patch = src.transform((x1 - x0, y1 - y0), Image.Transform.AFFINE, coeffs,
+                                  resample=Image.Resampling.BILINEAR, fillcolor=(0, 0, 0, 0))
+            strip.paste(patch, (x0, y0 - s0), patch)
+        if self.outlines:
+            self._outline(strip, s0, p)
+
+    def _outline(self, strip: Image.Image, s0: int, p: Dict):
+        # 裁切参考线：件外框 1 像素黑线
+        k = self.px_per_mm
+        x0, x1 = float(p['x']) * k, (float(p['x']) + float(p['w'])) * k - 1
+        y0, y1 = float(p['y']) * k - s0, (float(p['y']) + float(p['h'])) * k - s0 - 1
+        ImageDraw.Draw(strip).rectangle([x0, y0, x1, y1], outline=(0, 0, 0))
+
+    def strips(self) -> Iterator[bytes]:
+        """逐条带产出原始 RGB 字节（行优先），最后一条可能不足 rows_per_strip 行。"""
+        pending = 0
+        active: List[Tuple[int, int, Dict]] = []
+        for s0 in range(0, self.height, self.rows_per_strip):
+            rows = min(self.rows_per_strip, self.height - s0)
+            s1 = s0 + rows
+            while pending < len(self.parts) and self.parts[pending][0] < s1:
+                active.append(self.parts[pending])
+                pending += 1
+            active = [e for e in active if e[1] > s0]
+            strip = Image.new('RGB', (self.width, rows), (255, 255, 255))
+            for _, _, p in active:
+                self._draw_part(strip, s0, p)
+            yield strip.tobytes()
+
+
+def _item_key(part_id, items: Dict[str, Dict]) -> str:
+    # 排版件 id 为 "{item id}-{序号}"
+    part_id = str(part_id)
+    if part_id in items:
+        return part_id
+    return part_id.rsplit('-', 1)[0]
+
+
+class TiffWriter:
+    """逐条带写出 Deflate 压缩的 RGB TIFF，支持多页；超过 4GB 时使用 BigTIFF。目标文件需可 seek。"""
+
+    def __init__(self, f, big: bool = False):
+        self.f = f
+        self.big = big
+        self.prev_next = None
+        if big:
+            f.write(b'II' + struct.pack('<HHHQ', 43, 8, 0, 0))
+            self.prev_next = 8
+        else:
+            f.write(b'II' + struct.pack('<HI', 42, 0))
+            self.prev_next = 4
+
+    def _align(self):
+        if self.f.tell() % 2:
+            self.f.write(b'\0')
+
+    def add_page(self, width: int, height: int, rows_per_strip: int, strips: Iterator[bytes], dpi: float):
+        offsets, counts = [], []
+        for raw in strips:
+            data = zlib.compress(raw, 6)
+            self._align()
+            offsets.append(self.f.tell())
+            counts.append(len(data))
+            self.f.write(data)
+        long_type, long_fmt = (16, 'Q') if self.big else (4, 'I')
+        bps = struct.pack('<HHH', 8, 8, 8)
+        res = struct.pack('<II', int(round(dpi * 100)), 100)
+        if self.big:
+            # BigTIFF 的值域为 8 字节，不超过 8 字节的值必须内联在目录项中
+            bps_at, res_at = bps, res
+        else:
+            # 外置数据：BitsPerSample、分辨率
+            self._align()
+            bps_at = self.f.tell()
+            self.f.write(bps)
+            self._align()
+            res_at = self.f.tell()
+            self.f.write(res)
+        # 外置数据：条带偏移与长度
+        self._align()
+        off_at = self.f.tell()
+        self.f.write(struct.pack(f'<{len(offsets)}{long_fmt}', *offsets))
+        cnt_at = self.f.tell()
+        self.f.write(struct.pack(f'<{len(counts)}{long_fmt}', *counts))
+        single = len(offsets) == 1
+        entries = [
+            (256, 4, 1, width), (257, 4, 1, height), (258, 3, 3, bps_at), (259, 3, 1, 8), (262, 3, 1, 2),
+            (273, long_type, len(offsets), offsets[0] if single else off_at), (277, 3, 1, 3),
+            (278, 4, 1, rows_per_strip), (279, long_type, len(counts), counts[0] if single else cnt_at),
+            (282, 5, 1, res_at), (283, 5, 1, res_at), (284, 3, 1, 1), (296, 3, 1, 2),
+        ]
+        self._align()
+        ifd_at = self.f.tell()
+        if self.big:
+            self.f.write(struct.pack('<Q', len(entries)))
+            for tag, typ, count, value in entries:
+                packed = value.ljust(8, b'\0') if isinstance(value, bytes) else struct.pack('<Q', value)
+                self.f.write(struct.pack('<HHQ', tag, typ, count) + packed)
+            next_at = self.f.tell()
+            self.f.write(struct.pack('<Q', 0))
+        else:
+            self.f.write(struct.pack('<H', len(entries)))
+            for tag, typ, count, value in entries:
+                # SHORT 值左对齐放在 4 字节值域中
+                packed = struct.pack('<HI', value, 0)[:4] if typ == 3 and count == 1 else struct.pack('<I', value)
+                self.f.write(struct.pack('<HHI', tag, typ, count) + packed)
+            next_at = self.f.tell()
+            self.f.write(struct.pack('<I', 0))
+        end = self.f.tell()
+        # 把上一页（或文件头）的 next 指针指向本页
+        self.f.seek(self.prev_next)
+        self.f.write(struct.pack('<Q' if self.big else '<I', ifd_at))
+        self.f.seek(end)
+        self.prev_next = next_at
+
+
+def pdf_stream(renderers: List[SheetRenderer]) -> Iterator[bytes]:
+    """流式生成 PDF：每张板一页，整页一张 FlateDecode 图像，压缩数据随条带产出，长度用间接对象在流后给出。"""
+    offsets: Dict[int, int] = {}
+    pos = 0
+
+    def emit(chunk: bytes):
+        nonlocal pos
+        pos += len(chunk)
+        return chunk
+
+    def obj(num: int, body: bytes):
+        offsets[num] = pos
+        return emit(b'%d 0 obj\n' % num + body + b'\nendobj\n')
+
+    yield emit(b'%PDF-1.6\n%\xe2\xe3\xcf\xd3\n')
+    kids = b' '.join(b'%d 0 R' % (3 + 4 * i) for i in range(len(renderers)))
+    yield obj(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    yield obj(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(renderers)))
+    for i, r in enumerate(renderers):
+        page, content, image, length = 3 + 4 * i, 4 + 4 * i, 5 + 4 * i, 6 + 4 * i
+        w_pt = r.width / r.dpi * 72.0
+        h_pt = r.height / r.dpi * 72.0
+        # PDF 页面边长上限 14400 单位，长卷材用 UserUnit 放大单位
+        unit = max(1, math.ceil(max(w_pt, h_pt) / 14400.0))
+        w_u, h_u = w_pt / unit, h_pt / unit
+        yield obj(page, (b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.3f %.3f] /UserUnit %d '
+                         b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>') % (w_u, h_u, unit, image, content))
+        ops = b'q %.3f 0 0 %.3f 0 0 cm /Im0 Do Q' % (w_u, h_u)
+        yield obj(content, b'<< /Length %d >>\nstream\n' % len(ops) + ops + b'\nendstream')
+        offsets[image] = pos
+        yield emit(b'%d 0 obj\n<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+                   b'/BitsPerComponent 8 /Filter /FlateDecode /Length %d 0 R >>\nstream\n' % (image, r.width, r.height, length))
+        z = zlib.compressobj(6)
+        size = 0
+        for raw in r.strips():
+            data = z.compress(raw)
+            if data:
+                size += len(data)
+                yield emit(data)
+        data = z.flush()
+        size += len(data)
+        yield emit(data + b'\nendstream\nendobj\n')
+        yield obj(length, b'%d' % size)
+    count = 3 + 4 * len(renderers)
+    xref_at = pos
+    lines = [b'xref\n0 %d\n' % count, b'0000000000 65535 f \n']
+    lines += [b'%010d 00000 n \n' % offsets[n] for n in range(1, count)]
+    yield emit(b''.join(lines) + b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, xref_at))
+
+
+class NestingRenderAPIView(APIView):
+    """把排版结果按生产 DPI 合成为印刷文件：TIFF 写入媒体存储，PDF 直接流式返回（output=storage 时也写入存储）。
+
+    items 给出每个件的源图（上传接口返回的 /media/ 地址），逐条带合成，内存与板长无关。
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [JSONParser]
+    MAX_DPI = 1440
+
+    def post(self, request):
+        data = request.data
+        fmt = str(data.get('format') or 'pdf').lower()
+        if fmt not in ('pdf', 'tiff'):
+            return Response({'detail': '不支持的输出格式', 'choices': ['pdf', 'tiff']}, status=400)
+        try:
+            dpi = float(data.get('dpi') or 150)
+            wanted = [int(n) for n in data['sheetIndexes']] if data.get('sheetIndexes') else None
+            sheets = {int(s['index']): s for s in (data.get('sheets') or [])}
+            placements = [p for p in (data.get('placements') or []) if p.get('placed', True) and p.get('sheet')]
+            for p in placements:
+                float(p['x']), float(p['y']), float(p['w']), float(p['h']), int(p['sheet'])
+            items = {str(it['id']): it for it in (data.get('items') or [])}
+        except (KeyError, TypeError, ValueError):
+            return Response({'detail': '排版数据无效，需要 sheets 与 placements（sheet/x/y/w/h）'}, status=400)
+        if not 1 <= dpi <= self.MAX_DPI:
+            return Response({'detail': 'dpi 超出范围', 'max': self.MAX_DPI}, status=400)
+        indexes = sorted(wanted or sheets)
+        missing_sheets = [i for i in indexes if i not in sheets or not sheets[i].get('h')]
+        if not indexes or missing_sheets:
+            return Response({'detail': '缺少板尺寸', 'sheets': missing_sheets}, status=400)
+
+        # 源图只接受本站媒体存储中的文件
+        paths, missing = {}, []
+        for item_id, it in items.items():
+            ref = str(it.get('image') or '')
+            if not ref:
+                continue
+            name = ref[len(settings.MEDIA_URL):] if ref.startswith(settings.MEDIA_URL) else ref
+            if '://' in name or '..' in name.split('/') or os.path.isabs(name) or not default_storage.exists(name):
+                missing.append(item_id)
+            else:
+                paths[item_id] = name
+        if missing:
+            return Response({'detail': '源图不存在', 'items': missing}, status=400)
+
+        sources = _SourceImages(paths)
+        outlines = bool(data.get('outlines', False))
+        renderers = [
+            SheetRenderer(sheets[i], [p for p in placements if int(p['sheet']) == i], items, sources, dpi, outlines=outlines)
+            for i in indexes
+        ]
+        if fmt == 'pdf' and data.get('output') != 'storage':
+            resp = StreamingHttpResponse(pdf_stream(renderers), content_type='application/pdf')
+            resp['Content-Disposition'] = 'attachment; filename="nesting.pdf"'
+            return resp
+
+        with tempfile.TemporaryFile() as tmp:
+            if fmt == 'pdf':
+                for chunk in pdf_stream(renderers):
+                    tmp.write(chunk)
+            else:
+                # 未压缩大小接近 4GB 时改用 BigTIFF（压缩后大小事先未知）
+                raw_size = sum(r.width * r.height * 3 for r in renderers)
+                writer = TiffWriter(tmp, big=raw_size > 0xF0000000)
+                for r in renderers:
+                    writer.add_page(r.width, r.height, r.rows_per_strip, r.strips(), dpi)
+            tmp.seek(0)
+            ext = 'pdf' if fmt == 'pdf' else 'tif'
+            name = default_storage.save(
+                os.path.join('nesting', 'renders', datetime.now().strftime('%Y%m'), f'{uuid.uuid4().hex}.{ext}'), File(tmp))
+        return Response({
+            'url': settings.MEDIA_URL + name.replace('\\', '/'),
+            'name': name, 'size': default_storage.size(name), 'format': fmt, 'dpi': dpi,
+            'sheets': [{'index': i, 'width': r.width, 'height': r.height} for i, r in zip(indexes, renderers)],
+        })
@@ -0,0 +1,45 @@
+from urllib.parse import parse_qs
+
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+
+
+@database_sync_to_async
+def _token_user(key: str):
+    from rest_framework.authtoken.models import Token
+    try:
+        token = Token.objects.select_related('user').get(key=key)
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+def _scope_token(scope) -> str:
+    # 浏览器的 WebSocket 无法自定义请求头，SPA 通过 ?token= 传递；其他客户端也可用 Authorization: Token <key>
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin-1').split()
+            if len(parts) == 2 and parts[0].lower() == 'token':
+                return parts[1]
+    qs = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return (qs.get('token') or [''])[0]
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """与 DRF TokenAuthentication 一致的 WebSocket 认证。
+
+    放在 AuthMiddlewareStack 内侧：带令牌时以令牌用户覆盖 scope['user']（无效令牌按匿名处理），
+    不带令牌时保留会话用户。
+    """
+
+    async def __call__(self, scope, receive, send):
+        key = _scope_token(scope)
+        if key:
+            scope = dict(scope, user=await _token_user(key) or AnonymousUser())
+        return await super().__call__(scope, receive, send)
+
+
+def TokenAuthMiddlewareStack(inner):
+    return AuthMiddlewareStack(TokenAuthMiddleware(inner))
@@ -73,6 +73,47 @@ export const checkOut = (payload?: any) => api.post('/auth/attendance/checkout',
 
 // 拼版与矢量化
 export const packNesting = (payload: any) => api.post('/nesting/pack', payload)
+// 流式拼版：服务端逐板返回 NDJSON，每解析出一行调用一次 onRecord，最后一行 type=summary
+export const packNestingStream = async (payload: any, onRecord: (record: any) => void) => {
+  const token = localStorage.getItem('token')
+  const res = await fetch(`${api.defaults.baseURL}/nesting/pack`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', ...(token ? { Authorization: `Token ${token}` } : {}) },
+    body: JSON.stringify({ ...payload, stream: true }),
+  })
+  if (!res.ok || !res.body) {
+    const data = await res.json().catch(() => ({}))
+    throw { response: { status: res.status, data } }
+  }
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buf = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    buf += decoder.decode(value || new Uint8Array(), { stream: !done })
+    let nl = buf.indexOf('\n')
+    while (nl >= 0) {
+      const line = buf.slice(0, nl).trim()
+      buf = buf.slice(nl + 1)
+      if (line) onRecord(JSON.parse(line))
+      nl = buf.indexOf('\n')
+    }
+    if (done) break
+  }
+}
+// 异步排版任务：提交后通过 WebSocket 订阅进度（浏览器 WebSocket 不能带请求头，令牌放在查询参数里）
+export const submitNestingJob = (payload: any) => api.post('/nesting/jobs/', payload)
+export const getNestingJobResult = (id: string) => api.get(`/nesting/jobs/${id}/result/`)
+export const cancelNestingJob = (id: string) => api.post(`/nesting/jobs/${id}/cancel/`)
+export const subscribeNestingJob = (id: string, onMessage: (msg: any) => void) => {
+  const token = localStorage.getItem('token')
+  const base = new URL(api.defaults.baseURL as string, window.location.href)
+  const scheme = base.protocol === 'https:' ? 'wss:' : 'ws:'
+  const qs = token ? `?token=${encodeURIComponent(token)}` : ''
+  const ws = new WebSocket(`${scheme}//${base.host}/ws/nesting/jobs/${id}/${qs}`)
+  ws.onmessage = (ev) => onMessage(JSON.parse(ev.data))
+  return ws
+}
 export const vectorizeFiles = (formData: FormData) => api.post('/nesting/vectorize', formData, { headers: { 'Content-Type': 'multipart/form-data' } })
 
 export default api